@@ -0,0 +1,342 @@
+"""
+Jobs de prédiction asynchrones pour les gros lots d'images.
+
+La soumission stocke les images dans une file SQLite locale et renvoie immédiatement un identifiant.
+Un pool de workers traite les images par batches (une requête multi-images par batch au service
+d'inférence, qui la regroupe avec les autres en passes avant communes), enregistre les résultats en une requête groupée au data-service
+et publie la progression. Les jobs non terminés reprennent au redémarrage de la passerelle.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import sqlite3
+import threading
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "16"))
+# Délai par appel (un batch d'images ou un enregistrement groupé), pas pour le job entier
+JOB_HTTP_TIMEOUT = float(os.getenv("JOB_HTTP_TIMEOUT", "60"))
+JOB_EVENTS_INTERVAL = float(os.getenv("JOB_EVENTS_INTERVAL", "0.5"))
+# Taille maximale d'un job (nombre d'images et octets cumulés) : les images sont stockées dans SQLite
+JOB_MAX_FILES = int(os.getenv("JOB_MAX_FILES", "1000"))
+JOB_MAX_BYTES = int(os.getenv("JOB_MAX_BYTES", str(512 * 1024 * 1024)))
+# Nouvelles tentatives d'un batch refusé par le contrôle d'admission du service d'inférence
+JOB_MAX_RETRIES = int(os.getenv("JOB_MAX_RETRIES", "10"))
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    version TEXT,
+    save INTEGER NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    filename TEXT,
+    content_type TEXT,
+    image BLOB,
+    status TEXT NOT NULL DEFAULT 'pending',
+    result TEXT,
+    PRIMARY KEY (job_id, position)
+);
+"""
+
+
+def failed(item, error):
+    return item["position"], "failed", {"filename": item["filename"], "error": error}
+
+
+class JobStore:
+    """
+    File persistante des jobs et de leurs images (SQLite, une connexion protégée par un verrou).
+    """
+
+    def __init__(self, path=JOBS_DB_PATH):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+
+    def create(self, files, version=None, save=True):
+        """
+        Enregistre un job et ses images ; `files` est une liste de (filename, content_type, contenu).
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO jobs (id, status, total, version, save, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, len(files), version, int(save), now, now),
+            )
+            self.conn.executemany(
+                "INSERT INTO job_items (job_id, position, filename, content_type, image) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, position, name, content_type, content)
+                 for position, (name, content_type, content) in enumerate(files)],
+            )
+        return job_id
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["save"] = bool(job["save"])
+        return job
+
+    def set_status(self, job_id, status, from_statuses, error=None):
+        """
+        Transition d'état conditionnelle ; renvoie False si le job n'était dans aucun des états attendus.
+        """
+        placeholders = ",".join("?" * len(from_statuses))
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                f"UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ? AND status IN ({placeholders})",
+                (status, error, time.time(), job_id, *from_statuses),
+            )
+        return cursor.rowcount > 0
+
+    def pending(self, job_id, limit):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT position, filename, content_type, image FROM job_items "
+                "WHERE job_id = ? AND status = 'pending' ORDER BY position LIMIT ?",
+                (job_id, limit),
+            ).fetchall()
+
+    def record(self, job_id, results):
+        """
+        Stocke les résultats d'un batch, libère les images traitées et met à jour la progression.
+        `results` est une liste de (position, "done" | "failed", dict).
+        """
+        done = sum(1 for _, status, _ in results if status == "done")
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE job_items SET status = ?, result = ?, image = NULL WHERE job_id = ? AND position = ?",
+                [(status, json.dumps(result), job_id, position) for position, status, result in results],
+            )
+            self.conn.execute(
+                "UPDATE jobs SET done = done + ?, failed = failed + ?, updated_at = ? WHERE id = ?",
+                (done, len(results) - done, time.time(), job_id),
+            )
+
+    def update_results(self, job_id, results):
+        """
+        Réécrit les résultats d'images déjà enregistrées (identifiants data-service après la sauvegarde).
+        """
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE job_items SET result = ? WHERE job_id = ? AND position = ?",
+                [(json.dumps(result), job_id, position) for position, _, result in results],
+            )
+
+    def results(self, job_id, after=-1, limit=500):
+        """
+        Résultats déjà disponibles après la position `after`, dans l'ordre de soumission.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT position, status, result FROM job_items "
+                "WHERE job_id = ? AND position > ? AND status != 'pending' ORDER BY position LIMIT ?",
+                (job_id, after, limit),
+            ).fetchall()
+        return [dict(position=row["position"], status=row["status"], **json.loads(row["result"])) for row in rows]
+
+    def requeue_unfinished(self):
+        """
+        Jobs interrompus par un arrêt de la passerelle : repassés en file, dans l'ordre de soumission.
+        """
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+            rows = self.conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at").fetchall()
+        return [row["id"] for row in rows]
+
+
+class JobManager:
+    """
+    Pool de workers asyncio consommant la file des jobs.
+    """
+
+    def __init__(self, inference_url, data_url, workers=JOB_WORKERS, batch_size=JOB_BATCH_SIZE):
+        self.inference_url = inference_url
+        self.data_url = data_url
+        self.workers = workers
+        self.batch_size = batch_size
+        self.store = None
+        self._queue = None
+        self._client = None
+        self._tasks = []
+
+    async def start(self):
+        self.store = JobStore()
+        self._queue = asyncio.Queue()
+        for job_id in self.store.requeue_unfinished():
+            self._queue.put_nowait(job_id)
+        if self._queue.qsize():
+            logger.info(f"{self._queue.qsize()} job(s) repris après redémarrage")
+        self._client = httpx.AsyncClient(timeout=JOB_HTTP_TIMEOUT)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+
+    async def submit(self, files, version=None, save=True):
+        job_id = await asyncio.to_thread(self.store.create, files, version, save)
+        await self._queue.put(job_id)
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def cancel(self, job_id):
+        """
+        Annulation prise en compte entre deux batches ; les résultats déjà obtenus sont conservés.
+        """
+        return await asyncio.to_thread(self.store.set_status, job_id, "cancelled", ("queued", "running"))
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Job {job_id} en échec: {str(e)}", exc_info=True)
+                await asyncio.to_thread(self.store.set_status, job_id, "failed", ("running",), str(e))
+
+    async def _run(self, job_id):
+        if not await asyncio.to_thread(self.store.set_status, job_id, "running", ("queued",)):
+            return  # annulé avant son démarrage
+        job = await asyncio.to_thread(self.store.get, job_id)
+        while True:
+            items = await asyncio.to_thread(self.store.pending, job_id, self.batch_size)
+            if not items:
+                break
+            results = await self._predict(job, items)
+            if job["save"]:
+                # Images marquées traitées avant la sauvegarde : un job repris après un arrêt ne renvoie
+                # jamais au data-service un batch déjà enregistré (pas de doublons). Un arrêt entre les deux
+                # laisse ce marqueur dans les résultats au lieu d'un saved_id.
+                for _, status, result in results:
+                    if status == "done":
+                        result["save_error"] = "Enregistrement interrompu"
+            await asyncio.to_thread(self.store.record, job_id, results)
+            if job["save"]:
+                await self._save(results)
+                await asyncio.to_thread(self.store.update_results, job_id, results)
+            if (await asyncio.to_thread(self.store.get, job_id))["status"] == "cancelled":
+                logger.info(f"Job {job_id} annulé")
+                return
+        await asyncio.to_thread(self.store.set_status, job_id, "completed", ("running",))
+
+    async def _predict(self, job, items):
+        """
+        Un batch en une requête /inference/predict/batch : une seule entrée dans la file du service
+        d'inférence au lieu d'une requête (lecture, admission, mise en file) par image.
+        """
+        # Priorité "batch" : en cas de saturation, le service d'inférence refuse ces requêtes (429 / 503)
+        # avant les requêtes interactives ; elles sont alors réessayées après le délai Retry-After
+        for attempt in range(JOB_MAX_RETRIES + 1):
+            try:
+                response = await self._client.post(
+                    f"{self.inference_url}/inference/predict/batch",
+                    files=[("files", (item["filename"], item["image"], item["content_type"])) for item in items],
+                    params={"version": job["version"]} if job["version"] else None,
+                    # Même budget que le délai client : le batch n'est pas traité s'il a trop attendu en file
+                    headers={"X-Request-Timeout-Ms": str(int(JOB_HTTP_TIMEOUT * 1000)), "X-Priority": "batch"},
+                )
+            except httpx.HTTPError as e:
+                return [failed(item, f"{type(e).__name__}: {e}") for item in items]
+            if response.status_code not in (429, 503) or attempt == JOB_MAX_RETRIES:
+                break
+            await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+        if response.status_code != 200:
+            return [failed(item, f"{response.status_code}: {response.text[:200]}") for item in items]
+        body = response.json()
+        predictions = body["predictions"]
+        if len(predictions) != len(items):
+            # Réponse incomplète : sans ce contrôle, les images sans prédiction resteraient en attente
+            # et seraient renvoyées à chaque tour
+            logger.warning(f"{len(predictions)} prédictions reçues pour {len(items)} images")
+            predictions = predictions[:len(items)]
+            predictions += [{"error": "Prédiction absente de la réponse du service d'inférence"}] * (len(items) - len(predictions))
+        results = []
+        for item, prediction in zip(items, predictions):
+            if "error" in prediction:
+                results.append(failed(item, prediction["error"]))
+            else:
+                results.append((item["position"], "done", {"filename": item["filename"], **prediction,
+                                                           "model_version": body["model_version"]}))
+        return results
+
+    async def _save(self, results):
+        """
+        Enregistrement groupé des prédictions réussies du batch (une requête au data-service).
+        """
+        succeeded = [result for _, status, result in results if status == "done"]
+        if not succeeded:
+            return
+        rows = [{"prediction": r["prediction"], "confidence": r["confidence"], "filename": r["filename"]}
+                for r in succeeded]
+        try:
+            response = await self._client.post(f"{self.data_url}/predictions/bulk", json=rows)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            for result in succeeded:
+                result["save_error"] = str(e)
+            return
+        for result, saved in zip(succeeded, response.json()):
+            result.pop("save_error", None)
+            result["saved_id"] = saved["id"]
+
+    async def events(self, job_id):
+        """
+        Flux SSE : un événement `progress` à chaque changement, jusqu'à l'état final.
+        """
+        last = None
+        while True:
+            job = await asyncio.to_thread(self.store.get, job_id)
+            if job != last:
+                yield f"event: progress\ndata: {json.dumps(job)}\n\n"
+                last = job
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(JOB_EVENTS_INTERVAL)
+
+    async def results(self, job_id, follow=False):
+        """
+        Résultats en NDJSON, une ligne par image ; avec `follow`, attend les batches suivants jusqu'à la fin du job.
+        """
+        after = -1
+        while True:
+            # État lu avant les résultats : un job terminé n'a plus de résultats à venir après cette lecture
+            finished = (await asyncio.to_thread(self.store.get, job_id))["status"] in TERMINAL_STATUSES
+            rows = await asyncio.to_thread(self.store.results, job_id, after)
+            for row in rows:
+                yield json.dumps(row) + "\n"
+            if rows:
+                after = rows[-1]["position"]
+                continue
+            if not follow or finished:
+                return
+            await asyncio.sleep(JOB_EVENTS_INTERVAL)
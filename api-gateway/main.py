@@ -1,12 +1,20 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from prometheus_client import Counter, generate_latest, CONTENT_TYPE_LATEST
+from typing import List, Optional
+import asyncio
 import httpx
 import os
+import time
 from dotenv import load_dotenv
+from service_common import responses
+
+from jobs import JobManager, JOB_MAX_FILES, JOB_MAX_BYTES
 
 load_dotenv()
 
-app = FastAPI(title="API Gateway - Cancer Detection System")
+app = FastAPI(title="API Gateway - Cancer Detection System", default_response_class=responses.DefaultJSONResponse)
 
 # CORS
 app.add_middleware(
@@ -17,6 +25,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compression gzip / zstd des réponses volumineuses (historique des prédictions)
+responses.install(app)
+
 # URLs des services
 def get_service_url(env_var, default):
     url = os.getenv(env_var, default)
@@ -32,11 +43,79 @@ DATA_SERVICE_URL = get_service_url("DATA_SERVICE_URL", "http://data-service:8002
 # Config httpx
 HTTPX_TIMEOUT = 60.0
 
+# Échéances : budget restant (ms) transmis au service d'inférence, réduit si le client annonce le sien
+TIMEOUT_HEADER = "X-Request-Timeout-Ms"
+DISCONNECT_POLL_SECONDS = 0.25
+
+UPSTREAM_CANCELLED = Counter("gateway_upstream_cancelled_total",
+                             "Appels amont interrompus (client déconnecté ou échéance dépassée)",
+                             ["endpoint", "reason"])
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+def request_deadline(request):
+    """
+    Échéance locale de la requête : HTTPX_TIMEOUT, ou le budget X-Request-Timeout-Ms du client s'il est plus court.
+    """
+    budget = HTTPX_TIMEOUT
+    try:
+        budget = min(budget, float(request.headers[TIMEOUT_HEADER]) / 1000)
+    except (KeyError, ValueError):
+        pass
+    return time.monotonic() + budget
+
+
+def remaining(deadline, endpoint):
+    """
+    Temps restant avant l'échéance ; 504 sans appel amont s'il est déjà écoulé.
+    """
+    left = deadline - time.monotonic()
+    if left <= 0:
+        UPSTREAM_CANCELLED.labels(endpoint, "deadline").inc()
+        raise HTTPException(status_code=504, detail="Échéance de la requête dépassée")
+    return left
+
+
+async def until_disconnect(request, endpoint, coro):
+    """
+    Attend l'appel amont en surveillant le client : s'il se déconnecte, l'appel est annulé
+    (connexion fermée, le service amont abandonne la requête avant la passe avant).
+    """
+    task = asyncio.ensure_future(coro)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            task.cancel()
+            UPSTREAM_CANCELLED.labels(endpoint, "disconnected").inc()
+            raise ClientDisconnected()
+
+# Jobs asynchrones (gros lots) : pas limités par HTTPX_TIMEOUT
+job_manager = JobManager(INFERENCE_SERVICE_URL, DATA_SERVICE_URL)
+
+
+@app.on_event("startup")
+async def start_jobs():
+    await job_manager.start()
+
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    await job_manager.stop()
+
 # Health checks
 @app.get("/health")
 async def health():
     return {"status": "La passerelle API est en cours d'exécution"}
 
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 # ===== AUTH SERVICE ROUTES =====
 @app.post("/api/auth/register")
 async def register(request: dict):
@@ -67,15 +146,35 @@ async def verify_token(token: str):
 
 # ===== INFERENCE SERVICE ROUTES =====
 @app.post("/api/inference/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(request: Request, file: UploadFile = File(...), version: Optional[str] = None, tta: bool = False):
+    deadline = request_deadline(request)
     # Lire le contenu du fichier
     file_content = await file.read()
-    
-    async with httpx.AsyncClient(timeout=HTTPX_TIMEOUT) as client:
-        response = await client.post(
-            f"{INFERENCE_SERVICE_URL}/inference/predict",
-            files={"file": (file.filename, file_content, file.content_type)}
-        )
+    left = remaining(deadline, "predict")
+
+    async with httpx.AsyncClient(timeout=left) as client:
+        try:
+            response = await until_disconnect(request, "predict", client.post(
+                f"{INFERENCE_SERVICE_URL}/inference/predict",
+                files={"file": (file.filename, file_content, file.content_type)},
+                # Version de modèle épinglée et mode TTA transmis au service d'inférence
+                params={k: v for k, v in {"version": version, "tta": "true" if tta else None}.items() if v} or None,
+                headers={TIMEOUT_HEADER: str(int(left * 1000))},
+            ))
+        except ClientDisconnected:
+            return Response(status_code=499)
+        except httpx.TimeoutException:
+            UPSTREAM_CANCELLED.labels("predict", "deadline").inc()
+            raise HTTPException(status_code=504, detail="Échéance de la requête dépassée")
+        if response.status_code != 200:
+            # Refus du contrôle d'admission (429 / 503), échéance (504)... : statut et Retry-After
+            # transmis au client pour qu'il puisse ralentir au lieu de recevoir un 200
+            retry_after = response.headers.get("Retry-After")
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Erreur lors de la prédiction: {response.text}",
+                headers={"Retry-After": retry_after} if retry_after else None,
+            )
         return response.json()
 
 # ===== DATA SERVICE ROUTES - CRUD PREDICTIONS =====
@@ -98,7 +197,9 @@ async def get_predictions(skip: int = 0, limit: int = 100):
             f"{DATA_SERVICE_URL}/predictions/",
             params={"skip": skip, "limit": limit}
         )
-        return response.json()
+        # Corps JSON relayé tel quel : pas de décodage / réencodage des listes volumineuses
+        return Response(content=response.content, status_code=response.status_code,
+                        media_type=response.headers.get("content-type", "application/json"))
 
 # READ ONE
 @app.get("/api/predictions/{prediction_id}")
@@ -139,22 +240,25 @@ async def get_stats():
 
 # ===== COMBINED WORKFLOW =====
 @app.post("/api/workflow/predict-and-save")
-async def predict_and_save(file: UploadFile = File(...)):
+async def predict_and_save(request: Request, file: UploadFile = File(...)):
     """
     Workflow complet:
     1. Prédire avec le modèle
     2. Sauvegarder dans la base de données
     """
+    deadline = request_deadline(request)
     # Lire le contenu du fichier en bytes
     file_content = await file.read()
     
     try:
-        # Étape 1: Prédiction
-        async with httpx.AsyncClient(timeout=HTTPX_TIMEOUT) as client:
-            predict_response = await client.post(
+        # Étape 1: Prédiction (abandonnée si le client se déconnecte, budget restant transmis)
+        left = remaining(deadline, "workflow")
+        async with httpx.AsyncClient(timeout=left) as client:
+            predict_response = await until_disconnect(request, "workflow", client.post(
                 f"{INFERENCE_SERVICE_URL}/inference/predict",
-                files={"file": (file.filename, file_content, file.content_type)}
-            )
+                files={"file": (file.filename, file_content, file.content_type)},
+                headers={TIMEOUT_HEADER: str(int(left * 1000))},
+            ))
             
             if predict_response.status_code != 200:
                 raise HTTPException(
@@ -171,7 +275,7 @@ async def predict_and_save(file: UploadFile = File(...)):
             "filename": file.filename
         }
         
-        async with httpx.AsyncClient(timeout=HTTPX_TIMEOUT) as client:
+        async with httpx.AsyncClient(timeout=remaining(deadline, "workflow")) as client:
             save_response = await client.post(
                 f"{DATA_SERVICE_URL}/predictions/",
                 json=save_data
@@ -188,7 +292,64 @@ async def predict_and_save(file: UploadFile = File(...)):
             "saved_record": save_response.json()
         }
         
-    except httpx.ReadTimeout:
-        return {"error": "Délai d'attente dépassé (timeout 60s) lors de l'appel aux microservices"}
+    except HTTPException:
+        # Erreurs des microservices et échéance dépassée : statut transmis tel quel
+        raise
+    except ClientDisconnected:
+        return Response(status_code=499)
+    except httpx.TimeoutException:
+        UPSTREAM_CANCELLED.labels("workflow", "deadline").inc()
+        raise HTTPException(status_code=504, detail="Délai d'attente dépassé lors de l'appel aux microservices")
     except Exception as e:
         return {"error": f"Erreur inattendue dans la passerelle: {str(e)}"}
+
+
+# ===== ASYNC JOBS - GROS LOTS =====
+async def get_job_or_404(job_id):
+    # SQLite est synchrone : lecture dans un thread pour ne pas bloquer la boucle d'événements
+    job = await asyncio.to_thread(job_manager.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job non trouvé")
+    return job
+
+# SUBMIT
+@app.post("/api/jobs", status_code=202)
+async def submit_job(files: List[UploadFile] = File(...), version: Optional[str] = None, save: bool = True):
+    """
+    Soumet un lot d'images : réponse immédiate avec l'identifiant du job,
+    traitement en arrière-plan par batches (prédiction puis sauvegarde groupée si `save`).
+    """
+    # Contrôlé avant toute lecture : les fichiers sont encore dans les tampons du parseur multipart
+    if len(files) > JOB_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"Job de {len(files)} images, maximum {JOB_MAX_FILES}")
+    total_bytes = sum(file.size or 0 for file in files)
+    if total_bytes > JOB_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Job de {total_bytes} octets, maximum {JOB_MAX_BYTES}")
+    contents = [(file.filename, file.content_type, await file.read()) for file in files]
+    return await job_manager.submit(contents, version=version, save=save)
+
+# POLL
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    return await get_job_or_404(job_id)
+
+# PROGRESS (Server-Sent Events)
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    await get_job_or_404(job_id)
+    return StreamingResponse(job_manager.events(job_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+# RESULTS (NDJSON, une ligne par image)
+@app.get("/api/jobs/{job_id}/results")
+async def job_results(job_id: str, follow: bool = False):
+    await get_job_or_404(job_id)
+    return StreamingResponse(job_manager.results(job_id, follow=follow), media_type="application/x-ndjson")
+
+# CANCEL
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = await get_job_or_404(job_id)
+    if not await job_manager.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job déjà terminé ({job['status']})")
+    return await asyncio.to_thread(job_manager.store.get, job_id)
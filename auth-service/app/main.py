@@ -3,8 +3,12 @@ from sqlalchemy.exc import SQLAlchemyError
 from .database import Base, engine, get_db
 from .routes import auth
 
-Base.metadata.create_all(bind=engine)
-
 app = FastAPI(title="Auth Service")
 
 app.include_router(auth.router)
+
+
+# Créer les tables au démarrage et non à l'import : l'import du module ne touche pas la base
+@app.on_event("startup")
+def create_tables():
+    Base.metadata.create_all(bind=engine)
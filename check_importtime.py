@@ -0,0 +1,82 @@
+"""
+Contrôle de régression du temps d'import de chaque service (python -X importtime), utilisable en CI.
+
+Importe le module de l'application de chaque service dans un processus neuf, affiche les imports
+les plus coûteux et échoue (code 1) si le budget est dépassé ou si un module lourd interdit
+(TensorFlow pour le service d'inférence) est importé au chargement de l'application.
+
+    python check_importtime.py
+    python check_importtime.py inference-service --budget-ms 1500
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Module importé par uvicorn, budget (ms) et modules qui ne doivent être importés que plus tard
+SERVICES = {
+    "api-gateway": {"module": "main", "budget_ms": 1500, "forbidden": []},
+    "auth-service": {"module": "app.main", "budget_ms": 2000, "forbidden": []},
+    "data-service": {"module": "app.main", "budget_ms": 2000, "forbidden": []},
+    "inference-service": {"module": "app.main", "budget_ms": 2000, "forbidden": ["tensorflow", "keras", "PIL"]},
+}
+
+
+def parse_importtime(stderr):
+    """
+    Lignes "import time: self [us] | cumulative | imported package" -> liste (module, self_us, cumulative_us).
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # L'indentation du nom (après l'espace séparateur) donne la profondeur d'imbrication
+        imports.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def check(service, budget_ms=None, top=10):
+    config = SERVICES[service]
+    budget_ms = budget_ms or config["budget_ms"]
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    # Pas de base réelle nécessaire : les moteurs SQLAlchemy ne se connectent qu'à la première requête
+    env.setdefault("DATABASE_URL", "sqlite://")
+    # Code partagé (common/), installé dans les images : importable sans installation locale
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.join(ROOT, "common"), env.get("PYTHONPATH")]))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {config['module']}"],
+        cwd=os.path.join(ROOT, service), env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        print(f"[{service}] échec de l'import de {config['module']}:\n{result.stderr.splitlines()[-1]}")
+        return False
+
+    imports = parse_importtime(result.stderr)
+    # Modules de premier niveau (sans indentation) : leur cumul couvre tout l'import
+    total_ms = sum(cumulative for name, _, cumulative in imports if not name.startswith(" ")) / 1000
+    top_level = {name.strip().split(".")[0] for name, _, _ in imports}
+    forbidden = [module for module in config["forbidden"] if module in top_level]
+
+    ok = total_ms <= budget_ms and not forbidden
+    print(f"[{service}] import {config['module']} : {total_ms:.0f} ms (budget {budget_ms} ms) "
+          f"{'OK' if ok else 'ÉCHEC'}")
+    for name, _, cumulative in sorted(imports, key=lambda i: i[2], reverse=True)[:top]:
+        print(f"    {cumulative / 1000:8.1f} ms  {name.strip()}")
+    if forbidden:
+        print(f"    modules importés trop tôt : {', '.join(forbidden)}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Régression du temps d'import des services (python -X importtime)")
+    parser.add_argument("services", nargs="*", default=list(SERVICES), choices=list(SERVICES),
+                        help="Services à contrôler (défaut : tous)")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Budget commun remplaçant celui de chaque service")
+    parser.add_argument("--top", type=int, default=10, help="Nombre d'imports les plus coûteux affichés")
+    args = parser.parse_args()
+
+    results = [check(service, args.budget_ms, args.top) for service in args.services]
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,3 @@
+"""
+Code partagé par les services Python (installé dans chaque image au build, voir common/README.md).
+"""
@@ -0,0 +1,108 @@
+"""
+Réponses JSON rapides (orjson, optionnel) et compression gzip / zstd des réponses volumineuses.
+"""
+import os
+import gzip
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# FAST_JSON=1 : sérialisation orjson (si installé) au lieu de l'encodeur json de la bibliothèque standard
+FAST_JSON = os.getenv("FAST_JSON", "0") == "1" and orjson is not None
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "1") == "1"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))
+
+# Options orjson des réponses : OPT_UTC_Z écrit les datetime UTC avec "Z", comme la sérialisation
+# JSON de pydantic du chemin par défaut (orjson seul écrirait "+00:00") ; même format sur les deux chemins
+ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z) if orjson is not None else 0
+
+
+class FastJSONResponse(ORJSONResponse):
+    def render(self, content):
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+# Classe de réponse par défaut de l'application et des réponses construites explicitement
+DefaultJSONResponse = FastJSONResponse if FAST_JSON else JSONResponse
+
+
+def accepted_encoding(accept_encoding):
+    """
+    zstd si le client l'accepte et que `zstandard` est installé, sinon gzip, sinon None.
+    """
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0"):
+            accepted.add(coding.strip())
+    if zstandard is not None and "zstd" in accepted:
+        return "zstd"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(encoding, body):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """
+    Compresse les réponses complètes d'au moins `minimum_size` octets. Les réponses en flux
+    (SSE, NDJSON, plusieurs messages de corps) sont transmises telles quelles : chaque événement
+    doit partir dès qu'il est produit.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = accepted_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is not None:
+                headers = MutableHeaders(raw=start["headers"])
+                body = message.get("body", b"")
+                if (message["type"] == "http.response.body" and not message.get("more_body", False)
+                        and len(body) >= self.minimum_size and "content-encoding" not in headers):
+                    body = compress(encoding, body)
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(body))
+                    headers.add_vary_header("Accept-Encoding")
+                    message = dict(message, body=body)
+                await send(start)
+                start = None
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+
+def install(app):
+    if RESPONSE_COMPRESSION:
+        app.add_middleware(CompressionMiddleware)
@@ -1,12 +1,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from service_common import responses
 from .database import Base, engine
 from .routes import predictions
 
-# Créer les tables
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="Data Service - Cancer Detection")
+app = FastAPI(title="Data Service - Cancer Detection", default_response_class=responses.DefaultJSONResponse)
 
 # CORS
 app.add_middleware(
@@ -20,6 +18,15 @@ app.add_middleware(
 # Routes
 app.include_router(predictions.router)
 
+# Compression gzip / zstd des listes de prédictions volumineuses
+responses.install(app)
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+
+# Créer les tables au démarrage et non à l'import : l'import du module ne touche pas la base
+@app.on_event("startup")
+def create_tables():
+    Base.metadata.create_all(bind=engine)
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
+from service_common.responses import FAST_JSON, DefaultJSONResponse
 from ..database import get_db
 from ..models import Prediction
 from ..schemas import PredictionCreate, PredictionUpdate, PredictionResponse
@@ -7,6 +8,9 @@ from typing import List
 
 router = APIRouter(prefix="/predictions", tags=["predictions"])
 
+# Colonnes de PredictionResponse, pour le chemin de lecture rapide
+PREDICTION_COLUMNS = [getattr(Prediction, name) for name in PredictionResponse.model_fields]
+
 # CREATE - Ajouter une prédiction
 @router.post("/", response_model=PredictionResponse)
 def create_prediction(prediction: PredictionCreate, db: Session = Depends(get_db)):
@@ -23,6 +27,23 @@ def create_prediction(prediction: PredictionCreate, db: Session = Depends(get_db
         db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
+# CREATE BULK - Ajouter un lot de prédictions (jobs asynchrones de la passerelle)
+@router.post("/bulk", response_model=List[PredictionResponse])
+def create_predictions_bulk(predictions: List[PredictionCreate], db: Session = Depends(get_db)):
+    """
+    Crée plusieurs prédictions en une seule transaction ; renvoyées dans l'ordre reçu.
+    """
+    try:
+        db_predictions = [Prediction(**prediction.dict()) for prediction in predictions]
+        db.add_all(db_predictions)
+        db.commit()
+        for db_prediction in db_predictions:
+            db.refresh(db_prediction)
+        return db_predictions
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
 # READ - Récupérer toutes les prédictions
 @router.get("/", response_model=List[PredictionResponse])
 def get_predictions(
@@ -33,6 +54,12 @@ def get_predictions(
     """
     Récupère une liste de prédictions avec pagination.
     """
+    if FAST_JSON:
+        # Lignes lues en tuples et encodées directement par orjson : ni objets ORM ni validation
+        # PredictionResponse ligne par ligne. created_at garde le format du chemin pydantic
+        # (ISO 8601, "Z" en UTC) grâce à ORJSON_OPTIONS ; vérifié par benchmark.py
+        rows = db.query(*PREDICTION_COLUMNS).offset(skip).limit(limit).all()
+        return DefaultJSONResponse(content=[row._asdict() for row in rows])
     return db.query(Prediction).offset(skip).limit(limit).all()
 
 # READ - Récupérer une prédiction par ID
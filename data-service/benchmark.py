@@ -0,0 +1,85 @@
+import json
+import time
+import gzip
+import argparse
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from pydantic import TypeAdapter
+from service_common.responses import FastJSONResponse
+
+from app.schemas import PredictionResponse
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Ligne de db.query(*PREDICTION_COLUMNS) : tuple nommé (attributs et _asdict(), comme sqlalchemy.Row)
+Row = namedtuple("Row", list(PredictionResponse.model_fields))
+
+
+def make_rows(count):
+    """
+    Lignes similaires à celles de la table predictions (UTC, avec et sans microsecondes).
+    """
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        Row(id=i, prediction="Positive" if i % 3 == 0 else "Negative",
+            confidence=0.5 + (i % 500) / 1000, filename=f"mammogram_{i:06d}.jpg",
+            created_at=start + timedelta(seconds=i, microseconds=(i % 7) * 1000))
+        for i in range(count)
+    ]
+
+
+def time_call(fn, iterations):
+    fn()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)[len(timings) // 2], result
+
+
+def benchmark(count, iterations):
+    rows = make_rows(count)
+    adapter = TypeAdapter(List[PredictionResponse])
+
+    def default_path():
+        # Chemin FastAPI par défaut : validation response_model, dump JSON-compatible, puis json.dumps (JSONResponse)
+        content = adapter.dump_python(adapter.validate_python(rows, from_attributes=True), mode="json")
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+    def fast_path():
+        # Chemin FAST_JSON de GET /predictions/ : même construction et même classe de réponse que l'endpoint
+        return FastJSONResponse(content=[row._asdict() for row in rows]).body
+
+    print(f"Sérialisation de {count} lignes (médiane sur {iterations} itérations)")
+    default_ms, default_body = time_call(default_path, iterations)
+    fast_ms, fast_body = time_call(fast_path, iterations)
+    # Les deux chemins doivent produire le même contenu (format des dates compris)
+    if json.loads(default_body) != json.loads(fast_body):
+        raise SystemExit("Contenus différents entre le chemin pydantic et le chemin orjson")
+    print(f"  contenus identiques{' (octet pour octet)' if default_body == fast_body else ''}")
+    print(f"  pydantic + json : {default_ms:8.2f} ms  ({len(default_body) / 1024:.0f} Ko)")
+    print(f"  orjson          : {fast_ms:8.2f} ms  ({len(fast_body) / 1024:.0f} Ko)  x{default_ms / fast_ms:.1f}")
+
+    print("Compression du corps orjson")
+    codecs = [("gzip", lambda body: gzip.compress(body, compresslevel=6))]
+    if zstandard is not None:
+        codecs.append(("zstd", lambda body: zstandard.ZstdCompressor(level=3).compress(body)))
+    for name, codec in codecs:
+        codec_ms, compressed = time_call(lambda: codec(fast_body), iterations)
+        print(f"  {name:<15} : {codec_ms:8.2f} ms  ({len(compressed) / 1024:.0f} Ko, "
+              f"{len(fast_body) / len(compressed):.1f}x plus petit)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Temps de sérialisation d'une liste de prédictions")
+    parser.add_argument("--rows", type=int, default=10000, help="Nombre de lignes")
+    parser.add_argument("--iterations", type=int, default=20, help="Mesures par variante")
+    args = parser.parse_args()
+    benchmark(args.rows, args.iterations)
@@ -29,18 +29,21 @@ def make_api_call(
         tuple: (success: bool, data: dict ou error_message: str)
     """
     
+    # Budget de temps transmis à la passerelle : au-delà, le résultat ne sera plus attendu
+    headers = {"X-Request-Timeout-Ms": str(int(timeout * 1000))}
+
     try:
         if method == "GET":
-            response = requests.get(url, params=params, timeout=timeout)
+            response = requests.get(url, params=params, headers=headers, timeout=timeout)
         elif method == "POST":
             if files:
-                response = requests.post(url, files=files, timeout=timeout)
+                response = requests.post(url, files=files, headers=headers, timeout=timeout)
             else:
-                response = requests.post(url, json=json_data, timeout=timeout)
+                response = requests.post(url, json=json_data, headers=headers, timeout=timeout)
         elif method == "PUT":
-            response = requests.put(url, json=json_data, timeout=timeout)
+            response = requests.put(url, json=json_data, headers=headers, timeout=timeout)
         elif method == "DELETE":
-            response = requests.delete(url, timeout=timeout)
+            response = requests.delete(url, headers=headers, timeout=timeout)
         else:
             return False, f"Méthode HTTP non supportée: {method}"
         
@@ -1,13 +1,93 @@
-from fastapi import FastAPI
+import time
+import threading
+from .utils import startup
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST
+from service_common import responses
 from .route.route import router as api_router
+from .utils.registry import load_and_warm_up, is_ready, model_status
+from .utils import metrics
+from .utils.autotune import runtime_config
+from .utils.pipeline import pipeline
+from .utils.admission import admission, PRIORITY_HEADER
+
+# Imports de l'application seuls : TensorFlow et PIL sont importés ensuite, dans le thread de chargement
+startup.record("imports", time.perf_counter() - startup.STARTED)
+
 app = FastAPI(
     title="Cancer Detection API",
     description="API de classification d’images pour le cancer du sein (CNN)",
-    
+    default_response_class=responses.DefaultJSONResponse,
 )
 
 # Charger les routes
 app.include_router(api_router)
+# Compression gzip / zstd des réponses volumineuses (cartes de probabilités par tuiles, /config)
+responses.install(app)
+
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """
+    Refus immédiat (429 / 503 + Retry-After) au-delà de la limite de concurrence, avant la lecture du corps.
+    """
+    endpoint = request.url.path
+    if not endpoint.startswith("/inference/predict"):
+        return await call_next(request)
+    priority = admission.priority(endpoint, request.headers.get(PRIORITY_HEADER))
+    rejected = admission.try_acquire(priority)
+    if rejected:
+        return JSONResponse(status_code=rejected, headers={"Retry-After": str(admission.retry_after())},
+                            content={"detail": "Service saturé, réessayer plus tard", "priority": priority})
+    # Latence mesurée par le pipeline (file + passe avant) : la durée autour de call_next inclurait
+    # l'envoi du corps par le client, sans rapport avec la charge du service
+    request.state.model_latency_s = None
+    ok = False
+    try:
+        response = await call_next(request)
+        ok = response.status_code == 200
+        return response
+    finally:
+        latency = request.state.model_latency_s
+        admission.release(priority, latency, ok and latency is not None)
+
+
+# Déclaré après : middleware extérieur, les refus de l'admission sont aussi comptés
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """
+    Requêtes en cours, durée totale et nombre de requêtes par endpoint / version de modèle / statut.
+    """
+    endpoint = request.url.path
+    if not endpoint.startswith("/inference/predict"):
+        return await call_next(request)
+    in_flight = metrics.IN_FLIGHT.labels(endpoint)
+    in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    model_version = "unknown"
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        model_version = response.headers.get("X-Model-Version", model_version)
+        return response
+    finally:
+        in_flight.dec()
+        metrics.REQUEST_LATENCY.labels(endpoint, str(status)).observe(time.perf_counter() - start)
+        metrics.REQUESTS.labels(endpoint, model_version, str(status)).inc()
+
+
+@app.on_event("startup")
+async def start_model_loading():
+    await pipeline.start()
+    # En arrière-plan : /live répond pendant le chargement et le préchauffage
+    threading.Thread(target=load_and_warm_up, name="model-warmup", daemon=True).start()
+
+
+@app.on_event("shutdown")
+async def stop_pipeline():
+    await pipeline.stop()
 
 
 @app.get("/")
@@ -15,3 +95,36 @@ def root():
     return {
         "message": "L'API de détection du cancer est en cours d'exécution."
     }
+
+
+@app.get("/live")
+def live():
+    """
+    Liveness : le processus répond (le modèle peut encore être en chargement).
+    """
+    return {"status": "alive"}
+
+
+@app.get("/ready")
+def ready():
+    """
+    Readiness : 200 uniquement une fois le modèle chargé et préchauffé, 503 sinon.
+    """
+    status = model_status()
+    if not is_ready():
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/config")
+def config():
+    """
+    Configuration d'exécution retenue (threads, taille de batch max, mesures de l'autotune).
+    """
+    return dict(runtime_config(), pipeline=pipeline.status(), admission=admission.status(),
+                startup=startup.summary())
@@ -1,87 +1,361 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from PIL import Image
-import httpx
-import os
-import json
+from fastapi import APIRouter, UploadFile, File, HTTPException, Header, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional
+import numpy as np
+import asyncio
 import logging
 from io import BytesIO
-from dotenv import load_dotenv
 
-from ..utils.preprocess import preprocess_image
-from ..utils.model_loader import load_model_once
-
-load_dotenv()
+from ..utils.preprocess import preprocess_image, tta_batch
+from ..utils.tiling import tiled_predict, TILE_SIZE, TILE_STRIDE, MAX_TILE_SIZE
+from ..utils.tensor_input import decode_tensor, max_payload_size, TensorFormatError, MAX_TENSOR_BATCH
+from ..utils.registry import registry, is_ready
+from ..utils.pipeline import pipeline, deadline_from, DeadlineExceeded, ClientDisconnected
+from ..utils import metrics
+from service_common.responses import DefaultJSONResponse
 
 # Configurer le logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/inference", tags=["inference"])
 
-model = load_model_once()
 
-# Charger le mapping des classes dynamiquement
-def load_class_names():
+async def resolve_model(response, version, x_model_version):
+    """
+    Version demandée (?version= ou X-Model-Version) ou active. La référence est gardée
+    jusqu'à la fin de la requête, même si la version active change entre-temps.
+    Une version épinglée non chargée est lue, vérifiée et préchauffée dans le pool de threads :
+    la boucle d'événements (et /live, /ready) continue de répondre pendant ce temps.
+    """
+    if not is_ready():
+        raise HTTPException(status_code=503, detail="Modèle en cours de chargement")
+    requested_version = version or x_model_version
     try:
-        classes_path = os.path.join(os.path.dirname(__file__), "..", "..", "models", "classes.json")
-        if os.path.exists(classes_path):
-            with open(classes_path, 'r') as f:
-                labels = json.load(f)
-                # On convertit les clés en int et on trie pour avoir une liste [label_0, label_1]
-                return [labels[str(i)] for i in sorted(map(int, labels.keys()))]
-    except Exception as e:
-        logger.error(f"Erreur lors du chargement des classes: {e}")
-    
-    # Fallback par défaut (au cas où)
-    return ["Positive", "Negative"]
+        served = await run_in_threadpool(registry.get, requested_version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Version de modèle inconnue : {requested_version}")
+    response.headers["X-Model-Version"] = served.version
+    return served
+
+
+def open_image(content, lazy=False):
+    """
+    Décode une image depuis ses octets. PIL est importé ici, pas à l'import du module :
+    le thread de chargement le préimporte avant que le service ne soit prêt.
+    Avec `lazy`, seul l'en-tête est lu : les pixels sont décodés au premier découpage.
+    """
+    from PIL import Image
+    image = Image.open(BytesIO(content))
+    if not lazy:
+        image.load()
+    return image
+
+
+def classify(class_names, probability):
+    """
+    Classe affichée ("Cancer" -> "Positive") et confiance pour une sortie sigmoïde.
+    """
+    predicted_class_raw = class_names[int(probability >= 0.5)]
+    predicted_class = "Positive" if predicted_class_raw.lower() == "cancer" else predicted_class_raw
+    return predicted_class, float(probability if probability >= 0.5 else 1 - probability)
+
 
-CLASS_NAMES = load_class_names()
-logger.info(f"Classes chargées: {CLASS_NAMES}")
+def dropped(e):
+    """
+    Requête abandonnée avant la passe avant : 504 si l'échéance est dépassée,
+    499 (convention nginx, réponse lue par personne) si le client s'est déconnecté.
+    """
+    return HTTPException(status_code=504 if isinstance(e, DeadlineExceeded) else 499, detail=str(e))
 
-# URL du service data
-# URL du service data
-DATA_SERVICE_URL = os.getenv("DATA_SERVICE_URL", "http://data-service:8002")
-if not DATA_SERVICE_URL.startswith("http://") and not DATA_SERVICE_URL.startswith("https://"):
-    DATA_SERVICE_URL = f"http://{DATA_SERVICE_URL}"
+
+async def read_body(request, limit):
+    """
+    Corps de la requête, refusé (413) dès qu'il dépasse `limit` octets : annoncé par Content-Length
+    avant toute lecture, ou en cours de lecture pour un envoi sans longueur (chunked).
+    """
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > limit:
+        raise HTTPException(status_code=413, detail=f"Corps de {content_length} octets, maximum {limit}")
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise HTTPException(status_code=413, detail=f"Corps de plus de {limit} octets")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def serialize(result, model_version):
+    # La réponse encode le contenu à la construction (json ou orjson selon FAST_JSON) : c'est l'étape de sérialisation
+    with metrics.stage("serialize", model_version):
+        return DefaultJSONResponse(content=result, headers={"X-Model-Version": model_version})
 
 
 @router.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(
+    request: Request,
+    response: Response,
+    file: UploadFile = File(...),
+    version: Optional[str] = Query(None, description="Version du modèle (défaut : version active)"),
+    x_model_version: Optional[str] = Header(None),
+    x_request_timeout_ms: Optional[str] = Header(None),
+    tta: bool = Query(False, description="Test-time augmentation : rotations et miroirs en un seul batch"),
+):
+    served = await resolve_model(response, version, x_model_version)
+    deadline = deadline_from(x_request_timeout_ms)
     try:
-        logger.info(f"Reçu fichier: {file.filename}")
-        
-        # Lire le contenu du fichier
-        file_content = await file.read()
-        logger.info(f"Fichier lu: {len(file_content)} bytes")
-        
-        # Ouvrir l'image directement à partir des bytes
-        image = Image.open(BytesIO(file_content))
-        logger.info(f"Image ouverte: {image.size}, mode: {image.mode}")
-        
-        image_array = preprocess_image(image)
-        logger.info(f"Image prétraitée: {image_array.shape}")
-
-        prediction = model.predict(image_array)[0][0]
-        logger.info(f"Prédiction brute: {prediction}")
-
-        predicted_class_raw = CLASS_NAMES[int(prediction >= 0.5)]
-        
-        # Mapping logique pour l'utilisateur :
-        # Si la classe détectée est "Cancer", on renvoie "Positive"
-        # Si la classe détectée est "Negative", on renvoie "Negative"
-        if predicted_class_raw.lower() == "cancer":
-            predicted_class = "Positive"
-        else:
-            predicted_class = predicted_class_raw
-
-        confidence = float(prediction if prediction >= 0.5 else 1 - prediction)
-        logger.info(f"Classe brute: {predicted_class_raw} -> Finale: {predicted_class}, Confiance: {confidence}")
-
-        return {
-            "prediction": predicted_class,
-            "confidence": confidence
-        }
+        with metrics.stage("read", served.version):
+            file_content = await file.read()
+
+        def prepare():
+            # Étage de prétraitement (pool dédié) : décodage, conversion, redimensionnement
+            with metrics.stage("decode", served.version):
+                # Ouvrir l'image directement à partir des bytes
+                image = open_image(file_content)
+            with metrics.stage("preprocess", served.version):
+                image_array = preprocess_image(image)
+                if tta:
+                    image_array = tta_batch(image_array)
+            logger.debug("Fichier %s (%d octets) prétraité: %s", file.filename, len(file_content), image_array.shape)
+            return image_array
+
+        probabilities = await pipeline.infer(served, "predict", prepare, deadline=deadline, request=request)
+
+        with metrics.stage("postprocess", served.version):
+            probabilities = np.asarray(probabilities).reshape(-1)
+            tta_result = None
+            if tta:
+                # Une seule passe avant sur les 8 vues : coût proche d'un appel en batch, pas de 8 appels
+                prediction = float(probabilities.mean())
+                tta_result = {"views": len(probabilities), "variance": float(probabilities.var())}
+            else:
+                prediction = float(probabilities[0])
 
+            # Mapping logique pour l'utilisateur :
+            # Si la classe détectée est "Cancer", on renvoie "Positive"
+            # Si la classe détectée est "Negative", on renvoie "Negative"
+            predicted_class, confidence = classify(served.class_names, prediction)
+            logger.debug("Prédiction brute: %s -> %s, confiance: %s", prediction, predicted_class, confidence)
+
+            result = {
+                "prediction": predicted_class,
+                "confidence": confidence,
+                "model_version": served.version
+            }
+            if tta_result is not None:
+                result["tta"] = tta_result
+
+        return serialize(result, served.version)
+
+    except (DeadlineExceeded, ClientDisconnected) as e:
+        raise dropped(e)
     except Exception as e:
         logger.error(f"Erreur lors de la prédiction: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.post("/predict/tiled")
+async def predict_tiled(
+    request: Request,
+    response: Response,
+    file: UploadFile = File(...),
+    version: Optional[str] = Query(None, description="Version du modèle (défaut : version active)"),
+    x_model_version: Optional[str] = Header(None),
+    x_request_timeout_ms: Optional[str] = Header(None),
+    tile_size: int = Query(TILE_SIZE, ge=32, le=MAX_TILE_SIZE,
+                           description="Taille des tuiles en pixels de l'image d'origine"),
+    stride: Optional[int] = Query(None, ge=8, description="Pas de la fenêtre glissante (défaut : TILE_STRIDE)"),
+):
+    """
+    Inférence par tuiles pour les images haute résolution (mammographies plein champ) :
+    au lieu de réduire toute l'image à 128x128, chaque tuile est évaluée à pleine résolution.
+    Le score agrégé est celui de la tuile la plus suspecte.
+    """
+    served = await resolve_model(response, version, x_model_version)
+    deadline = deadline_from(x_request_timeout_ms)
+    stride = stride or min(TILE_STRIDE, tile_size)
+    try:
+        with metrics.stage("read", served.version):
+            file_content = await file.read()
+        with metrics.stage("decode", served.version):
+            # En-tête seul : les pixels sont décodés par le découpage, dans le pool de prétraitement
+            image = await asyncio.get_running_loop().run_in_executor(
+                pipeline.preprocess_pool, open_image, file_content, True)
+        logger.info(f"Image ouverte (tuiles {tile_size}px, pas {stride}px): {image.size}, mode: {image.mode}")
+
+        # Découpage et test de fond dans le pool de prétraitement, batches de tuiles via la file du pipeline
+        probability_map = await tiled_predict(pipeline, served, image, tile_size, stride,
+                                              deadline=deadline, request=request)
+        scored = ~np.isnan(probability_map)
+        if not scored.any():
+            raise HTTPException(status_code=422, detail="Aucune tuile contenant du tissu")
+
+        with metrics.stage("postprocess", served.version):
+            # Probabilité de la classe "Cancer" par tuile (la sortie du modèle est celle de l'index 1)
+            cancer_index = next((i for i, name in enumerate(served.class_names) if name.lower() == "cancer"), 1)
+            cancer_map = probability_map if cancer_index == 1 else 1 - probability_map
+            cancer_score = float(np.nanmax(cancer_map))
+
+            predicted_class_raw = served.class_names[cancer_index if cancer_score >= 0.5 else 1 - cancer_index]
+            predicted_class = "Positive" if predicted_class_raw.lower() == "cancer" else predicted_class_raw
+            confidence = cancer_score if cancer_score >= 0.5 else 1 - cancer_score
+            logger.info(f"Tuiles évaluées: {int(scored.sum())}/{scored.size}, score max: {cancer_score:.4f}")
+
+            result = {
+                "prediction": predicted_class,
+                "confidence": confidence,
+                "model_version": served.version,
+                "tiles": {
+                    "tile_size": tile_size,
+                    "stride": stride,
+                    "rows": int(probability_map.shape[0]),
+                    "cols": int(probability_map.shape[1]),
+                    "scored": int(scored.sum()),
+                    "skipped": int((~scored).sum()),
+                    "max_probability": cancer_score,
+                    "mean_probability": float(np.nanmean(cancer_map)),
+                    # Probabilité "Cancer" par tuile, null pour le fond
+                    "probability_map": [
+                        [None if np.isnan(p) else round(float(p), 4) for p in row] for row in cancer_map
+                    ],
+                },
+            }
+
+        return serialize(result, served.version)
+
+    except HTTPException:
+        raise
+    except (DeadlineExceeded, ClientDisconnected) as e:
+        raise dropped(e)
+    except Exception as e:
+        logger.error(f"Erreur lors de la prédiction par tuiles: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/predict/tensor")
+async def predict_tensor(
+    request: Request,
+    response: Response,
+    version: Optional[str] = Query(None, description="Version du modèle (défaut : version active)"),
+    x_model_version: Optional[str] = Header(None),
+    x_tensor_shape: Optional[str] = Header(None),
+    x_tensor_dtype: Optional[str] = Header(None),
+    x_request_timeout_ms: Optional[str] = Header(None),
+):
+    """
+    Entrée binaire pour les clients machine : corps .npy (application/x-npy) ou tenseur brut
+    (application/octet-stream + X-Tensor-Shape: N,128,128,3 et X-Tensor-Dtype: uint8|float32).
+    Aucun décodage d'image : les pixels sont lus sans copie après validation de la forme.
+    """
+    content_type = request.headers.get("content-type", "")
+    try:
+        # Forme et type annoncés vérifiés avant la lecture : le corps est borné par la taille d'un tenseur valide
+        limit = max_payload_size(content_type, x_tensor_shape, x_tensor_dtype)
+    except TensorFormatError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    served = await resolve_model(response, version, x_model_version)
+    deadline = deadline_from(x_request_timeout_ms)
+
+    with metrics.stage("read", served.version):
+        body = await read_body(request, limit)
+
+    def prepare():
+        with metrics.stage("decode", served.version):
+            return decode_tensor(body, content_type, x_tensor_shape, x_tensor_dtype)
+
+    try:
+        probabilities = await pipeline.infer(served, "predict_tensor", prepare, deadline=deadline, request=request)
+    except TensorFormatError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except (DeadlineExceeded, ClientDisconnected) as e:
+        raise dropped(e)
+
+    try:
+        with metrics.stage("postprocess", served.version):
+            predictions = []
+            for probability in np.asarray(probabilities).reshape(-1):
+                predicted_class, confidence = classify(served.class_names, probability)
+                predictions.append({"prediction": predicted_class, "confidence": confidence})
+        logger.debug("Tenseur de %d images évalué", len(predictions))
+        return serialize({"predictions": predictions, "model_version": served.version}, served.version)
+    except Exception as e:
+        logger.error(f"Erreur lors de la prédiction sur tenseur: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/predict/batch")
+async def predict_batch(
+    request: Request,
+    response: Response,
+    files: List[UploadFile] = File(...),
+    version: Optional[str] = Query(None, description="Version du modèle (défaut : version active)"),
+    x_model_version: Optional[str] = Header(None),
+    x_request_timeout_ms: Optional[str] = Header(None),
+):
+    """
+    Plusieurs images encodées en une requête (jobs de la passerelle) : décodées dans le pool de
+    prétraitement puis placées en une seule entrée de la file, au lieu d'une requête par image.
+    Une image illisible n'échoue que pour elle-même ("error" à sa position).
+    """
+    if len(files) > MAX_TENSOR_BATCH:
+        raise HTTPException(status_code=422, detail=f"Batch de {len(files)} images, maximum {MAX_TENSOR_BATCH}")
+    served = await resolve_model(response, version, x_model_version)
+    deadline = deadline_from(x_request_timeout_ms)
+
+    with metrics.stage("read", served.version):
+        contents = [await file.read() for file in files]
+    errors = {}
+
+    def prepare():
+        arrays = []
+        for index, content in enumerate(contents):
+            try:
+                with metrics.stage("decode", served.version):
+                    image = open_image(content)
+                with metrics.stage("preprocess", served.version):
+                    arrays.append(preprocess_image(image))
+            except Exception as e:
+                errors[index] = f"{type(e).__name__}: {e}"
+        if not arrays:
+            raise HTTPException(status_code=422, detail="Aucune image lisible dans le batch")
+        return np.concatenate(arrays)
+
+    try:
+        probabilities = await pipeline.infer(served, "predict_batch", prepare, deadline=deadline, request=request)
+    except (DeadlineExceeded, ClientDisconnected) as e:
+        raise dropped(e)
+
+    try:
+        with metrics.stage("postprocess", served.version):
+            scores = iter(np.asarray(probabilities).reshape(-1))
+            predictions = []
+            for index in range(len(contents)):
+                if index in errors:
+                    predictions.append({"error": errors[index]})
+                    continue
+                predicted_class, confidence = classify(served.class_names, next(scores))
+                predictions.append({"prediction": predicted_class, "confidence": confidence})
+        logger.debug("Batch de %d images évalué (%d illisibles)", len(predictions), len(errors))
+        return serialize({"predictions": predictions, "model_version": served.version}, served.version)
+    except Exception as e:
+        logger.error(f"Erreur lors de la prédiction par batch: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/models")
+def list_models():
+    return registry.status()
+
+
+@router.post("/models/{version}/activate")
+def activate_model(version: str):
+    """
+    Bascule à chaud vers `version` : chargée et préchauffée avant le changement de pointeur.
+    """
+    try:
+        registry.activate(version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Version de modèle inconnue : {version}")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return registry.status()
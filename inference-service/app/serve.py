@@ -0,0 +1,199 @@
+"""
+Service d'inférence multi-workers en pré-fork.
+
+Le parent importe l'application (TensorFlow compris) et lit l'artefact .tflite actif une seule fois,
+puis forke les workers : code Python, bibliothèques et buffer du modèle sont partagés en copie sur écriture.
+Chaque worker est épinglé sur son propre ensemble de cœurs avec autant de threads intra-op que de cœurs.
+
+    python -m app.serve --workers 4 --port 8001
+
+Dans le conteneur, SERVE_WORKERS > 1 lance ce mode au lieu d'uvicorn seul (voir le Dockerfile).
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+import tempfile
+
+# Avant tout import de prometheus_client : les métriques des workers sont agrégées via ce dossier
+if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="inference-metrics-")
+# Avant l'import de model_loader : sans délégué par défaut, les poids restent dans le buffer partagé
+# au lieu d'être réorganisés par XNNPACK dans le tas de chaque worker (TFLITE_SHARED_WEIGHTS=0 pour le rétablir)
+os.environ.setdefault("TFLITE_SHARED_WEIGHTS", "1")
+
+import uvicorn
+from prometheus_client import multiprocess
+
+from .main import app
+from .utils import model_loader
+from .utils.registry import registry
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(process)d] %(name)s: %(message)s")
+logger = logging.getLogger("app.serve")
+
+
+def split_cores(cores, workers):
+    """
+    Répartit les cœurs en `workers` ensembles contigus et équilibrés
+    (un cœur partagé par worker s'il y a plus de workers que de cœurs).
+    """
+    if workers >= len(cores):
+        return [[cores[i % len(cores)]] for i in range(workers)]
+    size, extra = divmod(len(cores), workers)
+    core_sets, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        core_sets.append(cores[start:end])
+        start = end
+    return core_sets
+
+
+def run_worker(cores, sock):
+    """
+    Processus worker : affinité CPU, threads intra-op = nombre de cœurs, puis uvicorn sur le socket hérité.
+    Le runtime TensorFlow n'a pas été initialisé dans le parent, le réglage des threads est donc encore possible.
+    """
+    os.sched_setaffinity(0, cores)
+    threads = len(cores)
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    # Lu par configure_threads / autotune au démarrage du worker : seule la taille de batch reste à régler.
+    # Imposé même si INFERENCE_THREADS est défini globalement : sinon chaque worker surcharge ses cœurs
+    os.environ["INFERENCE_THREADS"] = str(threads)
+
+    logger.info(f"Worker démarré sur les cœurs {cores} ({threads} threads intra-op)")
+    server = uvicorn.Server(uvicorn.Config(app, log_level="info"))
+    server.run(sockets=[sock])
+
+
+def read_memory(pid):
+    """
+    Compteurs mémoire (Mo) d'un processus depuis /proc/<pid>/smaps_rollup.
+    """
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1]) / 1024
+    return values
+
+
+def memory_report(pids):
+    """
+    Mémoire réelle (PSS : pages partagées réparties entre processus) du parent et des workers,
+    comparée à une estimation pour des workers indépendants, où chaque worker aurait sa propre copie
+    de la mémoire anonyme héritée du parent (modules importés, buffer du modèle).
+    """
+    try:
+        parent = read_memory(os.getpid())
+        workers = [read_memory(pid) for pid in pids]
+    except OSError as e:
+        logger.warning(f"Rapport mémoire indisponible: {e}")
+        return None
+
+    total_pss = parent.get("Pss", 0) + sum(w.get("Pss", 0) for w in workers)
+    # Pages anonymes encore partagées avec le parent = anonymes - privées modifiées
+    shared_anonymous = sum(max(0.0, w.get("Anonymous", 0) - w.get("Private_Dirty", 0)) for w in workers)
+    saved = max(0.0, shared_anonymous - parent.get("Anonymous", 0))
+    report = {
+        "workers": len(workers),
+        "parent_pss_mb": round(parent.get("Pss", 0), 1),
+        "worker_pss_mb": [round(w.get("Pss", 0), 1) for w in workers],
+        "total_pss_mb": round(total_pss, 1),
+        "independent_workers_estimate_mb": round(total_pss + saved, 1),
+        "saved_mb": round(saved, 1),
+    }
+    logger.info(f"Mémoire : {report['total_pss_mb']} Mo (PSS) pour {len(workers)} workers, "
+                f"~{report['independent_workers_estimate_mb']} Mo avec des workers indépendants "
+                f"(économie ~{report['saved_mb']} Mo)")
+    return report
+
+
+def serve(workers, host, port, report_delay=60.0):
+    # 1. Import de TensorFlow (sans exécuter d'opération : le fork reste sûr) et lecture unique
+    # de l'artefact actif dans le parent ; les workers en héritent au lieu de les refaire
+    model_loader.tensorflow()
+    artifact_path, _, _ = registry.locate(registry.current_version())
+    if model_loader.preload_artifact(artifact_path) is None:
+        logger.warning(f"{artifact_path} n'est pas un artefact .tflite : chaque worker le chargera séparément")
+    else:
+        logger.info(f"Artefact {artifact_path} préchargé pour {workers} workers "
+                    f"({'poids partagés' if model_loader.TFLITE_SHARED_WEIGHTS else 'XNNPACK, poids copiés par worker'})")
+
+    # 2. Socket d'écoute partagé par les workers
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    core_sets = split_cores(sorted(os.sched_getaffinity(0)), workers)
+    children = {}
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(core_sets[index], sock)
+            except Exception:
+                logger.exception("Arrêt du worker sur erreur")
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = index
+
+    for index in range(workers):
+        spawn(index)
+    logger.info(f"{workers} workers en écoute sur {host}:{port}")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: memory_report(list(children)))
+
+    # 3. Supervision : redémarrage des workers morts, rapport mémoire une fois les workers préchauffés
+    report_at = time.monotonic() + report_delay if report_delay > 0 else None
+    while children:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            index = children.pop(pid)
+            multiprocess.mark_process_dead(pid)
+            if not stopping:
+                logger.warning(f"Worker {pid} arrêté, redémarrage")
+                time.sleep(1)
+                spawn(index)
+            continue
+        if report_at is not None and time.monotonic() >= report_at:
+            memory_report(list(children))
+            report_at = None
+        time.sleep(0.5)
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Service d'inférence multi-workers (pré-fork)")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVE_WORKERS", "2")), help="Nombre de workers")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--report_delay", type=float, default=60.0,
+                        help="Délai (s) avant le rapport mémoire (aussi sur SIGUSR1), 0 pour désactiver")
+    args = parser.parse_args()
+
+    if sys.platform != "linux":
+        sys.exit("Le mode pré-fork requiert Linux (fork, sched_setaffinity, /proc)")
+    serve(args.workers, args.host, args.port, args.report_delay)
@@ -0,0 +1,112 @@
+import os
+import math
+import time
+
+from . import metrics
+from .autotune import LATENCY_SLO_MS
+
+# ADMISSION_CONTROL=0 : toutes les requêtes sont acceptées (comportement antérieur)
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") == "1"
+ADMISSION_TARGET_MS = float(os.getenv("ADMISSION_TARGET_MS", str(LATENCY_SLO_MS)))
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "2"))
+ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", "64"))
+ADMISSION_INITIAL_LIMIT = int(os.getenv("ADMISSION_INITIAL_LIMIT", "8"))
+# Part de la limite accessible aux requêtes "batch" : le reste est réservé aux requêtes interactives
+ADMISSION_BATCH_SHARE = float(os.getenv("ADMISSION_BATCH_SHARE", "0.5"))
+# Diminution multiplicative quand la latence dépasse l'objectif
+ADMISSION_BACKOFF = float(os.getenv("ADMISSION_BACKOFF", "0.9"))
+
+PRIORITY_HEADER = "X-Priority"
+PRIORITIES = ("interactive", "batch")
+# Classe par défaut : une image envoyée par un utilisateur est interactive ;
+# les requêtes multi-images et l'inférence par tuiles (nombreuses passes avant) sont des traitements de masse
+DEFAULT_PRIORITIES = {
+    "/inference/predict": "interactive",
+    "/inference/predict/tensor": "batch",
+    "/inference/predict/batch": "batch",
+    "/inference/predict/tiled": "batch",
+}
+
+
+class AdmissionController:
+    """
+    Limite de concurrence adaptative (AIMD) : +1/limite par requête interactive servie sous
+    l'objectif de latence (attente en file + passe avant, mesurée par le pipeline) pendant que la limite est réellement utilisée, x ADMISSION_BACKOFF
+    (au plus une fois par durée de requête) quand l'objectif est dépassé. Au-delà de la limite
+    les requêtes sont refusées immédiatement plutôt que mises en file : 429 pour une requête
+    "batch" au-delà de sa part, 503 quand la limite totale est atteinte.
+    """
+
+    def __init__(self, target_ms=ADMISSION_TARGET_MS, min_limit=ADMISSION_MIN_LIMIT, max_limit=ADMISSION_MAX_LIMIT,
+                 initial_limit=ADMISSION_INITIAL_LIMIT, batch_share=ADMISSION_BATCH_SHARE, enabled=ADMISSION_CONTROL):
+        self.target_s = target_ms / 1000
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.batch_share = batch_share
+        self.enabled = enabled
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.in_flight = {priority: 0 for priority in PRIORITIES}
+        self.latency_ewma = None
+        self._last_decrease = 0.0
+        metrics.ADMISSION_LIMIT.set(self.limit)
+
+    def priority(self, path, header=None):
+        """
+        Classe déduite du chemin. Le port du service est exposé : l'en-tête X-Priority ne peut
+        qu'abaisser la priorité (jobs de la passerelle), jamais rendre interactive une requête de masse.
+        """
+        if header == "batch":
+            return header
+        return DEFAULT_PRIORITIES.get(path, "interactive")
+
+    def try_acquire(self, priority):
+        """
+        Admet la requête ou renvoie le code de refus (429 / 503). Appelé depuis la boucle asyncio :
+        pas de verrou nécessaire.
+        """
+        total = sum(self.in_flight.values())
+        if self.enabled:
+            if total >= int(self.limit):
+                metrics.ADMISSION_REJECTED.labels(priority, "503").inc()
+                return 503
+            if priority == "batch" and self.in_flight["batch"] >= max(1, int(self.limit * self.batch_share)):
+                metrics.ADMISSION_REJECTED.labels(priority, "429").inc()
+                return 429
+        self.in_flight[priority] += 1
+        return None
+
+    def release(self, priority, latency_s, ok):
+        used = sum(self.in_flight.values())
+        self.in_flight[priority] -= 1
+        # Seules les requêtes interactives réussies pilotent la limite : c'est leur latence qui est protégée
+        if priority != "interactive" or not ok:
+            return
+        self.latency_ewma = latency_s if self.latency_ewma is None else 0.2 * latency_s + 0.8 * self.latency_ewma
+        now = time.monotonic()
+        if latency_s > self.target_s:
+            if now - self._last_decrease >= latency_s:
+                self.limit = max(self.min_limit, self.limit * ADMISSION_BACKOFF)
+                self._last_decrease = now
+        elif used >= self.limit / 2:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        metrics.ADMISSION_LIMIT.set(self.limit)
+
+    def retry_after(self):
+        """
+        Délai conseillé (s, entier pour l'en-tête Retry-After) : environ le temps d'écoulement des requêtes en cours.
+        """
+        latency = self.latency_ewma or self.target_s
+        return max(1, math.ceil(latency * sum(self.in_flight.values()) / max(self.limit, 1)))
+
+    def status(self):
+        return {
+            "enabled": self.enabled,
+            "limit": round(self.limit, 2),
+            "batch_limit": max(1, int(self.limit * self.batch_share)),
+            "in_flight": dict(self.in_flight),
+            "target_ms": self.target_s * 1000,
+            "latency_ewma_ms": self.latency_ewma * 1000 if self.latency_ewma is not None else None,
+        }
+
+
+admission = AdmissionController()
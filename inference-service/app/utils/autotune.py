@@ -0,0 +1,154 @@
+import os
+import sys
+import time
+import logging
+
+import numpy as np
+
+from . import model_loader
+from .preprocess import IMG_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Objectif de latence (p95, ms) sous lequel le débit est maximisé
+LATENCY_SLO_MS = float(os.getenv("LATENCY_SLO_MS", "100"))
+AUTOTUNE_ITERATIONS = int(os.getenv("AUTOTUNE_ITERATIONS", "20"))
+
+_config = {"source": "default", "threads": None, "interop_threads": None, "max_batch_size": None,
+           "latency_slo_ms": LATENCY_SLO_MS, "candidates": []}
+
+
+def _env_int(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def available_cores():
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+
+
+def thread_candidates(cores):
+    """
+    Puissances de 2 jusqu'au nombre de cœurs disponibles, plus ce nombre lui-même.
+    """
+    candidates = {cores}
+    threads = 1
+    while threads < cores:
+        candidates.add(threads)
+        threads *= 2
+    return sorted(candidates)
+
+
+def configure_threads():
+    """
+    Fixe les pools de threads TensorFlow avant toute opération : INFERENCE_THREADS (défaut : cœurs
+    de l'affinité du processus) en intra-op, INFERENCE_INTEROP_THREADS (défaut 1) en inter-op,
+    pour qu'une requête batch 1 n'occupe pas tous les cœurs d'un gros hôte en concurrence avec les autres.
+    """
+    threads = _env_int("INFERENCE_THREADS") or available_cores()
+    interop = _env_int("INFERENCE_INTEROP_THREADS") or 1
+    tf = model_loader.tensorflow()
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(interop)
+    except RuntimeError as e:
+        # Runtime déjà initialisé : les valeurs en place restent actives
+        logger.warning(f"Pools de threads TensorFlow déjà initialisés: {e}")
+    _config.update(threads=threads, interop_threads=interop)
+    return threads
+
+
+def measure(model, batch_size, iterations=AUTOTUNE_ITERATIONS):
+    batch = np.random.rand(batch_size, *IMG_SIZE, 3).astype(np.float32)
+    model.predict(batch, verbose=0)
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        model.predict(batch, verbose=0)
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings)
+    return {
+        "batch_size": batch_size,
+        "p50_ms": float(np.percentile(timings, 50) * 1000),
+        "p95_ms": float(np.percentile(timings, 95) * 1000),
+        "images_per_sec": float(batch_size / timings.mean()),
+    }
+
+
+def choose(candidates, latency_slo_ms):
+    """
+    Meilleur débit parmi les configurations dont la latence p95 respecte l'objectif ;
+    à défaut, la configuration la plus rapide.
+    """
+    within_slo = [c for c in candidates if c["p95_ms"] <= latency_slo_ms]
+    if within_slo:
+        return max(within_slo, key=lambda c: c["images_per_sec"])
+    return min(candidates, key=lambda c: c["p95_ms"])
+
+
+def autotune(artifact_path, model=None):
+    """
+    Mesure quelques combinaisons (threads, taille de batch) sur le modèle chargé et retient
+    le meilleur débit sous LATENCY_SLO_MS. Les threads ne sont explorés que pour TFLite
+    (un interpréteur par candidat) : ceux de TensorFlow sont figés après la première opération.
+    INFERENCE_THREADS et INFERENCE_MAX_BATCH_SIZE imposent une valeur ; AUTOTUNE=0 désactive les mesures.
+    """
+    forced_threads = _env_int("INFERENCE_THREADS")
+    forced_batch = _env_int("INFERENCE_MAX_BATCH_SIZE")
+    batch_sizes = [forced_batch] if forced_batch else model_loader.BATCH_BUCKETS
+    is_tflite = artifact_path.endswith(".tflite")
+    if forced_threads or not is_tflite:
+        threads = [forced_threads or _config["threads"] or available_cores()]
+    else:
+        threads = thread_candidates(available_cores())
+
+    if os.getenv("AUTOTUNE", "1") != "1" or (len(threads) == 1 and len(batch_sizes) == 1):
+        _config.update(source="env" if forced_threads or forced_batch else "default",
+                       max_batch_size=batch_sizes[-1])
+        if is_tflite:
+            model_loader.TFLITE_NUM_THREADS = threads[0]
+            _config["threads"] = threads[0]
+        return dict(_config)
+
+    start = time.perf_counter()
+    candidates = []
+    for num_threads in threads:
+        if is_tflite:
+            candidate_model = model_loader.TFLiteModel(
+                artifact_path, num_threads=num_threads, shared_weights=model_loader.TFLITE_SHARED_WEIGHTS,
+                model_content=model_loader.preload_artifact(artifact_path),
+            )
+        else:
+            candidate_model = model
+        for batch_size in batch_sizes:
+            result = measure(candidate_model, batch_size)
+            result["threads"] = num_threads
+            candidates.append(result)
+            logger.info(f"Autotune threads={num_threads} batch={batch_size}: p95 {result['p95_ms']:.1f} ms, "
+                        f"{result['images_per_sec']:.1f} img/s")
+
+    best = choose(candidates, LATENCY_SLO_MS)
+    if is_tflite:
+        model_loader.TFLITE_NUM_THREADS = best["threads"]
+    _config.update(source="autotune", threads=best["threads"], max_batch_size=best["batch_size"],
+                   candidates=candidates, autotune_time_s=time.perf_counter() - start)
+    logger.info(f"Configuration retenue : {best['threads']} threads, batch max {best['batch_size']} "
+                f"({best['images_per_sec']:.1f} img/s, p95 {best['p95_ms']:.1f} ms, SLO {LATENCY_SLO_MS} ms)")
+    return dict(_config)
+
+
+def runtime_config():
+    """
+    Configuration effective exposée par /config. Avant l'import de TensorFlow (début du chargement),
+    les pools de threads ne sont pas encore connus.
+    """
+    tf = sys.modules.get("tensorflow")
+    return dict(
+        _config,
+        cores=available_cores(),
+        onednn=os.getenv("TF_ENABLE_ONEDNN_OPTS", "défaut TensorFlow"),
+        tflite_threads=model_loader.TFLITE_NUM_THREADS,
+        tf_intra_op_threads=tf.config.threading.get_intra_op_parallelism_threads() if tf else None,
+        tf_inter_op_threads=tf.config.threading.get_inter_op_parallelism_threads() if tf else None,
+        batch_buckets=model_loader.BATCH_BUCKETS,
+    )
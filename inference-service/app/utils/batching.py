@@ -0,0 +1,113 @@
+import os
+import threading
+from collections import deque
+
+import numpy as np
+
+from . import metrics
+from . import model_loader
+from .autotune import LATENCY_SLO_MS, runtime_config
+
+# ADAPTIVE_BATCHING=0 : taille max et fenêtre fixes (INFERENCE_MAX_BATCH_SIZE / BATCH_WINDOW_MS)
+ADAPTIVE_BATCHING = os.getenv("ADAPTIVE_BATCHING", "1") == "1"
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "2"))
+MAX_BATCH_WINDOW_MS = float(os.getenv("MAX_BATCH_WINDOW_MS", "20"))
+# Plancher de la fenêtre : les réductions successives ne la font pas tendre vers 0
+MIN_BATCH_WINDOW_MS = float(os.getenv("MIN_BATCH_WINDOW_MS", "0.5"))
+# Nombre de batches entre deux décisions, et facteur de lissage des temps de passe avant
+ADJUST_EVERY = int(os.getenv("BATCH_ADJUST_EVERY", "20"))
+EWMA_ALPHA = 0.2
+
+
+class AdaptiveBatchController:
+    """
+    Règle la taille de batch maximale et la fenêtre de regroupement d'après les mesures :
+    moyenne glissante du temps de passe avant par taille de batch et p95 de la latence
+    (attente en file + passe avant) des dernières requêtes, comparé à LATENCY_SLO_MS.
+    """
+
+    def __init__(self, target_ms=LATENCY_SLO_MS, buckets=None, adaptive=ADAPTIVE_BATCHING):
+        self.target_s = target_ms / 1000
+        self.buckets = sorted(buckets or model_loader.BATCH_BUCKETS)
+        self.adaptive = adaptive
+        self.max_batch = None
+        self.window_s = BATCH_WINDOW_MS / 1000
+        self.forward_ewma = {}
+        self._latencies = deque(maxlen=256)
+        self._fill = deque(maxlen=ADJUST_EVERY)
+        self._batches = 0
+        self._lock = threading.Lock()
+
+    def current_max(self):
+        if self.max_batch is None:
+            # Point de départ : taille retenue par l'autotune du démarrage
+            chosen = runtime_config().get("max_batch_size") or self.buckets[-1]
+            self.max_batch = max((b for b in self.buckets if b <= chosen), default=self.buckets[0])
+            metrics.BATCH_MAX_SIZE.set(self.max_batch)
+            metrics.BATCH_WINDOW_SECONDS.set(self.window_s)
+        return self.max_batch
+
+    def _bucket(self, size):
+        return next((b for b in self.buckets if size <= b), self.buckets[-1])
+
+    def record(self, batch_size, forward_s, latencies_s):
+        """
+        Enregistre un batch exécuté : temps de passe avant et latence de chacune de ses requêtes.
+        """
+        with self._lock:
+            bucket = self._bucket(batch_size)
+            previous = self.forward_ewma.get(bucket)
+            self.forward_ewma[bucket] = forward_s if previous is None else (
+                EWMA_ALPHA * forward_s + (1 - EWMA_ALPHA) * previous)
+            metrics.FORWARD_EWMA_SECONDS.labels(str(bucket)).set(self.forward_ewma[bucket])
+            self._latencies.extend(latencies_s)
+            self._fill.append(batch_size / self.current_max())
+            self._batches += 1
+            if self.adaptive and self._batches % ADJUST_EVERY == 0:
+                self._adjust()
+
+    def _adjust(self):
+        p95 = float(np.percentile(self._latencies, 95))
+        fill = float(np.mean(self._fill))
+        index = self.buckets.index(self.max_batch)
+        decision = "hold"
+
+        if p95 > self.target_s:
+            # Objectif dépassé : batches plus petits et moins d'attente
+            if index > 0:
+                self.max_batch = self.buckets[index - 1]
+                decision = "shrink_batch"
+            elif self.window_s > MIN_BATCH_WINDOW_MS / 1000:
+                decision = "shrink_window"
+            self.window_s = max(self.window_s / 2, MIN_BATCH_WINDOW_MS / 1000)
+        elif fill > 0.8 and index + 1 < len(self.buckets):
+            # Batches pleins (forte charge) : essayer le palier supérieur si son coût estimé tient dans l'objectif
+            larger = self.buckets[index + 1]
+            estimate = self.forward_ewma.get(larger)
+            # Latence estimée : p95 actuel en remplaçant la passe avant courante par celle du palier supérieur
+            if estimate is None or p95 - self.forward_ewma.get(self.max_batch, 0.0) + estimate < self.target_s:
+                self.max_batch = larger
+                decision = "grow_batch"
+        elif fill < 0.5:
+            # Faible charge : attendre plus longtemps ne remplit pas les batches, seulement la latence
+            if self.window_s > MIN_BATCH_WINDOW_MS / 1000:
+                self.window_s = max(self.window_s / 2, MIN_BATCH_WINDOW_MS / 1000)
+                decision = "shrink_window"
+        elif p95 < 0.8 * self.target_s:
+            self.window_s = min(MAX_BATCH_WINDOW_MS / 1000, max(self.window_s * 2, MIN_BATCH_WINDOW_MS / 1000))
+            decision = "grow_window"
+
+        metrics.BATCH_MAX_SIZE.set(self.max_batch)
+        metrics.BATCH_WINDOW_SECONDS.set(self.window_s)
+        metrics.BATCH_DECISIONS.labels(decision).inc()
+
+    def status(self):
+        with self._lock:
+            return {
+                "adaptive": self.adaptive,
+                "target_p95_ms": self.target_s * 1000,
+                "max_batch_size": self.current_max(),
+                "window_ms": self.window_s * 1000,
+                "observed_p95_ms": float(np.percentile(self._latencies, 95) * 1000) if self._latencies else None,
+                "forward_ms_by_batch": {str(b): t * 1000 for b, t in sorted(self.forward_ewma.items())},
+            }
@@ -0,0 +1,71 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Buckets en secondes, de 0,5 ms à 10 s (étapes courtes comme passes avant sur gros batches)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_LATENCY = Histogram(
+    "inference_stage_seconds", "Durée de chaque étape d'une requête d'inférence",
+    ["stage", "model_version"], buckets=LATENCY_BUCKETS,
+)
+QUEUE_WAIT = Histogram(
+    "inference_queue_wait_seconds", "Attente avant exécution de la passe avant",
+    ["model_version"], buckets=LATENCY_BUCKETS,
+)
+REQUEST_LATENCY = Histogram(
+    "inference_request_seconds", "Durée totale des requêtes HTTP",
+    ["endpoint", "status"], buckets=LATENCY_BUCKETS,
+)
+BATCH_SIZE = Histogram(
+    "inference_batch_size", "Nombre d'images par passe avant",
+    ["endpoint", "model_version"], buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+# livesum : somme sur les workers vivants en mode multi-processus (app/serve.py)
+IN_FLIGHT = Gauge("inference_in_flight_requests", "Requêtes en cours de traitement", ["endpoint"],
+                  multiprocess_mode="livesum")
+READY_QUEUE_DEPTH = Gauge("inference_ready_queue_depth", "Tenseurs prêts en attente de l'étage modèle",
+                          multiprocess_mode="livesum")
+BATCH_MAX_SIZE = Gauge("inference_batch_max_size", "Taille de batch maximale choisie par le contrôleur adaptatif",
+                       multiprocess_mode="max")
+BATCH_WINDOW_SECONDS = Gauge("inference_batch_window_seconds", "Fenêtre de regroupement des requêtes",
+                             multiprocess_mode="max")
+FORWARD_EWMA_SECONDS = Gauge("inference_forward_ewma_seconds", "Moyenne glissante de la passe avant par taille de batch",
+                             ["batch_size"], multiprocess_mode="max")
+BATCH_DECISIONS = Counter("inference_batch_decisions_total", "Décisions du contrôleur de batch", ["decision"])
+REQUESTS = Counter("inference_requests_total", "Requêtes de prédiction", ["endpoint", "model_version", "status"])
+DROPPED = Counter("inference_dropped_requests_total",
+                  "Requêtes abandonnées avant la passe avant (échéance dépassée ou client déconnecté)",
+                  ["endpoint", "reason"])
+ADMISSION_LIMIT = Gauge("inference_admission_limit", "Limite de concurrence adaptative", multiprocess_mode="livesum")
+ADMISSION_REJECTED = Counter("inference_admission_rejected_total", "Requêtes refusées par le contrôle d'admission",
+                             ["priority", "status"])
+STARTUP_SECONDS = Gauge("inference_startup_seconds", "Durée des phases du démarrage jusqu'à /ready",
+                        ["phase"], multiprocess_mode="max")
+MODEL_CACHE = Counter("inference_model_cache_total", "Accès aux versions chargées du registre (hit / miss)", ["result"])
+
+
+@contextmanager
+def stage(name, model_version):
+    """
+    Chronomètre une étape (perf_counter + une observation d'histogramme : quelques µs).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(name, model_version).observe(time.perf_counter() - start)
+
+
+def render():
+    """
+    Exposition Prometheus ; en mode multi-processus (PROMETHEUS_MULTIPROC_DIR défini),
+    agrège les valeurs de tous les workers.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
@@ -1,18 +1,206 @@
-from tensorflow.keras.models import load_model
+import numpy as np
+import threading
+import logging
+import time
 import os
 
+logger = logging.getLogger(__name__)
+
+
+def tensorflow():
+    """
+    Import différé de TensorFlow (plusieurs secondes) : absent de l'import de l'application,
+    il a lieu dans le thread de chargement du modèle, pendant que /live répond déjà.
+    """
+    import tensorflow as tf
+    return tf
+
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 
-MODEL_PATH = os.path.join(BASE_DIR, "models", "model.h5")
+
+def resolve_model_path():
+    """
+    Artefact servi : MODEL_PATH s'il est défini (ex. models/model_int8.tflite), sinon
+    models/model.tflite s'il existe (chargement rapide par mmap), sinon models/model.h5.
+    """
+    path = os.getenv("MODEL_PATH")
+    if path:
+        return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
+    tflite_path = os.path.join(BASE_DIR, "models", "model.tflite")
+    if os.path.exists(tflite_path):
+        return tflite_path
+    return os.path.join(BASE_DIR, "models", "model.h5")
+
+
+MODEL_PATH = resolve_model_path()
+
+# Sans les délégués par défaut (XNNPACK), les poids constants restent dans le fichier mappé en mémoire :
+# plusieurs workers partagent alors une seule copie physique via le cache de pages, au prix d'un calcul
+# un peu plus lent. Avec XNNPACK (défaut), les poids sont réorganisés dans le tas de chaque processus.
+TFLITE_SHARED_WEIGHTS = os.getenv("TFLITE_SHARED_WEIGHTS", "0") == "1"
+
+# Threads de l'interpréteur TFLite (fixé par worker en mode multi-processus, cf. app/serve.py)
+TFLITE_NUM_THREADS = int(os.getenv("TFLITE_NUM_THREADS", "0")) or None
+
+# Paliers de taille de batch du chemin compilé : chaque batch est complété jusqu'au palier supérieur
+BATCH_BUCKETS = sorted(int(bs) for bs in os.getenv("BATCH_BUCKETS", "1,8,32").split(",") if bs.strip())
+
+# Tailles de batch préchauffées au démarrage (traçage du graphe, sélection des noyaux oneDNN)
+WARMUP_BATCH_SIZES = [int(bs) for bs in os.getenv("WARMUP_BATCH_SIZES", ",".join(map(str, BATCH_BUCKETS))).split(",")
+                      if bs.strip()]
+
+# COMPILED_INFERENCE=0 revient à model.predict (comparaison, débogage)
+COMPILED_INFERENCE = os.getenv("COMPILED_INFERENCE", "1") == "1"
 
 _model = None
+_load_lock = threading.Lock()
+
+# Artefacts lus une seule fois par le processus parent avant le fork des workers :
+# les pages du buffer sont partagées en copie sur écriture
+_preloaded = {}
+
+
+class TFLiteModel:
+    """
+    Modèle TFLite (ex. int8 élagué/QAT) exposant la même méthode `predict` qu'un modèle Keras.
+    L'interpréteur n'étant pas thread-safe, les appels sont sérialisés.
+    """
+
+    def __init__(self, path, num_threads=None, shared_weights=False, model_content=None):
+        # model_path : le flatbuffer est mappé en mémoire, pas copié.
+        # model_content : buffer préchargé par le parent, référencé sans copie par l'interpréteur.
+        tf = tensorflow()
+        op_resolver = (tf.lite.experimental.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+                       if shared_weights else tf.lite.experimental.OpResolverType.AUTO)
+        if model_content is not None:
+            self.interpreter = tf.lite.Interpreter(
+                model_content=model_content, num_threads=num_threads, experimental_op_resolver_type=op_resolver
+            )
+        else:
+            self.interpreter = tf.lite.Interpreter(
+                model_path=path, num_threads=num_threads, experimental_op_resolver_type=op_resolver
+            )
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self.input_details['shape'][0])
+        self._lock = threading.Lock()
+
+    def _quantize(self, batch):
+        dtype = self.input_details['dtype']
+        if dtype == np.float32:
+            return batch.astype(np.float32)
+        # Entrée entière : appliquer l'échelle / le zéro de quantification
+        scale, zero_point = self.input_details['quantization']
+        return np.round(batch / scale + zero_point).astype(dtype)
+
+    def _dequantize(self, output):
+        if self.output_details['dtype'] == np.float32:
+            return output
+        scale, zero_point = self.output_details['quantization']
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch, verbose=0):
+        with self._lock:
+            if len(batch) != self._batch_size:
+                self.interpreter.resize_tensor_input(self.input_details['index'], batch.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = len(batch)
+            self.interpreter.set_tensor(self.input_details['index'], self._quantize(batch))
+            self.interpreter.invoke()
+            return self._dequantize(self.interpreter.get_tensor(self.output_details['index']).copy())
+
+
+class CompiledModel:
+    """
+    Modèle Keras appelé via une tf.function à signature fixe par palier de batch,
+    au lieu de model.predict qui recrée adaptateur de données, step function et callbacks
+    à chaque appel. Même méthode `predict` qu'un modèle Keras.
+    """
+
+    def __init__(self, model, buckets=None):
+        self.model = model
+        self.buckets = sorted(buckets or BATCH_BUCKETS)
+        input_shape = tuple(model.input_shape[1:])
+        tf = tensorflow()
+        self._functions = {}
+        for bucket in self.buckets:
+            function = tf.function(
+                lambda x: self.model(x, training=False),
+                input_signature=[tf.TensorSpec((bucket, *input_shape), tf.float32)],
+            )
+            self._functions[bucket] = function.get_concrete_function()
+
+    def _bucket(self, size):
+        for bucket in self.buckets:
+            if size <= bucket:
+                return bucket
+        return self.buckets[-1]
+
+    def predict(self, batch, verbose=0):
+        tf = tensorflow()
+        batch = np.asarray(batch, dtype=np.float32)
+        outputs = []
+        # Au-delà du plus grand palier, découper en morceaux de cette taille
+        for start in range(0, len(batch), self.buckets[-1]):
+            chunk = batch[start:start + self.buckets[-1]]
+            bucket = self._bucket(len(chunk))
+            if len(chunk) < bucket:
+                padding = np.zeros((bucket - len(chunk), *chunk.shape[1:]), dtype=np.float32)
+                chunk = np.concatenate([chunk, padding])
+            output = self._functions[bucket](tf.constant(chunk))
+            outputs.append(output.numpy()[:min(bucket, len(batch) - start)])
+        return np.concatenate(outputs)
+
+
+def preload_artifact(path):
+    """
+    Lit un artefact .tflite en mémoire dans le processus parent, avant le fork des workers.
+    Aucun runtime TensorFlow n'est initialisé (le fork resterait sûr).
+    """
+    if path.endswith(".tflite") and path not in _preloaded:
+        with open(path, 'rb') as f:
+            _preloaded[path] = f.read()
+    return _preloaded.get(path)
+
+
+def load_artifact(path):
+    """
+    Charge un artefact : .tflite via l'interpréteur TFLite, sinon Keras puis CompiledModel.
+    """
+    start = time.perf_counter()
+    if path.endswith(".tflite"):
+        model = TFLiteModel(path, num_threads=TFLITE_NUM_THREADS, shared_weights=TFLITE_SHARED_WEIGHTS,
+                            model_content=_preloaded.get(path))
+    else:
+        model = tensorflow().keras.models.load_model(path, compile=False)
+        if COMPILED_INFERENCE:
+            model = CompiledModel(model)
+    logger.info(f"Modèle {path} chargé en {time.perf_counter() - start:.2f}s")
+    return model
 
 
 def load_model_once():
     """
-    Charge le modèle une seule fois et le garde en cache pour les prédictions futures.
+    Charge le modèle MODEL_PATH une seule fois et le garde en cache pour les prédictions futures.
     """
     global _model
-    if _model is None:
-        _model = load_model(MODEL_PATH)
+    with _load_lock:
+        if _model is None:
+            _model = load_artifact(MODEL_PATH)
     return _model
+
+
+def warm_up(model, batch_sizes=None, input_shape=None):
+    """
+    Exécute des batches factices à chaque taille configurée : le premier vrai appel
+    ne paie plus le traçage du graphe ni la sélection des noyaux.
+    """
+    from .preprocess import IMG_SIZE
+    input_shape = input_shape or (*IMG_SIZE, 3)
+    # Du plus grand au plus petit : l'interpréteur TFLite reste dimensionné pour le batch 1 des requêtes
+    for batch_size in sorted(batch_sizes or WARMUP_BATCH_SIZES, reverse=True):
+        start = time.perf_counter()
+        model.predict(np.zeros((batch_size, *input_shape), dtype=np.float32), verbose=0)
+        logger.info(f"Préchauffage batch {batch_size} : {(time.perf_counter() - start) * 1000:.0f} ms")
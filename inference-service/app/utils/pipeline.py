@@ -0,0 +1,214 @@
+import os
+import time
+import asyncio
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import metrics
+from .batching import AdaptiveBatchController
+
+logger = logging.getLogger(__name__)
+
+# Étage décodage + prétraitement : PIL libère le GIL pendant le décodage et le redimensionnement
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Étage modèle : passes avant (calcul intensif, threads intra-op du runtime)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+# File bornée de tenseurs prêts entre les deux étages (contre-pression sur le prétraitement)
+READY_QUEUE_SIZE = int(os.getenv("READY_QUEUE_SIZE", "64"))
+# En-tête du budget de temps restant (ms) transmis par la passerelle
+TIMEOUT_HEADER = "X-Request-Timeout-Ms"
+
+# Tenseur prêt en attente de la passe avant : `deadline` (perf_counter) et `request` servent
+# à abandonner les requêtes expirées ou dont le client s'est déconnecté
+ReadyItem = namedtuple("ReadyItem", ["served", "endpoint", "batch", "future", "enqueued", "deadline", "request"])
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+def deadline_from(timeout_ms):
+    """
+    Échéance locale (perf_counter) à partir du budget restant annoncé par l'appelant, None sans budget.
+    Un budget relatif évite de dépendre de l'horloge des autres conteneurs.
+    """
+    if not timeout_ms:
+        return None
+    try:
+        return time.perf_counter() + float(timeout_ms) / 1000
+    except ValueError:
+        return None
+
+
+def expired(deadline):
+    return deadline is not None and time.perf_counter() >= deadline
+
+
+class InferencePipeline:
+    """
+    Pipeline décodage/prétraitement -> file bornée de tenseurs prêts -> passe avant.
+    Chaque étage a son propre pool : le décodage des requêtes suivantes se fait pendant
+    la passe avant de la requête courante. L'étage modèle regroupe les tenseurs prêts
+    en batches dont la taille et la fenêtre sont réglées par AdaptiveBatchController.
+    """
+
+    def __init__(self, preprocess_workers=PREPROCESS_WORKERS, inference_workers=INFERENCE_WORKERS,
+                 queue_size=READY_QUEUE_SIZE):
+        self.preprocess_pool = ThreadPoolExecutor(max_workers=preprocess_workers, thread_name_prefix="preprocess")
+        self.inference_pool = ThreadPoolExecutor(max_workers=inference_workers, thread_name_prefix="inference")
+        self.preprocess_workers = preprocess_workers
+        self.inference_workers = inference_workers
+        self.queue_size = queue_size
+        self.controller = AdaptiveBatchController()
+        self._queue = None
+        self._tasks = []
+
+    async def start(self):
+        """
+        Démarre les consommateurs de l'étage modèle (un par thread du pool d'inférence).
+        """
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._model_stage()) for _ in range(self.inference_workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def infer(self, served, endpoint, prepare, *args, deadline=None, request=None):
+        """
+        Prépare le tenseur avec `prepare(*args)` dans le pool de prétraitement, le place dans
+        la file des tenseurs prêts et attend la sortie du modèle. Une requête expirée ou dont
+        le client (`request`) s'est déconnecté est abandonnée avant le décodage et avant la passe avant.
+        """
+        await self._check(endpoint, deadline, request)
+        batch = await asyncio.get_running_loop().run_in_executor(self.preprocess_pool, prepare, *args)
+        future = await self._enqueue(served, endpoint, batch, deadline, request)
+        return await future
+
+    async def submit(self, served, endpoint, batch, deadline=None, request=None):
+        """
+        Place un tenseur déjà prêt dans la file et renvoie sans l'attendre la future de sa sortie :
+        une requête en plusieurs batches (tuiles) prépare le suivant pendant la passe avant du courant.
+        """
+        await self._check(endpoint, deadline, request)
+        return await self._enqueue(served, endpoint, batch, deadline, request)
+
+    async def _enqueue(self, served, endpoint, batch, deadline, request):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(ReadyItem(served, endpoint, batch, future, time.perf_counter(), deadline, request))
+        metrics.READY_QUEUE_DEPTH.set(self._queue.qsize())
+        return future
+
+    async def _check(self, endpoint, deadline, request):
+        if expired(deadline):
+            metrics.DROPPED.labels(endpoint, "deadline").inc()
+            raise DeadlineExceeded("Échéance de la requête dépassée")
+        if request is not None and await request.is_disconnected():
+            metrics.DROPPED.labels(endpoint, "disconnected").inc()
+            raise ClientDisconnected("Client déconnecté")
+
+    async def _keep(self, item):
+        """
+        Vrai si la requête attend encore son résultat ; sinon sa future reçoit l'erreur d'abandon.
+        """
+        if item.future.cancelled():
+            return False
+        try:
+            await self._check(item.endpoint, item.deadline, item.request)
+        except (DeadlineExceeded, ClientDisconnected) as e:
+            item.future.set_exception(e)
+            return False
+        return True
+
+    async def _next_batch(self, carry):
+        """
+        Regroupe les tenseurs prêts d'une même version de modèle (même dtype et même forme d'image)
+        jusqu'à la taille maximale ou l'expiration de la fenêtre. Un tenseur incompatible est reporté.
+        """
+        first = carry or await self._queue.get()
+        items, size, carry = [first], len(first.batch), None
+        max_batch = self.controller.current_max()
+        deadline = time.perf_counter() + self.controller.window_s
+        while size < max_batch:
+            try:
+                if self._queue.empty():
+                    timeout = deadline - time.perf_counter()
+                    if timeout <= 0:
+                        break
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                else:
+                    item = self._queue.get_nowait()
+            except asyncio.TimeoutError:
+                break
+            compatible = (item.served is first.served and item.batch.dtype == first.batch.dtype
+                          and item.batch.shape[1:] == first.batch.shape[1:])
+            if not compatible or size + len(item.batch) > max_batch:
+                carry = item
+                break
+            items.append(item)
+            size += len(item.batch)
+        metrics.READY_QUEUE_DEPTH.set(self._queue.qsize())
+        # Dernier contrôle avant la passe avant : échéances et déconnexions survenues pendant l'attente
+        return [item for item in items if await self._keep(item)], carry
+
+    async def _model_stage(self):
+        loop = asyncio.get_running_loop()
+        carry = None
+        while True:
+            items, carry = await self._next_batch(carry)
+            if not items:
+                continue
+            served = items[0].served
+            batch = np.concatenate([item.batch for item in items]) if len(items) > 1 else items[0].batch
+            for endpoint in {item.endpoint for item in items}:
+                metrics.BATCH_SIZE.labels(endpoint, served.version).observe(len(batch))
+
+            def run():
+                started = time.perf_counter()
+                for item in items:
+                    metrics.QUEUE_WAIT.labels(served.version).observe(started - item.enqueued)
+                try:
+                    return served.model.predict(batch, verbose=0), time.perf_counter() - started
+                finally:
+                    metrics.STAGE_LATENCY.labels("forward", served.version).observe(time.perf_counter() - started)
+
+            try:
+                output, forward_s = await loop.run_in_executor(self.inference_pool, run)
+            except Exception as e:
+                for item in items:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                continue
+
+            # Redistribuer les sorties du batch commun à chaque requête
+            done = time.perf_counter()
+            self.controller.record(len(batch), forward_s, [done - item.enqueued for item in items])
+            offset = 0
+            for item in items:
+                count = len(item.batch)
+                if item.request is not None:
+                    # Attente en file + passe avant, lue par le contrôle d'admission (sans l'envoi du corps)
+                    item.request.state.model_latency_s = done - item.enqueued
+                if not item.future.done():
+                    item.future.set_result(output[offset:offset + count])
+                offset += count
+
+    def status(self):
+        return {
+            "preprocess_workers": self.preprocess_workers,
+            "inference_workers": self.inference_workers,
+            "ready_queue_size": self.queue_size,
+            "ready_queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batching": self.controller.status(),
+        }
+
+
+pipeline = InferencePipeline()
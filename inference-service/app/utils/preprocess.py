@@ -1,15 +1,32 @@
 import numpy as np
-from PIL import Image
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # PIL n'est importé qu'à l'ouverture de la première image (app/route/route.py)
+    from PIL import Image
 
 IMG_SIZE = (128, 128)
 
-def preprocess_image(image: Image.Image):
+def preprocess_image(image: "Image.Image"):
     """
     Prétraite l'image pour l'inférence : conversion RGB, redimensionnement,
     normalisation et ajout d'une dimension de batch.
     """
     image = image.convert("RGB")
     image = image.resize(IMG_SIZE)
-    image = np.array(image) / 255.0
-    image = np.expand_dims(image, axis=0)
-    return image
+    # float32 dès la normalisation : dtype d'entrée du modèle, sans copie float64 intermédiaire
+    return (np.asarray(image, dtype=np.float32) / 255.0)[None]
+
+
+def tta_batch(image_array):
+    """
+    Construit en un seul batch les 8 transformations du carré (identité, rotations de 90°,
+    180°, 270° et leurs miroirs horizontaux) d'une image prétraitée de forme (1, H, W, 3).
+    """
+    image = image_array[0]
+    views = []
+    for k in range(4):
+        rotated = np.rot90(image, k=k, axes=(0, 1))
+        views.append(rotated)
+        views.append(np.fliplr(rotated))
+    return np.stack(views).astype(np.float32)
@@ -0,0 +1,364 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import datetime
+import threading
+from collections import OrderedDict
+
+from .model_loader import BASE_DIR, MODEL_PATH, load_artifact, warm_up
+from .metrics import MODEL_CACHE
+from .autotune import autotune, configure_threads
+from . import model_loader, startup
+
+logger = logging.getLogger(__name__)
+
+# Registre local : un sous-dossier par version (artefact + classes.json + metadata.json)
+# et un fichier CURRENT contenant la version active
+REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", os.path.join(BASE_DIR, "models", "registry"))
+if not os.path.isabs(REGISTRY_DIR):
+    REGISTRY_DIR = os.path.join(BASE_DIR, REGISTRY_DIR)
+
+# Budget mémoire pour les versions chargées simultanément (la version active n'est jamais évincée)
+MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "2048"))
+
+# Intervalle de surveillance de CURRENT pour le rechargement à chaud (0 = désactivé)
+POLL_SECONDS = float(os.getenv("MODEL_REGISTRY_POLL_SECONDS", "5"))
+
+# Version utilisée hors registre (MODEL_PATH + models/classes.json)
+DEFAULT_VERSION = "default"
+DEFAULT_CLASS_NAMES = ["Positive", "Negative"]
+
+
+def sha256sum(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_class_names(classes_path):
+    """
+    Liste [label_0, label_1] à partir de classes.json ({"0": "Cancer", "1": "Negative"}).
+    """
+    try:
+        if os.path.exists(classes_path):
+            with open(classes_path, 'r') as f:
+                labels = json.load(f)
+            return [labels[str(i)] for i in sorted(map(int, labels.keys()))]
+    except Exception as e:
+        logger.error(f"Erreur lors du chargement des classes: {e}")
+    return list(DEFAULT_CLASS_NAMES)
+
+
+def read_current(registry_dir=REGISTRY_DIR):
+    path = os.path.join(registry_dir, "CURRENT")
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return f.read().strip() or None
+
+
+def write_current(version, registry_dir=REGISTRY_DIR):
+    """
+    Met à jour CURRENT de façon atomique (écriture dans un fichier temporaire puis os.replace).
+    """
+    tmp_path = os.path.join(registry_dir, ".CURRENT.tmp")
+    with open(tmp_path, 'w') as f:
+        f.write(version + "\n")
+    os.replace(tmp_path, os.path.join(registry_dir, "CURRENT"))
+
+
+def list_versions(registry_dir=REGISTRY_DIR):
+    if not os.path.isdir(registry_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(registry_dir)
+        if not name.startswith(".") and os.path.exists(os.path.join(registry_dir, name, "metadata.json"))
+    )
+
+
+def read_metadata(version, registry_dir=REGISTRY_DIR):
+    with open(os.path.join(registry_dir, version, "metadata.json"), 'r') as f:
+        return json.load(f)
+
+
+def publish(artifact_path, classes_path, version=None, activate=False, metadata=None, registry_dir=REGISTRY_DIR):
+    """
+    Ajoute un artefact au registre : copie dans un dossier temporaire, calcul du checksum,
+    puis renommage atomique. Avec `activate`, la version devient active (rechargement à chaud).
+    """
+    version = version or datetime.datetime.now().strftime("v%Y%m%d-%H%M%S")
+    target_dir = os.path.join(registry_dir, version)
+    if os.path.exists(target_dir):
+        raise FileExistsError(f"La version {version} existe déjà dans {registry_dir}")
+
+    tmp_dir = os.path.join(registry_dir, f".{version}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    artifact_name = os.path.basename(artifact_path)
+    shutil.copy2(artifact_path, os.path.join(tmp_dir, artifact_name))
+    shutil.copy2(classes_path, os.path.join(tmp_dir, "classes.json"))
+
+    info = {
+        "version": version,
+        "artifact": artifact_name,
+        "sha256": sha256sum(artifact_path),
+        "size_bytes": os.path.getsize(artifact_path),
+        "created_at": datetime.datetime.now().isoformat(),
+    }
+    # Métriques d'entraînement / d'évaluation produites à côté de l'artefact
+    metrics_path = os.path.join(os.path.dirname(artifact_path), "metrics.json")
+    if os.path.exists(metrics_path):
+        with open(metrics_path, 'r') as f:
+            info["metrics"] = json.load(f)
+    info.update(metadata or {})
+    with open(os.path.join(tmp_dir, "metadata.json"), 'w') as f:
+        json.dump(info, f, indent=2)
+
+    os.rename(tmp_dir, target_dir)
+    logger.info(f"Version {version} publiée dans {registry_dir}")
+    if activate:
+        write_current(version, registry_dir)
+    return version
+
+
+class LoadedModel:
+    """
+    Une version chargée et préchauffée. Une requête garde sa référence jusqu'à la fin :
+    une bascule ou une éviction ne l'interrompt pas, la mémoire est libérée ensuite.
+    """
+
+    def __init__(self, version, model, class_names, size_bytes, metadata):
+        self.version = version
+        self.model = model
+        self.class_names = class_names
+        self.size_bytes = size_bytes
+        self.metadata = metadata
+
+
+class ModelRegistry:
+    """
+    Versions chargées (LRU sous budget mémoire) et pointeur vers la version active.
+    Sans registre sur disque, sert MODEL_PATH sous la version "default".
+    """
+
+    def __init__(self, registry_dir=REGISTRY_DIR, memory_budget_mb=MEMORY_BUDGET_MB):
+        self.registry_dir = registry_dir
+        self.memory_budget_bytes = memory_budget_mb * 1e6
+        self.active_version = None
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def has_registry(self):
+        return bool(list_versions(self.registry_dir))
+
+    def current_version(self):
+        if not self.has_registry():
+            return DEFAULT_VERSION
+        return read_current(self.registry_dir) or list_versions(self.registry_dir)[-1]
+
+    def available_versions(self):
+        return list_versions(self.registry_dir) if self.has_registry() else [DEFAULT_VERSION]
+
+    def locate(self, version):
+        """
+        (chemin de l'artefact, chemin de classes.json, métadonnées) d'une version. KeyError si inconnue.
+        """
+        if version == DEFAULT_VERSION and not self.has_registry():
+            metadata = {"version": DEFAULT_VERSION, "artifact": os.path.basename(MODEL_PATH)}
+            return MODEL_PATH, os.path.join(BASE_DIR, "models", "classes.json"), metadata
+        if version not in list_versions(self.registry_dir):
+            raise KeyError(version)
+        version_dir = os.path.join(self.registry_dir, version)
+        metadata = read_metadata(version, self.registry_dir)
+        return os.path.join(version_dir, metadata["artifact"]), os.path.join(version_dir, "classes.json"), metadata
+
+    def _load(self, version):
+        artifact_path, classes_path, metadata = self.locate(version)
+        if "sha256" in metadata:
+            checksum = sha256sum(artifact_path)
+            if checksum != metadata["sha256"]:
+                raise ValueError(f"Checksum invalide pour la version {version} : {checksum} != {metadata['sha256']}")
+
+        with startup.phase("model_load"):
+            model = load_artifact(artifact_path)
+        start = time.perf_counter()
+        with startup.phase("warm_up"):
+            warm_up(model)
+        logger.info(f"Version {version} préchauffée en {time.perf_counter() - start:.2f}s")
+        return LoadedModel(version, model, read_class_names(classes_path),
+                           os.path.getsize(artifact_path), metadata)
+
+    def _evict(self):
+        """
+        Décharge les versions les moins récemment utilisées au-delà du budget mémoire.
+        """
+        used = sum(entry.size_bytes for entry in self._loaded.values())
+        for version in list(self._loaded):
+            if used <= self.memory_budget_bytes:
+                break
+            if version == self.active_version:
+                continue
+            used -= self._loaded.pop(version).size_bytes
+            logger.info(f"Version {version} déchargée (budget mémoire {self.memory_budget_bytes / 1e6:.0f} Mo)")
+
+    def get(self, version=None):
+        """
+        Version demandée (ou active), chargée à la demande. KeyError si elle n'existe pas.
+        """
+        version = version or self.active_version or self.current_version()
+        with self._lock:
+            entry = self._loaded.get(version)
+            if entry is not None:
+                self._loaded.move_to_end(version)
+                MODEL_CACHE.labels("hit").inc()
+                return entry
+        MODEL_CACHE.labels("miss").inc()
+        with self._load_lock:
+            with self._lock:
+                entry = self._loaded.get(version)
+            if entry is None:
+                entry = self._load(version)
+                with self._lock:
+                    self._loaded[version] = entry
+                    self._evict()
+            return entry
+
+    def activate(self, version):
+        """
+        Bascule à chaud : la nouvelle version est chargée et préchauffée avant que le pointeur
+        actif ne change. Les requêtes en cours terminent sur l'ancienne version.
+        """
+        entry = self.get(version)
+        with self._lock:
+            previous = self.active_version
+            self.active_version = version
+            self._evict()
+        if self.has_registry() and read_current(self.registry_dir) != version:
+            write_current(version, self.registry_dir)
+        if previous != version:
+            logger.info(f"Version active : {previous} -> {version}")
+        return entry
+
+    def refresh(self):
+        """
+        Active la version désignée par CURRENT si elle a changé (ex. après un publish --activate).
+        """
+        version = self.current_version()
+        if version != self.active_version:
+            self.activate(version)
+
+    def watch(self, interval=POLL_SECONDS):
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(f"Échec du rechargement du registre: {e}", exc_info=True)
+        threading.Thread(target=loop, name="model-registry-watch", daemon=True).start()
+
+    def status(self):
+        with self._lock:
+            loaded = [
+                {"version": entry.version, "size_mb": entry.size_bytes / 1e6, "artifact": entry.metadata.get("artifact")}
+                for entry in self._loaded.values()
+            ]
+        return {
+            "active_version": self.active_version,
+            "available_versions": self.available_versions(),
+            "loaded_versions": loaded,
+            "memory_budget_mb": self.memory_budget_bytes / 1e6,
+        }
+
+
+registry = ModelRegistry()
+
+_ready = threading.Event()
+_status = {"state": "starting", "error": None, "warmup_time_s": None}
+
+
+def load_and_warm_up():
+    """
+    Réglage des threads, autotune, chargement + préchauffage de la version active, en arrière-plan au démarrage.
+    Le service n'est déclaré prêt (/ready) qu'une fois terminé ; la surveillance du registre démarre ensuite.
+    """
+    try:
+        _status["state"] = "loading"
+        start = time.perf_counter()
+        version = registry.current_version()
+        artifact_path, _, _ = registry.locate(version)
+        with startup.phase("heavy_imports"):
+            # Imports différés hors de l'import de l'application : TensorFlow, et PIL pour la première image
+            model_loader.tensorflow()
+            import PIL.Image  # noqa: F401
+        configure_threads()
+        if artifact_path.endswith(".tflite"):
+            # Threads TFLite choisis avant le chargement de la version active
+            _status["state"] = "autotuning"
+            with startup.phase("autotune"):
+                autotune(artifact_path)
+            registry.activate(version)
+        else:
+            registry.activate(version)
+            _status["state"] = "autotuning"
+            with startup.phase("autotune"):
+                autotune(artifact_path, registry.get(version).model)
+        _status["warmup_time_s"] = time.perf_counter() - start
+        startup.finish()
+        _status["state"] = "ready"
+        _ready.set()
+        logger.info(f"Service prêt (version {registry.active_version}, {_status['warmup_time_s']:.2f}s)")
+        if POLL_SECONDS > 0:
+            registry.watch()
+    except Exception as e:
+        _status["state"] = "failed"
+        _status["error"] = str(e)
+        logger.error(f"Échec du chargement du modèle: {e}", exc_info=True)
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def model_status():
+    return dict(_status, model=registry.active_version)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Registre local des modèles du service d'inférence")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    publish_parser = subparsers.add_parser("publish", help="Ajouter un artefact au registre")
+    publish_parser.add_argument("artifact", type=str, help="Artefact (.h5 ou .tflite)")
+    publish_parser.add_argument("--classes", type=str, default=None, help="classes.json (défaut : à côté de l'artefact)")
+    publish_parser.add_argument("--version", type=str, default=None, help="Nom de version (défaut : horodatage)")
+    publish_parser.add_argument("--activate", action="store_true", help="Rendre la version active")
+
+    activate_parser = subparsers.add_parser("activate", help="Changer la version active")
+    activate_parser.add_argument("version", type=str)
+
+    subparsers.add_parser("list", help="Lister les versions")
+    args = parser.parse_args()
+
+    os.makedirs(REGISTRY_DIR, exist_ok=True)
+    if args.command == "publish":
+        classes = args.classes or os.path.join(os.path.dirname(args.artifact), "classes.json")
+        print(publish(args.artifact, classes, args.version, activate=args.activate))
+    elif args.command == "activate":
+        if args.version not in list_versions():
+            sys.exit(f"Version inconnue : {args.version}")
+        write_current(args.version)
+    else:
+        current = read_current()
+        for name in list_versions():
+            meta = read_metadata(name)
+            marker = "*" if name == current else " "
+            print(f"{marker} {name}  {meta['artifact']}  {meta['sha256'][:12]}  {meta['created_at']}")
@@ -0,0 +1,47 @@
+import time
+
+# Origine des mesures : ce module est importé en premier par app/main.py, avant FastAPI et le reste de l'application
+STARTED = time.perf_counter()
+
+import logging
+from contextlib import contextmanager
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Durée (s) de chaque phase du démarrage, jusqu'à ce que le service soit prêt
+_phases = {}
+_finished = False
+
+
+def record(name, seconds):
+    if _finished:
+        return
+    _phases[name] = round(seconds, 3)
+    metrics.STARTUP_SECONDS.labels(name).set(seconds)
+    logger.info(f"Démarrage : {name} en {seconds:.2f}s")
+
+
+@contextmanager
+def phase(name):
+    """
+    Chronomètre une phase du démarrage (imports, chargement du modèle, préchauffage...).
+    Sans effet une fois le service prêt : les rechargements du registre ne sont pas comptés.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def finish():
+    global _finished
+    record("total", time.perf_counter() - STARTED)
+    _finished = True
+    logger.info("Démarrage : " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in _phases.items()))
+
+
+def summary():
+    return dict(_phases)
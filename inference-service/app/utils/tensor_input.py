@@ -0,0 +1,115 @@
+import os
+import ast
+import struct
+
+import numpy as np
+
+from .preprocess import IMG_SIZE
+
+# Nombre maximal d'images par requête tenseur
+MAX_TENSOR_BATCH = int(os.getenv("MAX_TENSOR_BATCH", "256"))
+
+ALLOWED_DTYPES = {"uint8": np.dtype("uint8"), "float32": np.dtype("<f4")}
+
+NPY_MAGIC = b"\x93NUMPY"
+# En-tête .npy le plus long accepté (quelques centaines d'octets en pratique, aligné sur 64)
+MAX_NPY_HEADER = 4096
+
+
+class TensorFormatError(ValueError):
+    pass
+
+
+def parse_shape(value):
+    try:
+        return tuple(int(dim) for dim in value.replace("x", ",").split(",") if dim.strip())
+    except ValueError:
+        raise TensorFormatError(f"Forme invalide : {value}") from None
+
+
+def validate(shape, dtype, payload_size=None):
+    """
+    Vérifie forme, type et taille annoncés avant toute allocation.
+    Formes acceptées : (H, W, 3) ou (N, H, W, 3) avec (H, W) = IMG_SIZE.
+    Sans `payload_size`, seules la forme et le type sont vérifiés (avant la lecture du corps).
+    """
+    if dtype not in ALLOWED_DTYPES.values():
+        raise TensorFormatError(f"Type non supporté : {dtype} (uint8 ou float32 little-endian)")
+    if len(shape) == 3:
+        shape = (1, *shape)
+    if len(shape) != 4 or tuple(shape[1:]) != (*IMG_SIZE, 3):
+        raise TensorFormatError(f"Forme {shape} invalide, attendu (N, {IMG_SIZE[0]}, {IMG_SIZE[1]}, 3)")
+    if not 1 <= shape[0] <= MAX_TENSOR_BATCH:
+        raise TensorFormatError(f"Batch de {shape[0]} images, maximum {MAX_TENSOR_BATCH}")
+    expected = int(np.prod(shape)) * dtype.itemsize
+    if payload_size is not None and payload_size != expected:
+        raise TensorFormatError(f"Taille des données {payload_size} octets, attendu {expected}")
+    return shape
+
+
+def parse_npy_header(body):
+    """
+    Lit l'en-tête d'un fichier .npy (versions 1 à 3) : (dtype, forme, offset des données).
+    """
+    if body[:6] != NPY_MAGIC or len(body) < 10:
+        raise TensorFormatError("En-tête .npy invalide")
+    major = body[6]
+    if major == 1:
+        header_len, start = struct.unpack("<H", body[8:10])[0], 10
+    elif major in (2, 3):
+        header_len, start = struct.unpack("<I", body[8:12])[0], 12
+    else:
+        raise TensorFormatError(f"Version .npy {major} non supportée")
+    if header_len > MAX_NPY_HEADER or start + header_len > len(body):
+        raise TensorFormatError("En-tête .npy invalide")
+    try:
+        header = ast.literal_eval(body[start:start + header_len].decode("latin1"))
+        dtype = np.dtype(header["descr"])
+        shape = tuple(header["shape"])
+        fortran_order = header["fortran_order"]
+    except Exception:
+        raise TensorFormatError("En-tête .npy illisible") from None
+    if fortran_order:
+        raise TensorFormatError("Ordre Fortran non supporté")
+    return dtype, shape, start + header_len
+
+
+def raw_format(shape_header, dtype_header):
+    """
+    (forme, dtype) d'un tenseur brut depuis les en-têtes X-Tensor-Shape / X-Tensor-Dtype.
+    """
+    if not shape_header:
+        raise TensorFormatError("En-tête X-Tensor-Shape requis pour un tenseur brut")
+    dtype = ALLOWED_DTYPES.get((dtype_header or "uint8").lower())
+    if dtype is None:
+        raise TensorFormatError(f"Type non supporté : {dtype_header} (uint8 ou float32)")
+    return parse_shape(shape_header), dtype
+
+
+def max_payload_size(content_type, shape_header=None, dtype_header=None):
+    """
+    Taille maximale (octets) d'un corps valide, connue avant sa lecture : taille exacte d'un
+    tenseur brut dont la forme annoncée est valide, plus grand batch float32 + en-tête pour un .npy.
+    """
+    if content_type.startswith("application/x-npy") or not shape_header:
+        return MAX_NPY_HEADER + MAX_TENSOR_BATCH * IMG_SIZE[0] * IMG_SIZE[1] * 3 * ALLOWED_DTYPES["float32"].itemsize
+    shape, dtype = raw_format(shape_header, dtype_header)
+    return int(np.prod(validate(shape, dtype))) * dtype.itemsize
+
+
+def decode_tensor(body, content_type, shape_header=None, dtype_header=None):
+    """
+    Interprète sans copie (np.frombuffer) un tenseur .npy ou brut et le met au format du modèle.
+    Brut (application/octet-stream) : forme et type dans les en-têtes X-Tensor-Shape / X-Tensor-Dtype.
+    """
+    if content_type.startswith("application/x-npy") or body[:6] == NPY_MAGIC:
+        dtype, shape, offset = parse_npy_header(body)
+    else:
+        (shape, dtype), offset = raw_format(shape_header, dtype_header), 0
+
+    shape = validate(shape, dtype, len(body) - offset)
+    batch = np.frombuffer(body, dtype=dtype, offset=offset).reshape(shape)
+    if dtype == np.uint8:
+        # Même normalisation que preprocess_image
+        return batch.astype(np.float32) / 255.0
+    return batch
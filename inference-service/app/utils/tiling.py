@@ -0,0 +1,126 @@
+import os
+import asyncio
+
+import numpy as np
+from typing import TYPE_CHECKING
+
+from .preprocess import IMG_SIZE
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+# Fenêtre glissante : taille des tuiles (pixels de l'image d'origine) et pas (< taille = recouvrement)
+TILE_SIZE = int(os.getenv("TILE_SIZE", "128"))
+TILE_STRIDE = int(os.getenv("TILE_STRIDE", "96"))
+# Borne de tile_size demandé par le client : une bande de tuiles (largeur de l'image x tile_size, float32)
+# est allouée par rangée, une tuile de la taille de l'image annulerait la mémoire bornée
+MAX_TILE_SIZE = int(os.getenv("MAX_TILE_SIZE", "1024"))
+TILE_BATCH_SIZE = int(os.getenv("TILE_BATCH_SIZE", "32"))
+# Batches de tuiles d'une même image en file à la fois : le découpage du suivant se fait pendant
+# la passe avant du courant, sans monopoliser la file devant les autres requêtes
+TILE_IN_FLIGHT = int(os.getenv("TILE_IN_FLIGHT", "2"))
+
+# Une tuile est du fond si moins de TILE_TISSUE_FRACTION de ses pixels dépassent TILE_TISSUE_INTENSITY
+TILE_TISSUE_INTENSITY = float(os.getenv("TILE_TISSUE_INTENSITY", "0.1"))
+TILE_TISSUE_FRACTION = float(os.getenv("TILE_TISSUE_FRACTION", "0.1"))
+
+
+def tile_positions(length, tile, stride):
+    """
+    Positions de départ couvrant [0, length) ; la dernière tuile est calée sur le bord.
+    Une image plus petite qu'une tuile donne une seule tuile (complétée en noir par crop).
+    """
+    if length <= tile:
+        return [0]
+    positions = list(range(0, length - tile + 1, stride))
+    if positions[-1] + tile < length:
+        positions.append(length - tile)
+    return positions
+
+
+def iter_tile_rows(image, tile_size=TILE_SIZE, stride=TILE_STRIDE):
+    """
+    Parcourt l'image rangée par rangée : seule une bande de hauteur `tile_size` est convertie
+    en tableau à la fois, la mémoire reste bornée quelle que soit la taille de l'image.
+    Produit (index de rangée, tuiles (n, H, W, 3) au format du modèle).
+    """
+    width, height = image.size
+    xs = tile_positions(width, tile_size, stride)
+    scale = IMG_SIZE[0] / tile_size
+    # Image plus étroite qu'une tuile : complétée en noir à droite comme en bas, sans étirement
+    crop_width = max(width, tile_size)
+    strip_width = max(IMG_SIZE[1], int(round(crop_width * scale)))
+    for row, y in enumerate(tile_positions(height, tile_size, stride)):
+        strip = image.crop((0, y, crop_width, y + tile_size)).convert("RGB")
+        if scale != 1:
+            strip = strip.resize((strip_width, IMG_SIZE[0]))
+        strip = np.asarray(strip, dtype=np.float32) / 255.0
+        starts = [min(int(round(x * scale)), strip_width - IMG_SIZE[1]) for x in xs]
+        yield row, np.stack([strip[:, x:x + IMG_SIZE[1]] for x in starts])
+
+
+def tissue_mask(tiles):
+    """
+    Test vectorisé et peu coûteux : proportion de pixels non noirs par tuile.
+    """
+    bright = tiles.mean(axis=-1) > TILE_TISSUE_INTENSITY
+    return bright.mean(axis=(1, 2)) >= TILE_TISSUE_FRACTION
+
+
+async def tiled_predict(pipeline, served, image: "Image.Image", tile_size=TILE_SIZE, stride=TILE_STRIDE,
+                        batch_size=TILE_BATCH_SIZE, deadline=None, request=None):
+    """
+    Inférence par fenêtre glissante : les tuiles de fond sont ignorées, les autres
+    sont évaluées par batches. Retourne la carte des probabilités brutes du modèle
+    (rangées x colonnes, NaN pour le fond).
+
+    Le découpage (et le décodage, à la première rangée d'une image ouverte sans load())
+    a lieu dans le pool de prétraitement ; chaque batch passe par la file du pipeline,
+    où il est regroupé avec les autres requêtes au lieu d'occuper seul l'étage modèle.
+    """
+    width, height = image.size
+    rows = len(tile_positions(height, tile_size, stride))
+    cols = len(tile_positions(width, tile_size, stride))
+    probability_map = np.full((rows, cols), np.nan, dtype=np.float32)
+    tile_rows = iter_tile_rows(image, tile_size, stride)
+
+    def next_batch():
+        # Rangées suivantes jusqu'à `batch_size` tuiles de tissu (None en fin d'image)
+        pending, coords = [], []
+        for row, tiles in tile_rows:
+            keep = np.flatnonzero(tissue_mask(tiles))
+            if len(keep):
+                pending.append(tiles[keep])
+                coords.extend((row, col) for col in keep)
+            if len(coords) >= batch_size:
+                break
+        return (np.concatenate(pending) if pending else None), coords
+
+    def fill(coords, outputs):
+        for (row, col), probability in zip(coords, np.asarray(outputs).reshape(-1)):
+            probability_map[row, col] = probability
+
+    loop = asyncio.get_running_loop()
+    in_flight = []
+    try:
+        while True:
+            batch, coords = await loop.run_in_executor(pipeline.preprocess_pool, next_batch)
+            if batch is None:
+                break
+            in_flight.append((coords, await pipeline.submit(served, "predict_tiled", batch,
+                                                            deadline=deadline, request=request)))
+            if len(in_flight) >= TILE_IN_FLIGHT:
+                coords, future = in_flight.pop(0)
+                fill(coords, await future)
+        for coords, future in in_flight:
+            fill(coords, await future)
+    except BaseException:
+        # Abandon (échéance, déconnexion, erreur) : les batches encore en file sont ignorés par l'étage modèle
+        for _, future in in_flight:
+            if future.done() and not future.cancelled():
+                future.exception()  # erreur déjà reçue : marquée comme lue
+            else:
+                future.cancel()
+        raise
+
+    return probability_map
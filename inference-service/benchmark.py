@@ -0,0 +1,58 @@
+import os
+import time
+import argparse
+
+import numpy as np
+import tensorflow as tf
+
+from app.utils.model_loader import MODEL_PATH, BATCH_BUCKETS, CompiledModel
+from app.utils.preprocess import IMG_SIZE
+
+
+def time_calls(predict_fn, batch, iterations, warmup=5):
+    for _ in range(warmup):
+        predict_fn(batch)
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        predict_fn(batch)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 95)
+
+
+def trivial_model(input_shape):
+    """
+    Modèle quasi vide : le temps mesuré est presque entièrement du surcoût d'appel.
+    """
+    inputs = tf.keras.Input(shape=input_shape)
+    outputs = tf.keras.layers.Dense(1, activation='sigmoid')(tf.keras.layers.GlobalAveragePooling2D()(inputs))
+    return tf.keras.Model(inputs, outputs)
+
+
+def benchmark(model, batch_sizes, iterations):
+    compiled = CompiledModel(model)
+    input_shape = tuple(model.input_shape[1:])
+    print(f"{'batch':>6} | {'predict p50':>12} | {'compilé p50':>12} | {'predict p95':>12} | {'compilé p95':>12} | {'gain p50':>9}")
+    for batch_size in batch_sizes:
+        batch = np.random.rand(batch_size, *input_shape).astype(np.float32)
+        before_p50, before_p95 = time_calls(lambda b: model.predict(b, verbose=0), batch, iterations)
+        after_p50, after_p95 = time_calls(compiled.predict, batch, iterations)
+        print(f"{batch_size:>6} | {before_p50:>9.2f} ms | {after_p50:>9.2f} ms | {before_p95:>9.2f} ms | "
+              f"{after_p95:>9.2f} ms | {before_p50 - after_p50:>6.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Surcoût par appel : model.predict vs chemin compilé à signature fixe")
+    parser.add_argument("--model", type=str, default=MODEL_PATH, help="Modèle Keras (.h5)")
+    parser.add_argument("--batch_sizes", type=int, nargs="*", default=BATCH_BUCKETS, help="Tailles de batch mesurées")
+    parser.add_argument("--iterations", type=int, default=100, help="Appels mesurés par configuration")
+    parser.add_argument("--overhead-only", action="store_true", help="Modèle trivial pour isoler le surcoût d'appel")
+    args = parser.parse_args()
+
+    if args.overhead_only or not os.path.exists(args.model) or args.model.endswith(".tflite"):
+        print("Modèle trivial (surcoût d'appel seul)")
+        keras_model = trivial_model((*IMG_SIZE, 3))
+    else:
+        print(f"Modèle {args.model}")
+        keras_model = tf.keras.models.load_model(args.model, compile=False)
+    benchmark(keras_model, args.batch_sizes, args.iterations)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Le service s'exécute depuis inference-service/ (paquet `app`) : même racine pour les tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
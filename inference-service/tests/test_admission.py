@@ -0,0 +1,108 @@
+import pytest
+
+from app.utils.admission import AdmissionController, ADMISSION_BACKOFF
+
+
+def controller(**kwargs):
+    params = dict(target_ms=100, min_limit=2, max_limit=16, initial_limit=4, batch_share=0.5, enabled=True)
+    params.update(kwargs)
+    return AdmissionController(**params)
+
+
+def test_priority_from_path():
+    admission = controller()
+    assert admission.priority("/inference/predict") == "interactive"
+    assert admission.priority("/inference/predict/tensor") == "batch"
+    assert admission.priority("/inference/predict/tiled") == "batch"
+    assert admission.priority("/inconnu") == "interactive"
+
+
+def test_priority_header_only_downgrades():
+    admission = controller()
+    assert admission.priority("/inference/predict", "batch") == "batch"
+    assert admission.priority("/inference/predict/batch", "interactive") == "batch"
+    assert admission.priority("/inference/predict", "urgent") == "interactive"
+
+
+def test_batch_share_sheds_with_429():
+    admission = controller()
+    assert admission.try_acquire("batch") is None
+    assert admission.try_acquire("batch") is None
+    assert admission.try_acquire("batch") == 429
+    # La part réservée reste disponible pour les requêtes interactives
+    assert admission.try_acquire("interactive") is None
+    assert admission.in_flight == {"interactive": 1, "batch": 2}
+
+
+def test_full_limit_sheds_with_503():
+    admission = controller()
+    for _ in range(4):
+        assert admission.try_acquire("interactive") is None
+    assert admission.try_acquire("interactive") == 503
+    assert admission.try_acquire("batch") == 503
+
+
+def test_disabled_admits_everything():
+    admission = controller(enabled=False)
+    assert all(admission.try_acquire("batch") is None for _ in range(10))
+
+
+def test_slow_requests_shrink_limit_once_per_latency():
+    admission = controller(initial_limit=10)
+    admission.try_acquire("interactive")
+    admission.release("interactive", 0.5, ok=True)
+    assert admission.limit == pytest.approx(10 * ADMISSION_BACKOFF)
+    # Deuxième dépassement dans la même durée de requête : pas de nouvelle réduction
+    admission.try_acquire("interactive")
+    admission.release("interactive", 0.5, ok=True)
+    assert admission.limit == pytest.approx(10 * ADMISSION_BACKOFF)
+
+
+def test_limit_floored_at_min():
+    admission = controller(initial_limit=2)
+    admission.try_acquire("interactive")
+    admission.release("interactive", 0.5, ok=True)
+    assert admission.limit == 2
+
+
+def test_fast_requests_grow_limit_when_used():
+    admission = controller()
+    admission.try_acquire("interactive")
+    admission.try_acquire("interactive")
+    admission.release("interactive", 0.01, ok=True)
+    assert admission.limit == pytest.approx(4.25)
+
+
+def test_no_growth_when_limit_unused():
+    admission = controller()
+    admission.try_acquire("interactive")
+    admission.release("interactive", 0.01, ok=True)
+    assert admission.limit == 4
+
+
+def test_limit_capped_at_max():
+    admission = controller(initial_limit=16)
+    for _ in range(16):
+        admission.try_acquire("interactive")
+    admission.release("interactive", 0.01, ok=True)
+    assert admission.limit == 16
+
+
+def test_batch_and_failed_requests_do_not_drive_limit():
+    admission = controller()
+    admission.try_acquire("batch")
+    admission.release("batch", 0.5, ok=True)
+    admission.try_acquire("interactive")
+    admission.release("interactive", 0.5, ok=False)
+    assert admission.limit == 4
+    assert admission.latency_ewma is None
+    assert admission.in_flight == {"interactive": 0, "batch": 0}
+
+
+def test_retry_after_is_at_least_one_second():
+    admission = controller()
+    assert admission.retry_after() == 1
+    admission.latency_ewma = 2.0
+    for _ in range(4):
+        admission.try_acquire("interactive")
+    assert admission.retry_after() == 2
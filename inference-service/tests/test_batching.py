@@ -0,0 +1,85 @@
+import pytest
+
+from app.utils import batching
+from app.utils.batching import AdaptiveBatchController, ADJUST_EVERY, MIN_BATCH_WINDOW_MS, MAX_BATCH_WINDOW_MS
+
+
+def controller(max_batch=8, window_ms=2):
+    batch = AdaptiveBatchController(target_ms=100, buckets=[1, 4, 8, 16], adaptive=True)
+    batch.max_batch = max_batch
+    batch.window_s = window_ms / 1000
+    return batch
+
+
+def run(batch, batch_size, latency_s, forward_s=0.01):
+    """
+    Une période de décision complète : ADJUST_EVERY batches identiques.
+    """
+    for _ in range(ADJUST_EVERY):
+        batch.record(batch_size, forward_s, [latency_s] * batch_size)
+
+
+def test_over_target_shrinks_batch_and_window():
+    batch = controller()
+    run(batch, 8, 0.2)
+    assert batch.max_batch == 4
+    assert batch.window_s == pytest.approx(0.001)
+
+
+def test_over_target_window_floored():
+    batch = controller(max_batch=1)
+    for _ in range(10):
+        run(batch, 1, 0.2)
+    assert batch.max_batch == 1
+    assert batch.window_s == pytest.approx(MIN_BATCH_WINDOW_MS / 1000)
+
+
+def test_low_load_window_floored():
+    batch = controller()
+    for _ in range(10):
+        run(batch, 1, 0.01)
+    assert batch.max_batch == 8
+    assert batch.window_s == pytest.approx(MIN_BATCH_WINDOW_MS / 1000)
+
+
+def test_full_batches_grow_batch():
+    batch = controller()
+    run(batch, 8, 0.02)
+    assert batch.max_batch == 16
+
+
+def test_full_batches_hold_when_larger_bucket_too_slow():
+    batch = controller()
+    batch.forward_ewma[16] = 0.5
+    run(batch, 8, 0.02)
+    assert batch.max_batch == 8
+    assert batch.window_s == pytest.approx(0.002)
+
+
+def test_moderate_load_grows_window_up_to_max():
+    batch = controller()
+    for _ in range(10):
+        run(batch, 6, 0.02)
+    assert batch.max_batch == 8
+    assert batch.window_s == pytest.approx(MAX_BATCH_WINDOW_MS / 1000)
+
+
+def test_grow_window_starts_from_floor():
+    # Fenêtre nulle (BATCH_WINDOW_MS=0) : doubler 0 la laisserait bloquée à 0
+    batch = controller(window_ms=0)
+    run(batch, 6, 0.02)
+    assert batch.window_s == pytest.approx(MIN_BATCH_WINDOW_MS / 1000)
+
+
+def test_fixed_mode_never_adjusts():
+    batch = controller()
+    batch.adaptive = False
+    run(batch, 8, 0.2)
+    assert batch.max_batch == 8
+    assert batch.window_s == pytest.approx(0.002)
+
+
+def test_start_from_autotuned_size(monkeypatch):
+    monkeypatch.setattr(batching, "runtime_config", lambda: {"max_batch_size": 12})
+    batch = AdaptiveBatchController(target_ms=100, buckets=[1, 4, 8, 16])
+    assert batch.current_max() == 8
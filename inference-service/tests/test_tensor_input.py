@@ -0,0 +1,118 @@
+import io
+import struct
+
+import numpy as np
+import pytest
+
+from app.utils.tensor_input import (
+    decode_tensor, max_payload_size, parse_npy_header, TensorFormatError, MAX_NPY_HEADER, MAX_TENSOR_BATCH,
+)
+
+SHAPE = (2, 128, 128, 3)
+NPY = "application/x-npy"
+RAW = "application/octet-stream"
+
+
+def npy_bytes(array):
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    return buffer.getvalue()
+
+
+def test_decode_npy_uint8_normalized():
+    batch = decode_tensor(npy_bytes(np.full(SHAPE, 255, np.uint8)), NPY)
+    assert batch.shape == SHAPE
+    assert batch.dtype == np.float32
+    assert batch.max() == 1.0
+
+
+def test_decode_npy_single_image():
+    assert decode_tensor(npy_bytes(np.zeros(SHAPE[1:], np.float32)), NPY).shape == (1, *SHAPE[1:])
+
+
+def test_decode_raw():
+    body = np.zeros(SHAPE, np.float32).tobytes()
+    batch = decode_tensor(body, RAW, "2x128x128x3", "float32")
+    assert batch.shape == SHAPE
+
+
+@pytest.mark.parametrize("body", [b"", b"\x93NUMP", b"PK\x03\x04" + b"\0" * 64])
+def test_npy_bad_magic(body):
+    with pytest.raises(TensorFormatError, match="invalide"):
+        parse_npy_header(body)
+
+
+def test_npy_unsupported_version():
+    body = bytearray(npy_bytes(np.zeros(SHAPE, np.uint8)))
+    body[6] = 9
+    with pytest.raises(TensorFormatError, match="non supportée"):
+        parse_npy_header(bytes(body))
+
+
+def test_npy_header_too_long():
+    body = b"\x93NUMPY\x02\x00" + struct.pack("<I", MAX_NPY_HEADER + 1) + b" " * (MAX_NPY_HEADER + 1)
+    with pytest.raises(TensorFormatError, match="invalide"):
+        parse_npy_header(body)
+
+
+def test_npy_header_truncated():
+    body = npy_bytes(np.zeros(SHAPE, np.uint8))[:40]
+    with pytest.raises(TensorFormatError, match="invalide"):
+        parse_npy_header(body)
+
+
+def test_npy_header_unreadable():
+    header = b"{'descr': '|u1', 'shape': (2,".ljust(118) + b"\n"
+    with pytest.raises(TensorFormatError, match="illisible"):
+        parse_npy_header(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header)
+
+
+def test_npy_fortran_order():
+    with pytest.raises(TensorFormatError, match="Fortran"):
+        decode_tensor(npy_bytes(np.asfortranarray(np.zeros(SHAPE, np.uint8))), NPY)
+
+
+@pytest.mark.parametrize("array", [
+    np.zeros((2, 64, 64, 3), np.uint8),
+    np.zeros((2, 128, 128), np.uint8),
+    np.zeros((2, 128, 128, 3), np.float64),
+    np.zeros((2, 128, 128, 3), ">f4"),
+])
+def test_npy_wrong_shape_or_dtype(array):
+    with pytest.raises(TensorFormatError):
+        decode_tensor(npy_bytes(array), NPY)
+
+
+def test_npy_data_size_mismatch():
+    with pytest.raises(TensorFormatError, match="Taille"):
+        decode_tensor(npy_bytes(np.zeros(SHAPE, np.uint8))[:-1], NPY)
+
+
+def test_raw_requires_shape_header():
+    with pytest.raises(TensorFormatError, match="X-Tensor-Shape"):
+        decode_tensor(b"\0" * 16, RAW)
+
+
+@pytest.mark.parametrize("shape, dtype", [("2,128,x", "uint8"), ("2x128x128x3", "int64"), ("0x128x128x3", "uint8")])
+def test_raw_bad_headers(shape, dtype):
+    with pytest.raises(TensorFormatError):
+        decode_tensor(b"\0" * 16, RAW, shape, dtype)
+
+
+def test_raw_size_mismatch():
+    with pytest.raises(TensorFormatError, match="Taille"):
+        decode_tensor(b"\0" * 16, RAW, "2x128x128x3", "uint8")
+
+
+def test_max_payload_raw_is_exact():
+    assert max_payload_size(RAW, "2x128x128x3", "float32") == int(np.prod(SHAPE)) * 4
+
+
+def test_max_payload_raw_rejects_large_batch():
+    with pytest.raises(TensorFormatError, match="maximum"):
+        max_payload_size(RAW, f"{MAX_TENSOR_BATCH + 1}x128x128x3")
+
+
+def test_max_payload_npy_covers_largest_batch():
+    largest = npy_bytes(np.zeros((MAX_TENSOR_BATCH, 128, 128, 3), np.float32))
+    assert len(largest) <= max_payload_size(NPY)
@@ -0,0 +1,66 @@
+import time
+
+import numpy as np
+
+
+def measure_latency(predict_fn, input_shape=(128, 128, 3), batch_size=1, runs=50, warmup=5):
+    """
+    Mesure la latence d'un appel de prédiction sur CPU (en millisecondes).
+    `predict_fn` reçoit un batch numpy float32 de forme (batch_size, *input_shape).
+    """
+    batch = np.random.rand(batch_size, *input_shape).astype("float32")
+    # Les premiers appels incluent le traçage du graphe et la sélection des noyaux
+    for _ in range(warmup):
+        predict_fn(batch)
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        predict_fn(batch)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings = np.array(timings)
+    return {
+        "batch_size": batch_size,
+        "mean_ms": float(timings.mean()),
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99)),
+    }
+
+
+def measure_throughput(predict_fn, input_shape=(128, 128, 3), batch_sizes=(1, 8, 32), runs=10, warmup=2):
+    """
+    Débit (images/s) pour chaque taille de batch.
+    """
+    throughput = {}
+    for batch_size in batch_sizes:
+        latency = measure_latency(predict_fn, input_shape, batch_size, runs=runs, warmup=warmup)
+        throughput[str(batch_size)] = batch_size / (latency["mean_ms"] / 1000)
+    return throughput
+
+
+def keras_predict_fn(model):
+    """
+    Appel direct du modèle (évite le coût fixe de model.predict pour les petits batchs).
+    """
+    return lambda batch: model(batch, training=False)
+
+
+def markdown_table(rows, columns):
+    """
+    Formate une liste de dictionnaires en tableau Markdown.
+    `columns` est une liste de (clé, titre).
+    """
+    def fmt(value):
+        if isinstance(value, float):
+            return f"{value:.4f}" if abs(value) < 10 else f"{value:.1f}"
+        return "-" if value is None else str(value)
+
+    lines = [
+        "| " + " | ".join(title for _, title in columns) + " |",
+        "|" + "|".join("---" for _ in columns) + "|",
+    ]
+    for row in rows:
+        lines.append("| " + " | ".join(fmt(row.get(key)) for key, _ in columns) + " |")
+    return "\n".join(lines)
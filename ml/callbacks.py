@@ -0,0 +1,436 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import resource
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.callbacks import Callback, EarlyStopping, ReduceLROnPlateau
+
+
+# Attributs internes des callbacks Keras nécessaires pour reprendre exactement leur comportement
+_CALLBACK_STATE_ATTRS = {
+    EarlyStopping: ["wait", "best", "best_epoch", "stopped_epoch"],
+    ReduceLROnPlateau: ["wait", "best", "cooldown_counter"],
+}
+
+
+def _to_json(value):
+    if isinstance(value, (np.floating, np.integer)):
+        return value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return str(value)
+    return value
+
+
+def _from_json(value):
+    if value in ("inf", "-inf", "nan"):
+        return float(value)
+    return value
+
+
+class OffsetSequence(tf.keras.utils.Sequence):
+    """
+    Vue d'un générateur Keras (DirectoryIterator) qui commence au batch `offset`.
+    Utilisée pour terminer une époque interrompue au milieu sans rejouer les batchs déjà vus.
+    """
+
+    def __init__(self, sequence, offset):
+        super().__init__()
+        self.sequence = sequence
+        self.offset = offset
+
+    def __len__(self):
+        return len(self.sequence) - self.offset
+
+    def __getitem__(self, index):
+        return self.sequence[index + self.offset]
+
+    def on_epoch_end(self):
+        self.sequence.on_epoch_end()
+
+
+class TimedSequence(tf.keras.utils.Sequence):
+    """
+    Enveloppe un générateur Keras et cumule le temps passé à produire les batchs
+    (lecture, décodage, augmentation) dans `data_time`.
+    """
+
+    def __init__(self, sequence):
+        super().__init__()
+        self.sequence = sequence
+        self.data_time = 0.0
+
+    def __len__(self):
+        return len(self.sequence)
+
+    def __getitem__(self, index):
+        start = time.perf_counter()
+        batch = self.sequence[index]
+        self.data_time += time.perf_counter() - start
+        return batch
+
+    def on_epoch_end(self):
+        self.sequence.on_epoch_end()
+
+
+class ThroughputMonitor(Callback):
+    """
+    Mesure le débit d'entraînement pour savoir si une époque est limitée par les données
+    ou par le calcul : temps par pas, attente des données, images/s, pic de mémoire (RSS)
+    et durée de l'époque. Les agrégats par époque sont ajoutés aux logs (donc à l'historique),
+    le détail par pas est conservé dans `steps`.
+    Optionnellement, une trace du profileur TensorFlow est capturée entre `profile_start`
+    et `profile_stop` (pas globaux).
+    """
+
+    def __init__(self, batch_size, sequence=None, profile_dir=None, profile_start=10, profile_stop=20):
+        super().__init__()
+        self.batch_size = batch_size
+        self.sequence = sequence
+        self.profile_dir = profile_dir
+        self.profile_start = profile_start
+        self.profile_stop = profile_stop
+        self.steps = {"epoch": [], "step_time_ms": [], "data_wait_ms": []}
+        self._global_step = 0
+        self._profiling = False
+
+    def _data_time(self):
+        return self.sequence.data_time if self.sequence is not None else 0.0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch = epoch
+        self._epoch_start = time.perf_counter()
+        self._last_batch_end = self._epoch_start
+        self._epoch_step_times = []
+        self._epoch_data_waits = []
+        self._epoch_host_gaps = []
+
+    def on_train_batch_begin(self, batch, logs=None):
+        if self.profile_dir and self._global_step == self.profile_start:
+            tf.profiler.experimental.start(self.profile_dir)
+            self._profiling = True
+        self._batch_start = time.perf_counter()
+        self._data_time_start = self._data_time()
+        # Temps hors pas d'entraînement (callbacks, boucle Python) depuis la fin du pas précédent
+        self._host_gap = self._batch_start - self._last_batch_end
+
+    def on_train_batch_end(self, batch, logs=None):
+        now = time.perf_counter()
+        step_time = now - self._batch_start
+        # Sans prefetch, la production du batch se fait pendant le pas : c'est de l'attente de données
+        data_wait = self._host_gap + (self._data_time() - self._data_time_start)
+        self._last_batch_end = now
+        self._global_step += 1
+
+        self._epoch_step_times.append(step_time)
+        self._epoch_data_waits.append(data_wait)
+        self._epoch_host_gaps.append(self._host_gap)
+        self.steps["epoch"].append(self._epoch)
+        self.steps["step_time_ms"].append(step_time * 1000)
+        self.steps["data_wait_ms"].append(data_wait * 1000)
+
+        if self._profiling and self._global_step >= self.profile_stop:
+            self._stop_profiler()
+
+    def on_epoch_end(self, epoch, logs=None):
+        if logs is None or not self._epoch_step_times:
+            return
+        epoch_time = time.perf_counter() - self._epoch_start
+        step_times = np.array(self._epoch_step_times)
+        data_waits = np.array(self._epoch_data_waits)
+        # Temps total des pas (production des batchs incluse) et des intervalles entre pas
+        train_time = step_times.sum() + sum(self._epoch_host_gaps)
+
+        logs["epoch_time_s"] = epoch_time
+        logs["step_time_ms"] = float(step_times.mean() * 1000)
+        logs["step_time_p95_ms"] = float(np.percentile(step_times, 95) * 1000)
+        logs["data_wait_ms"] = float(data_waits.mean() * 1000)
+        logs["data_wait_fraction"] = float(data_waits.sum() / train_time) if train_time > 0 else 0.0
+        logs["images_per_sec"] = float(len(step_times) * self.batch_size / train_time) if train_time > 0 else 0.0
+        logs["peak_rss_mb"] = peak_rss_mb()
+
+    def on_train_end(self, logs=None):
+        if self._profiling:
+            self._stop_profiler()
+
+    def _stop_profiler(self):
+        tf.profiler.experimental.stop()
+        self._profiling = False
+        print(f"Trace du profileur écrite dans {self.profile_dir}")
+
+
+def peak_rss_mb():
+    """
+    Pic de mémoire résidente du processus (Mo).
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en octets sur macOS, en kilo-octets sur Linux
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+class ResumableCheckpoint(Callback):
+    """
+    Sauvegarde périodique de l'état complet de l'entraînement :
+    poids, état de l'optimiseur (dont le taux d'apprentissage), époque, position dans
+    l'époque, état des callbacks (EarlyStopping, ReduceLROnPlateau), ordre de parcours
+    du générateur d'entraînement et état des générateurs aléatoires du mélange et de
+    l'augmentation. Seuls les `keep_last` derniers checkpoints sont conservés.
+
+    Avec un DirectoryIterator à graine fixe (flow_from_directory), le tirage de chaque batch
+    dépend de `seed + total_batches_seen` : la reprise rejoue exactement les mêmes
+    augmentations. Pour les autres générateurs (CachedArraySequence), l'état de np.random est
+    celui du moment de la sauvegarde : si Keras a déjà préchargé des batchs suivants, les
+    augmentations reprises diffèrent de celles de l'exécution d'origine (l'ordre des images,
+    lui, est restauré à l'identique en milieu d'époque). Le non-déterminisme des noyaux
+    TensorFlow n'est pas couvert.
+    """
+
+    def __init__(self, checkpoint_dir, train_generator=None, save_every_steps=0,
+                 keep_last=3, tracked_callbacks=None, step_offset=0, write_dir=None):
+        super().__init__()
+        self.checkpoint_dir = checkpoint_dir
+        # En multi-workers, les non-chefs écrivent dans un répertoire temporaire (write_dir)
+        # mais restaurent depuis celui du chef
+        self.write_dir = write_dir or checkpoint_dir
+        self.train_generator = train_generator
+        self.save_every_steps = save_every_steps
+        self.keep_last = keep_last
+        self.tracked_callbacks = tracked_callbacks or []
+        # Nombre de batchs déjà effectués dans l'époque courante (reprise en milieu d'époque)
+        self.step_offset = step_offset
+        self.restored_state = None
+        self._carried_state = None
+        self._epoch = 0
+        self._manager = None
+        self._checkpoint = None
+
+    def _ensure_manager(self):
+        if self._manager is None:
+            os.makedirs(self.write_dir, exist_ok=True)
+            self._checkpoint = tf.train.Checkpoint(model=self.model, optimizer=self.model.optimizer)
+            self._manager = tf.train.CheckpointManager(
+                self._checkpoint, self.write_dir, max_to_keep=self.keep_last
+            )
+        return self._manager
+
+    def on_train_begin(self, logs=None):
+        # Placé après EarlyStopping/ReduceLROnPlateau dans la liste des callbacks :
+        # leur on_train_begin a déjà réinitialisé leur état, on le restaure ici.
+        if self.restored_state is not None:
+            self._restore_callbacks(self.restored_state)
+            self.restored_state = None
+        elif self._carried_state is not None:
+            for callback, attrs in self._carried_state:
+                for attr, value in attrs.items():
+                    setattr(callback, attr, value)
+            self._carried_state = None
+
+    def on_train_end(self, logs=None):
+        # Un second appel à fit() suit la fin d'une époque reprise : on conserve l'état des callbacks
+        self._carried_state = [
+            (callback, {attr: getattr(callback, attr, None)
+                        for attr in _CALLBACK_STATE_ATTRS.get(type(callback), []) + ["best_weights"]
+                        if hasattr(callback, attr)})
+            for callback in self.tracked_callbacks
+        ]
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch = epoch
+
+    def on_train_batch_end(self, batch, logs=None):
+        step = self.step_offset + batch + 1
+        if self.save_every_steps and step % self.save_every_steps == 0:
+            self.save(self._epoch, step)
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.step_offset = 0
+        self.save(epoch + 1, 0)
+
+    def save(self, epoch, step):
+        """
+        Écrit un checkpoint reprenant à l'époque `epoch`, après `step` batchs.
+        """
+        manager = self._ensure_manager()
+        prefix = manager.save()
+        if self.write_dir != self.checkpoint_dir:
+            # Sauvegarde collective d'un worker non-chef : le fichier écrit n'est pas conservé
+            shutil.rmtree(self.write_dir, ignore_errors=True)
+            self._manager = None
+            return
+
+        state = {
+            "epoch": int(epoch),
+            "step": int(step),
+            "callbacks": self._callbacks_state(),
+        }
+        # L'ordre de parcours n'a de sens qu'en milieu d'époque
+        if step > 0 and getattr(self.train_generator, "index_array", None) is not None:
+            np.save(f"{prefix}.iter.npy", self.train_generator.index_array)
+            state["iterator"] = f"{os.path.basename(prefix)}.iter.npy"
+        state["rng"] = self._save_rng(prefix, epoch, step)
+        for callback in self.tracked_callbacks:
+            best_weights = getattr(callback, "best_weights", None)
+            if isinstance(callback, EarlyStopping) and best_weights is not None:
+                np.savez(f"{prefix}.best.npz", *best_weights)
+                state["best_weights"] = f"{os.path.basename(prefix)}.best.npz"
+
+        with open(f"{prefix}.state.json", 'w') as f:
+            json.dump(state, f)
+        self._rotate_sidecars(manager)
+
+    def _save_rng(self, prefix, epoch, step):
+        """
+        Générateurs aléatoires du mélange et de l'augmentation : np.random (fichier .rng.npz),
+        générateur propre de CachedArraySequence et compteur de batchs d'un DirectoryIterator.
+        """
+        _, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+        np.savez(f"{prefix}.rng.npz", keys=keys, pos=pos, has_gauss=has_gauss, cached_gaussian=cached_gaussian)
+        rng = {"numpy": f"{os.path.basename(prefix)}.rng.npz"}
+        generator = self.train_generator
+        if generator is None:
+            return rng
+        if getattr(generator, "seed", None) is not None and hasattr(generator, "total_batches_seen"):
+            # Calculé plutôt que lu : le compteur avance aussi pour les batchs préchargés par Keras
+            rng["total_batches_seen"] = int(epoch) * len(generator) + int(step)
+        if isinstance(getattr(generator, "_rng", None), np.random.Generator):
+            rng["generator"] = generator._rng.bit_generator.state
+        return rng
+
+    def _restore_rng(self, rng):
+        numpy_state = rng.get("numpy")
+        if numpy_state:
+            with np.load(os.path.join(self.checkpoint_dir, numpy_state)) as data:
+                np.random.set_state(("MT19937", data["keys"], int(data["pos"]),
+                                     int(data["has_gauss"]), float(data["cached_gaussian"])))
+        if self.train_generator is None:
+            return
+        if "total_batches_seen" in rng:
+            self.train_generator.total_batches_seen = rng["total_batches_seen"]
+        if "generator" in rng:
+            self.train_generator._rng.bit_generator.state = rng["generator"]
+
+    def _callbacks_state(self):
+        states = []
+        for callback in self.tracked_callbacks:
+            attrs = _CALLBACK_STATE_ATTRS.get(type(callback), [])
+            states.append({attr: _to_json(getattr(callback, attr, None)) for attr in attrs})
+        return states
+
+    def _restore_callbacks(self, state):
+        for callback, saved in zip(self.tracked_callbacks, state.get("callbacks", [])):
+            for attr, value in saved.items():
+                if value is not None:
+                    setattr(callback, attr, _from_json(value))
+
+        best_weights = state.get("best_weights")
+        if best_weights:
+            with np.load(os.path.join(self.checkpoint_dir, best_weights)) as data:
+                weights = [data[f"arr_{i}"] for i in range(len(data.files))]
+            for callback in self.tracked_callbacks:
+                if isinstance(callback, EarlyStopping):
+                    callback.best_weights = weights
+
+    def _rotate_sidecars(self, manager):
+        kept = {os.path.basename(path) for path in manager.checkpoints}
+        for sidecar in glob.glob(os.path.join(self.write_dir, "*.state.json")) + \
+                glob.glob(os.path.join(self.write_dir, "*.iter.npy")) + \
+                glob.glob(os.path.join(self.write_dir, "*.rng.npz")) + \
+                glob.glob(os.path.join(self.write_dir, "*.best.npz")):
+            prefix = os.path.basename(sidecar).split(".")[0]
+            if prefix not in kept:
+                os.remove(sidecar)
+
+    def restore(self):
+        """
+        Restaure le dernier checkpoint disponible.
+        Retourne l'état (époque, position dans l'époque) ou None si aucun checkpoint n'existe.
+        """
+        self._ensure_manager()
+        latest = tf.train.latest_checkpoint(self.checkpoint_dir)
+        if latest is None:
+            return None
+
+        # Créer les variables de l'optimiseur avant la restauration de ses slots
+        if hasattr(self.model.optimizer, "build"):
+            self.model.optimizer.build(self.model.trainable_variables)
+        self._checkpoint.restore(latest).expect_partial()
+
+        with open(f"{latest}.state.json", 'r') as f:
+            state = json.load(f)
+
+        iterator = state.get("iterator")
+        if iterator and self.train_generator is not None:
+            self.train_generator.index_array = np.load(os.path.join(self.checkpoint_dir, iterator))
+        # Checkpoints antérieurs : pas d'état aléatoire, l'augmentation reprend depuis un autre tirage
+        self._restore_rng(state.get("rng", {}))
+
+        self.step_offset = state["step"]
+        self.restored_state = state
+        print(f"Reprise depuis {latest} : époque {state['epoch'] + 1}, batch {state['step']}")
+        return state
+
+
+class MedianStoppingCallback(Callback):
+    """
+    Règle d'arrêt par la médiane pour les sweeps d'hyperparamètres : après `grace_epochs`,
+    un essai dont la meilleure valeur de `monitor` est inférieure à la médiane des meilleures
+    valeurs des autres essais au même stade est interrompu.
+    Les essais tournant dans des processus distincts, la progression est partagée via
+    des fichiers JSON dans `progress_dir`.
+    """
+
+    def __init__(self, progress_dir, trial_id, monitor='val_accuracy', grace_epochs=2, min_trials=3):
+        super().__init__()
+        self.progress_dir = progress_dir
+        self.trial_id = trial_id
+        self.monitor = monitor
+        self.grace_epochs = grace_epochs
+        self.min_trials = min_trials
+        self.pruned = False
+        os.makedirs(progress_dir, exist_ok=True)
+
+    def _path(self, trial_id):
+        return os.path.join(self.progress_dir, f"{trial_id}.json")
+
+    def _read(self, path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def on_epoch_end(self, epoch, logs=None):
+        value = (logs or {}).get(self.monitor)
+        if value is None:
+            return
+
+        path = self._path(self.trial_id)
+        progress = self._read(path)
+        progress[str(epoch)] = float(value)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(progress, f)
+        os.replace(tmp_path, path)
+
+        if epoch + 1 < self.grace_epochs:
+            return
+
+        best = max(v for e, v in progress.items() if int(e) <= epoch)
+        peers = []
+        for peer_path in glob.glob(os.path.join(self.progress_dir, "*.json")):
+            if peer_path == path:
+                continue
+            peer = self._read(peer_path)
+            reached = [v for e, v in peer.items() if int(e) <= epoch]
+            if len(reached) == epoch + 1:
+                peers.append(max(reached))
+
+        if len(peers) >= self.min_trials and best < float(np.median(peers)):
+            print(f"Essai {self.trial_id} interrompu à l'époque {epoch + 1} : "
+                  f"{self.monitor}={best:.4f} < médiane {np.median(peers):.4f}")
+            self.pruned = True
+            self.model.stop_training = True
@@ -0,0 +1,116 @@
+import os
+import copy
+import json
+import argparse
+
+import tensorflow as tf
+
+from train import load_config, train
+from preprocessing import create_generators
+from benchmark import measure_latency, keras_predict_fn, markdown_table
+
+REPORT_COLUMNS = [
+    ("backbone", "Backbone"),
+    ("role", "Rôle"),
+    ("params_m", "Paramètres (M)"),
+    ("test_accuracy", "Précision test"),
+    ("latency_p50_ms", "Latence p50 (ms, batch 1)"),
+    ("latency_p95_ms", "Latence p95 (ms, batch 1)"),
+]
+
+
+def evaluate_teacher(config, teacher_path):
+    """
+    Précision de test et latence CPU du modèle de production actuel (enseignant).
+    """
+    model_config = config['model']
+    _, _, test_generator = create_generators(
+        config['data']['train_dir'], config['data']['val_dir'], config['data']['test_dir'],
+        model_config['img_height'], model_config['img_width'], config['training']['batch_size']
+    )
+    teacher = tf.keras.models.load_model(teacher_path)
+    teacher.compile(loss='binary_crossentropy', metrics=['accuracy'])
+    scores = teacher.evaluate(test_generator, return_dict=True)
+    latency = measure_latency(keras_predict_fn(teacher), (model_config['img_height'], model_config['img_width'], 3))
+    return teacher, scores['accuracy'], latency
+
+
+def compare_backbones(config_path, candidates=None, distill=True):
+    """
+    Entraîne chaque backbone candidat (par distillation depuis le modèle actuel si `distill`)
+    et produit un rapport précision vs latence CPU pour choisir le modèle de production.
+    """
+    base_config = load_config(config_path)
+    distillation = base_config.get('distillation', {})
+    candidates = candidates or distillation.get('candidates', ["MobileNetV3Small", "EfficientNetB0"])
+    report_dir = distillation.get('report_dir', "ml/reports/backbones")
+    teacher_path = distillation.get('teacher_path', base_config['model']['output_path'])
+    input_shape = (base_config['model']['img_height'], base_config['model']['img_width'], 3)
+    os.makedirs(report_dir, exist_ok=True)
+
+    rows = []
+    if os.path.exists(teacher_path):
+        teacher, accuracy, latency = evaluate_teacher(base_config, teacher_path)
+        rows.append({
+            "backbone": base_config['model'].get('base_model', "DenseNet121"),
+            "role": "enseignant (actuel)",
+            "params_m": teacher.count_params() / 1e6,
+            "test_accuracy": accuracy,
+            "latency_p50_ms": latency["p50_ms"],
+            "latency_p95_ms": latency["p95_ms"],
+        })
+        del teacher
+    elif distill:
+        print(f"⚠️  Enseignant {teacher_path} introuvable : entraînement sans distillation.")
+        distill = False
+
+    for backbone in candidates:
+        tf.keras.backend.clear_session()
+        candidate_dir = os.path.join(report_dir, backbone)
+        config = copy.deepcopy(base_config)
+        config['model']['base_model'] = backbone
+        config['model']['output_path'] = os.path.join(candidate_dir, "model.h5")
+        config['model']['reference_copy'] = False
+        config['model']['export_tflite'] = False
+        config['checkpoint'] = {'dir': os.path.join(candidate_dir, "checkpoints"), 'save_every_steps': 0, 'keep_last': 1}
+        config['distillation'] = dict(distillation, enabled=distill, student=backbone, teacher_path=teacher_path)
+
+        print(f"\n🧪 Candidat {backbone} ({'distillation' if distill else 'entraînement direct'})")
+        results = train(config)
+        model = tf.keras.models.load_model(config['model']['output_path'], compile=False)
+        latency = measure_latency(keras_predict_fn(model), input_shape)
+        rows.append({
+            "backbone": backbone,
+            "role": "élève" if distill else "candidat",
+            "params_m": model.count_params() / 1e6,
+            "test_accuracy": results['test_accuracy'],
+            "latency_p50_ms": latency["p50_ms"],
+            "latency_p95_ms": latency["p95_ms"],
+            "model_path": config['model']['output_path'],
+        })
+
+    with open(os.path.join(report_dir, "report.json"), 'w') as f:
+        json.dump(rows, f, indent=2)
+    table = markdown_table(rows, REPORT_COLUMNS)
+    with open(os.path.join(report_dir, "report.md"), 'w') as f:
+        f.write("# Comparaison des backbones : précision vs latence CPU\n\n" + table + "\n")
+    print("\n" + table)
+    print(f"\nRapport sauvegardé dans {report_dir}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Comparaison précision / latence CPU des backbones (avec distillation)")
+    parser.add_argument("--config", type=str, default="ml/config.yaml", help="Chemin vers config.yaml")
+    parser.add_argument("--backbones", nargs="*", default=None, help="Backbones candidats (défaut : distillation.candidates)")
+    parser.add_argument("--no-distill", action="store_true", help="Entraîner les candidats sans enseignant")
+    args = parser.parse_args()
+
+    config_file = args.config
+    if not os.path.exists(config_file):
+        if os.path.exists("config.yaml"):
+            config_file = "config.yaml"
+        elif os.path.exists("ml/config.yaml"):
+            config_file = "ml/config.yaml"
+
+    compare_backbones(config_file, args.backbones, distill=not args.no_distill)
@@ -0,0 +1,243 @@
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+SPLITS = ['train', 'val', 'test']
+
+HASH_SIZE = 8
+HIGHFREQ_FACTOR = 4
+
+
+def _dct_matrix(n):
+    """
+    Matrice de la DCT-II orthonormée de taille n x n (évite une dépendance à scipy).
+    """
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0, :] = np.sqrt(1.0 / n)
+    return matrix
+
+
+_DCT = _dct_matrix(HASH_SIZE * HIGHFREQ_FACTOR)
+
+
+def phash(image_path):
+    """
+    Calcule le hash perceptuel (pHash 64 bits) d'une image.
+    L'image est réduite en 32x32 niveaux de gris, transformée par DCT, et seules
+    les basses fréquences (8x8) sont comparées à leur médiane. Le hash est donc
+    insensible au redimensionnement, à la recompression et aux légers changements de contraste.
+    """
+    size = HASH_SIZE * HIGHFREQ_FACTOR
+    with Image.open(image_path) as img:
+        pixels = np.asarray(img.convert("L").resize((size, size), Image.LANCZOS), dtype=np.float64)
+
+    dct = _DCT @ pixels @ _DCT.T
+    low_freq = dct[:HASH_SIZE, :HASH_SIZE]
+    # Le coefficient DC (luminosité moyenne) est exclu du calcul de la médiane
+    median = np.median(low_freq.flatten()[1:])
+    bits = (low_freq > median).flatten()
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def _safe_phash(image_path):
+    try:
+        return image_path, phash(image_path)
+    except Exception:
+        return image_path, None
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Arbre BK (Burkhard-Keller) sur la distance de Hamming.
+    Une recherche à rayon r ne visite que les sous-arbres dont la distance au nœud
+    est dans [d - r, d + r], ce qui évite la comparaison exhaustive O(n²).
+    """
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        if self.root is None:
+            self.root = (value, [item], {})
+            return
+
+        node = self.root
+        while True:
+            node_value, node_items, children = node
+            distance = hamming_distance(value, node_value)
+            if distance == 0:
+                node_items.append(item)
+                return
+            child = children.get(distance)
+            if child is None:
+                children[distance] = (value, [item], {})
+                return
+            node = child
+
+    def search(self, value, radius):
+        """
+        Retourne la liste des (distance, item) à une distance <= radius de value.
+        """
+        if self.root is None:
+            return []
+
+        results = []
+        stack = [self.root]
+        while stack:
+            node_value, node_items, children = stack.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= radius:
+                results.extend((distance, item) for item in node_items)
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return results
+
+
+def list_images(data_dir):
+    """
+    Liste les images de data_dir sous la forme (split, classe, chemin).
+    """
+    entries = []
+    for split in SPLITS:
+        split_path = os.path.join(data_dir, split)
+        if not os.path.isdir(split_path):
+            continue
+        for cls in sorted(os.listdir(split_path)):
+            cls_path = os.path.join(split_path, cls)
+            if not os.path.isdir(cls_path):
+                continue
+            for name in sorted(os.listdir(cls_path)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    entries.append((split, cls, os.path.join(cls_path, name)))
+    return entries
+
+
+def compute_hashes(paths, workers=None):
+    """
+    Calcule les hash perceptuels en parallèle sur plusieurs processus.
+    Retourne un dictionnaire {chemin: hash} (les images illisibles sont ignorées).
+    """
+    hashes = {}
+    chunksize = max(1, len(paths) // ((workers or os.cpu_count() or 1) * 8))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_safe_phash, paths, chunksize=chunksize)
+        for path, value in tqdm(results, total=len(paths), desc="pHash"):
+            if value is None:
+                print(f"  ❌ Image illisible ignorée : {path}")
+                continue
+            hashes[path] = value
+    return hashes
+
+
+def find_duplicates(data_dir, threshold=4, workers=None):
+    """
+    Détecte les quasi-doublons dans data_dir (train/val/test).
+    Deux images sont considérées comme doublons si la distance de Hamming entre
+    leurs pHash est <= threshold. Retourne un rapport avec les paires inter-splits
+    (fuite de données), les paires intra-split et les conflits d'étiquettes.
+    """
+    entries = list_images(data_dir)
+    print(f"🔍 {len(entries)} images trouvées dans {data_dir}")
+    meta = {path: (split, cls) for split, cls, path in entries}
+    hashes = compute_hashes([path for _, _, path in entries], workers=workers)
+
+    tree = BKTree()
+    cross_split = []
+    within_split = []
+    label_conflicts = []
+
+    # Insertion incrémentale : chaque image n'est comparée qu'aux images déjà indexées,
+    # chaque paire n'est donc reportée qu'une seule fois.
+    for path, value in hashes.items():
+        split, cls = meta[path]
+        for distance, other in tree.search(value, threshold):
+            other_split, other_cls = meta[other]
+            pair = {
+                "a": other,
+                "a_split": other_split,
+                "a_class": other_cls,
+                "b": path,
+                "b_split": split,
+                "b_class": cls,
+                "distance": distance,
+            }
+            if other_split != split:
+                cross_split.append(pair)
+            else:
+                within_split.append(pair)
+            if other_cls != cls:
+                label_conflicts.append(pair)
+        tree.add(value, path)
+
+    return {
+        "data_dir": data_dir,
+        "threshold": threshold,
+        "total_images": len(entries),
+        "hashed_images": len(hashes),
+        "cross_split": cross_split,
+        "within_split": within_split,
+        "label_conflicts": label_conflicts,
+    }
+
+
+def files_to_remove(cross_split_pairs):
+    """
+    Pour chaque paire inter-splits, conserve l'exemplaire du split prioritaire
+    (train > val > test) et retourne les fichiers à supprimer des autres splits.
+    """
+    priority = {split: i for i, split in enumerate(SPLITS)}
+    to_remove = set()
+    for pair in cross_split_pairs:
+        if priority[pair["a_split"]] <= priority[pair["b_split"]]:
+            to_remove.add(pair["b"])
+        else:
+            to_remove.add(pair["a"])
+    return sorted(to_remove)
+
+
+def dedup_data(data_dir, threshold=4, workers=None, report_path=None, remove=False):
+    """
+    Point d'entrée de la commande `preprocessing.py dedup`.
+    """
+    report = find_duplicates(data_dir, threshold=threshold, workers=workers)
+
+    print(f"\n📊 Doublons inter-splits (fuite train/val/test) : {len(report['cross_split'])}")
+    for pair in report["cross_split"][:20]:
+        print(f"  - [{pair['a_split']}] {pair['a']} <-> [{pair['b_split']}] {pair['b']} (distance {pair['distance']})")
+    if len(report["cross_split"]) > 20:
+        print(f"  ... et {len(report['cross_split']) - 20} autres")
+    print(f"📊 Doublons intra-split : {len(report['within_split'])}")
+    if report["label_conflicts"]:
+        print(f"⚠️  Doublons avec des classes différentes : {len(report['label_conflicts'])}")
+
+    removed = []
+    if remove:
+        for path in files_to_remove(report["cross_split"]):
+            if os.path.exists(path):
+                os.remove(path)
+                removed.append(path)
+        print(f"🗑️  {len(removed)} fichiers supprimés des splits val/test")
+    report["removed"] = removed
+
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Rapport sauvegardé dans {report_path}")
+
+    return report
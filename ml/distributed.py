@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+
+def resolve_cluster(config):
+    """
+    Détermine la topologie du cluster : TF_CONFIG s'il est défini, sinon la liste
+    `distribute.workers` de config.yaml et l'index du worker courant (variable WORKER_INDEX).
+    Retourne (nombre de workers, index du worker).
+    """
+    if "TF_CONFIG" not in os.environ:
+        workers = config.get('distribute', {}).get('workers', [])
+        if workers:
+            index = int(os.getenv("WORKER_INDEX", "0"))
+            os.environ["TF_CONFIG"] = json.dumps({
+                "cluster": {"worker": workers},
+                "task": {"type": "worker", "index": index},
+            })
+
+    tf_config = json.loads(os.getenv("TF_CONFIG", "{}"))
+    num_workers = len(tf_config.get("cluster", {}).get("worker", [])) or 1
+    worker_index = tf_config.get("task", {}).get("index", 0)
+    return num_workers, worker_index
+
+
+def get_strategy(config):
+    """
+    Crée la MultiWorkerMirroredStrategy (à appeler avant toute autre opération TensorFlow).
+    Retourne (stratégie, nombre de workers, index du worker, est_chef).
+    """
+    import tensorflow as tf
+
+    num_workers, worker_index = resolve_cluster(config)
+    # Sur CPU, les all-reduce passent par l'implémentation RING (gRPC)
+    implementation = config.get('distribute', {}).get('communication', "ring")
+    communication = tf.distribute.experimental.CommunicationOptions(
+        implementation=tf.distribute.experimental.CommunicationImplementation[implementation.upper()]
+    )
+    strategy = tf.distribute.MultiWorkerMirroredStrategy(communication_options=communication)
+    is_chief = worker_index == 0
+    print(f"MultiWorkerMirroredStrategy : worker {worker_index + 1}/{num_workers}"
+          f"{' (chef)' if is_chief else ''}, {strategy.num_replicas_in_sync} répliques")
+    return strategy, num_workers, worker_index, is_chief
+
+
+def worker_path(path, worker_index, is_chief):
+    """
+    Les workers non-chefs doivent aussi écrire (sauvegardes collectives), mais dans un
+    répertoire temporaire pour ne pas écraser les fichiers du chef.
+    """
+    if is_chief:
+        return path
+    dirname, basename = os.path.split(path)
+    return os.path.join(dirname, f"worker_{worker_index}_tmp", basename)
+
+
+def launch_local(config_path, num_workers, base_port=12345, threads_per_worker=None):
+    """
+    Lance num_workers processus d'entraînement sur la machine locale, chacun avec son
+    TF_CONFIG, pour tester le mode multi-workers sans cluster.
+    """
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+    workers = [f"localhost:{base_port + i}" for i in range(num_workers)]
+    train_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "train.py")
+
+    processes = []
+    for index in range(num_workers):
+        env = dict(os.environ)
+        env["TF_CONFIG"] = json.dumps({
+            "cluster": {"worker": workers},
+            "task": {"type": "worker", "index": index},
+        })
+        env["OMP_NUM_THREADS"] = str(threads)
+        env["TF_NUM_INTRAOP_THREADS"] = str(threads)
+        print(f"🚀 Lancement du worker {index} ({workers[index]}, {threads} threads)")
+        processes.append(subprocess.Popen(
+            [sys.executable, train_script, "--config", config_path, "--distributed"], env=env
+        ))
+
+    codes = [p.wait() for p in processes]
+    for index, code in enumerate(codes):
+        status = "✅" if code == 0 else "❌"
+        print(f"{status} Worker {index} terminé (code {code})")
+    return max(codes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lancement local d'un entraînement multi-workers")
+    parser.add_argument("--config", type=str, default="ml/config.yaml", help="Chemin vers config.yaml")
+    parser.add_argument("--workers", type=int, default=2, help="Nombre de processus workers")
+    parser.add_argument("--port", type=int, default=12345, help="Premier port utilisé par les workers")
+    parser.add_argument("--threads", type=int, default=None, help="Threads par worker (défaut : cœurs / workers)")
+    args = parser.parse_args()
+
+    sys.exit(launch_local(args.config, args.workers, args.port, args.threads))
@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+
+import numpy as np
+from PIL import Image
+from sklearn.metrics import accuracy_score, confusion_matrix, roc_auc_score
+
+from benchmark import measure_throughput
+from callbacks import peak_rss_mb
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INFERENCE_DIR = os.path.join(REPO_DIR, "inference-service")
+
+
+def load_inference_modules(model_path=None):
+    """
+    Importe le prétraitement et le chargeur du service d'inférence, pour évaluer
+    exactement ce qui est servi en production. MODEL_PATH doit être défini avant l'import.
+    """
+    if model_path:
+        os.environ["MODEL_PATH"] = os.path.abspath(model_path)
+    if INFERENCE_DIR not in sys.path:
+        sys.path.insert(0, INFERENCE_DIR)
+    from app.utils.preprocess import preprocess_image
+    from app.utils import model_loader
+    return preprocess_image, model_loader
+
+
+def list_test_images(test_dir, class_names):
+    """
+    Liste (chemin, étiquette) du split de test ; l'étiquette est l'index de la classe dans classes.json.
+    """
+    samples = []
+    for label, cls in enumerate(class_names):
+        cls_dir = os.path.join(test_dir, cls)
+        if not os.path.isdir(cls_dir):
+            print(f"⚠️  Dossier de classe manquant : {cls_dir}")
+            continue
+        for name in sorted(os.listdir(cls_dir)):
+            if name.lower().endswith(('.png', '.jpg', '.jpeg')):
+                samples.append((os.path.join(cls_dir, name), label))
+    return samples
+
+
+def evaluate(test_dir, model_path=None, metrics_path=None, batch_sizes=(1, 8, 32, 64), latency_samples=200):
+    """
+    Évalue un artefact avec le prétraitement et le chargeur du service d'inférence :
+    précision, AUC, matrice de confusion, latence batch 1 (p50/p95/p99), débit en batch,
+    temps de chargement à froid et pic de mémoire. Les résultats sont fusionnés dans metrics.json.
+    """
+    preprocess_image, model_loader = load_inference_modules(model_path)
+    models_dir = os.path.dirname(model_loader.MODEL_PATH)
+    metrics_path = metrics_path or os.path.join(models_dir, "metrics.json")
+
+    with open(os.path.join(models_dir, "classes.json"), 'r') as f:
+        labels = json.load(f)
+    class_names = [labels[str(i)] for i in sorted(map(int, labels.keys()))]
+
+    # 1. Chargement à froid de l'artefact
+    start = time.perf_counter()
+    model = model_loader.load_model_once()
+    load_time = time.perf_counter() - start
+    print(f"Modèle {model_loader.MODEL_PATH} chargé en {load_time:.2f}s")
+
+    # 2. Prétraitement identique à la route /inference/predict
+    samples = list_test_images(test_dir, class_names)
+    print(f"Évaluation sur {len(samples)} images de {test_dir}...")
+    preprocess_times = []
+    images = []
+    for path, _ in samples:
+        start = time.perf_counter()
+        with Image.open(path) as img:
+            images.append(preprocess_image(img))
+        preprocess_times.append((time.perf_counter() - start) * 1000)
+    batch = np.concatenate(images, axis=0)
+    y_true = np.array([label for _, label in samples])
+
+    # 3. Qualité
+    y_score = np.concatenate([
+        np.asarray(model.predict(batch[i:i + 32], verbose=0)).reshape(-1) for i in range(0, len(batch), 32)
+    ])
+    y_pred = (y_score >= 0.5).astype(int)
+    matrix = confusion_matrix(y_true, y_pred, labels=list(range(len(class_names))))
+
+    # 4. Latence d'une requête (une image, comme la route de prédiction)
+    latencies = []
+    for image in images[:latency_samples]:
+        start = time.perf_counter()
+        model.predict(image, verbose=0)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies = np.array(latencies)
+
+    # 5. Débit en batch
+    input_shape = batch.shape[1:]
+    throughput = measure_throughput(lambda b: model.predict(b, verbose=0), input_shape, batch_sizes=batch_sizes)
+
+    results = {
+        "artifact": os.path.relpath(model_loader.MODEL_PATH, models_dir),
+        "test_samples": len(samples),
+        "test_accuracy": float(accuracy_score(y_true, y_pred)),
+        "test_auc": float(roc_auc_score(y_true, y_score)) if len(set(y_true)) > 1 else None,
+        "confusion_matrix": {
+            "labels": class_names,
+            "matrix": matrix.tolist(),
+        },
+        "latency_p50_ms": float(np.percentile(latencies, 50)),
+        "latency_p95_ms": float(np.percentile(latencies, 95)),
+        "latency_p99_ms": float(np.percentile(latencies, 99)),
+        "preprocess_p50_ms": float(np.percentile(preprocess_times, 50)),
+        "throughput_images_per_sec": throughput,
+        "cold_load_time_s": load_time,
+        "peak_rss_mb": peak_rss_mb(),
+        "evaluation_timestamp": datetime.datetime.now().isoformat(),
+    }
+
+    # 6. Fusion dans metrics.json (les métriques d'entraînement existantes sont conservées)
+    metrics = {}
+    if os.path.exists(metrics_path):
+        with open(metrics_path, 'r') as f:
+            metrics = json.load(f)
+    metrics.update(results)
+    with open(metrics_path, 'w') as f:
+        json.dump(metrics, f, indent=2)
+
+    print(f"Précision : {results['test_accuracy']:.4f} | AUC : {results['test_auc']}")
+    print(f"Latence batch 1 : p50 {results['latency_p50_ms']:.1f} ms, p95 {results['latency_p95_ms']:.1f} ms, "
+          f"p99 {results['latency_p99_ms']:.1f} ms")
+    print("Débit : " + ", ".join(f"batch {bs} = {v:.1f} img/s" for bs, v in throughput.items()))
+    print(f"Métriques fusionnées dans {metrics_path}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Évaluation qualité + performance d'un artefact d'inférence")
+    parser.add_argument("--test_dir", type=str, default="ml/data/test", help="Répertoire du split de test")
+    parser.add_argument("--model", type=str, default=None, help="Artefact à évaluer (défaut : MODEL_PATH du service)")
+    parser.add_argument("--metrics", type=str, default=None, help="Fichier metrics.json à compléter")
+    parser.add_argument("--batch_sizes", type=int, nargs="*", default=[1, 8, 32, 64], help="Tailles de batch pour le débit")
+    args = parser.parse_args()
+
+    evaluate(args.test_dir, args.model, args.metrics, tuple(args.batch_sizes))
@@ -1,39 +1,144 @@
 import tensorflow as tf
-from tensorflow.keras.applications import DenseNet121
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D
+from tensorflow.keras import applications
+from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Input, Rescaling
 from tensorflow.keras.models import Model
 
-def create_model(input_shape=(128, 128, 3)):
+# Registre des backbones disponibles (clé `model.base_model` de config.yaml).
+# Le modèle reçoit toujours des images normalisées dans [0, 1] (comme le service d'inférence) ;
+# `input_scale` = (scale, offset) convertit cette entrée vers la plage attendue par le backbone.
+BACKBONES = {
+    # Pas de conversion : identique au modèle DenseNet121 historique (model.h5)
+    "DenseNet121": {"constructor": applications.DenseNet121, "input_scale": None},
+    "MobileNetV2": {"constructor": applications.MobileNetV2, "input_scale": (2.0, -1.0)},
+    # MobileNetV3 et EfficientNet intègrent leur propre normalisation et attendent [0, 255]
+    "MobileNetV3Small": {"constructor": applications.MobileNetV3Small, "input_scale": (255.0, 0.0)},
+    "MobileNetV3Large": {"constructor": applications.MobileNetV3Large, "input_scale": (255.0, 0.0)},
+    # EfficientNet-Lite n'existe pas dans keras.applications : EfficientNetB0 en est l'équivalent le plus proche
+    "EfficientNetB0": {"constructor": applications.EfficientNetB0, "input_scale": (255.0, 0.0)},
+    "EfficientNetV2B0": {"constructor": applications.EfficientNetV2B0, "input_scale": (255.0, 0.0)},
+    # ResNet50V2 (prétraitement [-1, 1]) plutôt que ResNet50, dont le prétraitement "caffe" (BGR) n'est pas sérialisable en couches standards
+    "ResNet50V2": {"constructor": applications.ResNet50V2, "input_scale": (2.0, -1.0)},
+}
+
+
+def build_backbone_model(input_shape=(128, 128, 3), base_model="DenseNet121"):
     """
-    Crée un modèle basé sur DenseNet121 pour la classification binaire.
-    Le modèle de base est gelé, et une tête de classification personnalisée est ajoutée.
+    Construit le modèle (backbone pré-entraîné gelé + tête de classification binaire) sans le compiler.
     """
-    print("Conception du modèle CNN avec Transfer Learning...")
+    if base_model not in BACKBONES:
+        raise ValueError(f"Backbone inconnu : {base_model}. Disponibles : {', '.join(BACKBONES)}")
+    spec = BACKBONES[base_model]
 
-    # 1. Charger un modèle de base pré-entraîné (DenseNet121) sans sa couche de classification supérieure
-    base_model = DenseNet121(input_shape=input_shape,
-                             include_top=False,
-                             weights='imagenet')
+    # 1. Charger un modèle de base pré-entraîné sans sa couche de classification supérieure
+    inputs = Input(shape=input_shape)
+    x = inputs
+    if spec["input_scale"] is not None:
+        scale, offset = spec["input_scale"]
+        x = Rescaling(scale, offset=offset)(x)
+    backbone = spec["constructor"](input_tensor=x,
+                                   include_top=False,
+                                   weights='imagenet')
 
     # 2. Geler les couches du modèle de base pré-entraîné
-    base_model.trainable = False
+    backbone.trainable = False
 
     # 3. Créer une nouvelle tête de classification au-dessus du modèle de base gelé
-    x = base_model.output
+    x = backbone.output
     x = GlobalAveragePooling2D()(x) # Couche de pooling moyen global
     x = Dense(128, activation='relu')(x) # Une couche dense avant la couche de sortie
     output_layer = Dense(1, activation='sigmoid')(x) # Couche dense finale pour la classification binaire
 
     # 4. Combiner le modèle de base et la tête de classification dans un modèle complet
-    model = Model(inputs=base_model.input, outputs=output_layer)
- 
-    # 5. Compiler le modèle
-    # Remarque : Les paramètres d'optimisation comme le taux d'apprentissage peuvent être passés ou ajustés dans train.py généralement,
-    # mais ici nous suivons la compilation directe du notebook si elle est simple.
-    # Cependant, la compilation se fait généralement à l'extérieur pour pouvoir ajuster le LR.
-    # Mais pour correspondre exactement au notebook :
-    model.compile(optimizer='adam',
+    return Model(inputs=inputs, outputs=output_layer, name=f"{base_model}_classifier")
+
+
+def create_model(input_shape=(128, 128, 3), learning_rate=0.001, base_model="DenseNet121"):
+    """
+    Crée un modèle basé sur le backbone `base_model` (DenseNet121 par défaut) pour la classification binaire.
+    Le modèle de base est gelé, et une tête de classification personnalisée est ajoutée.
+    """
+    print(f"Conception du modèle CNN avec Transfer Learning ({base_model})...")
+    model = build_backbone_model(input_shape, base_model)
+
+    # 5. Compiler le modèle (le taux d'apprentissage vient de `training.learning_rate` dans config.yaml)
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
                   loss='binary_crossentropy',
                   metrics=['accuracy'])
-    
+
     return model
+
+
+def _probability_to_logit(p):
+    p = tf.clip_by_value(p, 1e-7, 1 - 1e-7)
+    return tf.math.log(p / (1 - p))
+
+
+class Distiller(Model):
+    """
+    Distillation de connaissances : un modèle élève (léger) apprend à la fois des
+    étiquettes et des probabilités adoucies (température T) du modèle enseignant (DenseNet121).
+    perte = alpha * BCE(y, élève) + (1 - alpha) * T² * BCE(enseignant_T, élève_T)
+    """
+
+    def __init__(self, student, teacher):
+        super().__init__()
+        self.student = student
+        self.teacher = teacher
+        self.teacher.trainable = False
+
+    def compile(self, optimizer, metrics=None, alpha=0.5, temperature=4.0):
+        super().compile(optimizer=optimizer, metrics=metrics)
+        self.alpha = alpha
+        self.temperature = temperature
+        self.bce = tf.keras.losses.BinaryCrossentropy()
+
+    def call(self, inputs, training=False):
+        return self.student(inputs, training=training)
+
+    def _distillation_loss(self, teacher_pred, student_pred):
+        t = self.temperature
+        soft_teacher = tf.sigmoid(_probability_to_logit(teacher_pred) / t)
+        soft_student = tf.sigmoid(_probability_to_logit(student_pred) / t)
+        return self.bce(soft_teacher, soft_student) * (t ** 2)
+
+    def train_step(self, data):
+        x, y = data
+        teacher_pred = self.teacher(x, training=False)
+        with tf.GradientTape() as tape:
+            student_pred = self.student(x, training=True)
+            student_loss = self.bce(y, student_pred)
+            distillation_loss = self._distillation_loss(teacher_pred, student_pred)
+            loss = self.alpha * student_loss + (1 - self.alpha) * distillation_loss
+
+        gradients = tape.gradient(loss, self.student.trainable_variables)
+        self.optimizer.apply_gradients(zip(gradients, self.student.trainable_variables))
+        # compute_metrics remplace compiled_metrics.update_state (déprécié en Keras 3)
+        # et renvoie les résultats aplatis de toutes les métriques suivies
+        results = dict(self.compute_metrics(x, y, student_pred, sample_weight=None))
+        results.update({"loss": loss, "student_loss": student_loss, "distillation_loss": distillation_loss})
+        return results
+
+    def test_step(self, data):
+        x, y = data
+        student_pred = self.student(x, training=False)
+        loss = self.bce(y, student_pred)
+        results = dict(self.compute_metrics(x, y, student_pred, sample_weight=None))
+        results["loss"] = loss
+        return results
+
+
+def create_distiller(teacher_path, input_shape=(128, 128, 3), learning_rate=0.001,
+                     base_model="MobileNetV3Small", alpha=0.5, temperature=4.0):
+    """
+    Crée un Distiller dont l'enseignant est le modèle entraîné `teacher_path` (ex. model.h5 DenseNet121)
+    et l'élève un nouveau modèle basé sur `base_model`.
+    """
+    print(f"Distillation : enseignant {teacher_path} -> élève {base_model} (T={temperature}, alpha={alpha})")
+    teacher = tf.keras.models.load_model(teacher_path)
+    student = build_backbone_model(input_shape, base_model)
+    distiller = Distiller(student=student, teacher=teacher)
+    distiller.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+                      metrics=['accuracy'],
+                      alpha=alpha,
+                      temperature=temperature)
+    return distiller
@@ -0,0 +1,315 @@
+import os
+import gzip
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from benchmark import measure_latency, measure_throughput, keras_predict_fn, markdown_table
+
+COMPARISON_COLUMNS = [
+    ("artifact", "Artefact"),
+    ("size_mb", "Taille (Mo)"),
+    ("gzip_size_mb", "Taille gzip (Mo)"),
+    ("sparsity", "Sparsité"),
+    ("test_accuracy", "Précision test"),
+    ("load_time_s", "Chargement (s)"),
+    ("latency_p50_ms", "Latence p50 (ms)"),
+    ("latency_p95_ms", "Latence p95 (ms)"),
+    ("throughput_32", "Débit batch 32 (img/s)"),
+]
+
+# Couches quantifiables par le schéma 8 bits par défaut de tfmot (les autres restent en float pendant la QAT)
+_QUANTIZABLE_LAYERS = (
+    tf.keras.layers.Conv2D,
+    tf.keras.layers.DepthwiseConv2D,
+    tf.keras.layers.Dense,
+)
+
+
+def _tfmot():
+    try:
+        import tensorflow_model_optimization as tfmot
+    except ImportError:
+        raise ImportError(
+            "tensorflow-model-optimization est requis pour l'élagage et la QAT : "
+            "pip install tensorflow-model-optimization"
+        ) from None
+    return tfmot
+
+
+def apply_pruning(model, steps, initial_sparsity=0.0, final_sparsity=0.5):
+    """
+    Enveloppe le modèle pour un élagage par magnitude : la sparsité passe progressivement
+    de initial_sparsity à final_sparsity pendant `steps` pas de fine-tuning.
+    """
+    tfmot = _tfmot()
+    schedule = tfmot.sparsity.keras.PolynomialDecay(
+        initial_sparsity=initial_sparsity,
+        final_sparsity=final_sparsity,
+        begin_step=0,
+        end_step=max(1, steps),
+    )
+    return tfmot.sparsity.keras.prune_low_magnitude(model, pruning_schedule=schedule)
+
+
+def apply_qat(model, preserve_sparsity=False):
+    """
+    Prépare le modèle pour l'entraînement avec quantification simulée (QAT) en int8.
+    Avec preserve_sparsity, le schéma PQAT conserve les poids nuls issus de l'élagage.
+    """
+    tfmot = _tfmot()
+    quantize = tfmot.quantization.keras
+
+    def annotate(layer):
+        if isinstance(layer, _QUANTIZABLE_LAYERS):
+            return quantize.quantize_annotate_layer(layer)
+        return layer
+
+    annotated = tf.keras.models.clone_model(model, clone_function=annotate)
+    annotated.set_weights(model.get_weights())
+    with quantize.quantize_scope():
+        if preserve_sparsity:
+            scheme = tfmot.experimental.combine.Default8BitPrunePreserveQuantizeScheme()
+            return quantize.quantize_apply(annotated, scheme)
+        return quantize.quantize_apply(annotated)
+
+
+def _compile(model, learning_rate):
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+                  loss='binary_crossentropy',
+                  metrics=['accuracy'])
+    return model
+
+
+def sparsity(model):
+    """
+    Proportion de poids nuls dans les noyaux des couches Conv/Dense.
+    """
+    total = zeros = 0
+    for layer in model.layers:
+        for weight in getattr(layer, "kernel", None), getattr(layer, "depthwise_kernel", None):
+            if weight is not None:
+                values = weight.numpy()
+                total += values.size
+                zeros += int(np.sum(values == 0))
+    return zeros / total if total else 0.0
+
+
+def fine_tune_optimized(model, train_data, val_data, optimization_config, steps_per_epoch=None, validation_steps=None):
+    """
+    Phase de fine-tuning optionnelle après l'entraînement principal :
+    élagage par magnitude puis/ou QAT, selon la section `optimization` de config.yaml.
+    Retourne (modèle float élagué ou None, modèle QAT ou None).
+    """
+    tfmot = _tfmot()
+    epochs = optimization_config.get('epochs', 2)
+    learning_rate = optimization_config.get('learning_rate', 1e-4)
+    steps = (steps_per_epoch or len(train_data)) * epochs
+
+    if optimization_config.get('unfreeze_backbone', False):
+        for layer in model.layers:
+            layer.trainable = True
+
+    pruned = None
+    pruning_config = optimization_config.get('pruning', {})
+    if pruning_config.get('enabled'):
+        print(f"✂️  Élagage par magnitude jusqu'à {pruning_config.get('final_sparsity', 0.5):.0%} de sparsité...")
+        pruned = _compile(apply_pruning(
+            model, steps,
+            initial_sparsity=pruning_config.get('initial_sparsity', 0.0),
+            final_sparsity=pruning_config.get('final_sparsity', 0.5),
+        ), learning_rate)
+        with tempfile.TemporaryDirectory() as log_dir:
+            pruned.fit(train_data, epochs=epochs, steps_per_epoch=steps_per_epoch,
+                       validation_data=val_data, validation_steps=validation_steps, verbose=1,
+                       callbacks=[tfmot.sparsity.keras.UpdatePruningStep(),
+                                  tfmot.sparsity.keras.PruningSummaries(log_dir=log_dir)])
+        pruned = tfmot.sparsity.keras.strip_pruning(pruned)
+        print(f"Sparsité obtenue : {sparsity(pruned):.1%}")
+
+    qat = None
+    if optimization_config.get('qat', {}).get('enabled'):
+        print("🔢 Entraînement avec quantification simulée (QAT int8)...")
+        qat = _compile(apply_qat(pruned or model, preserve_sparsity=pruned is not None), learning_rate)
+        qat.fit(train_data, epochs=epochs, steps_per_epoch=steps_per_epoch,
+                validation_data=val_data, validation_steps=validation_steps, verbose=1)
+
+    return pruned, qat
+
+
+def export_tflite(model, output_path, representative_data=None, int8=True, sparse=False):
+    """
+    Exporte le modèle en TFLite. Avec int8, les poids et activations sont quantifiés
+    (un modèle QAT fournit ses propres plages ; sinon `representative_data` sert à les calibrer).
+    Les entrées/sorties restent en float32 : le service d'inférence n'a rien à changer.
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    optimizations = []
+    if int8:
+        optimizations.append(tf.lite.Optimize.DEFAULT)
+        if representative_data is not None:
+            converter.representative_dataset = representative_data
+    if sparse:
+        optimizations.append(tf.lite.Optimize.EXPERIMENTAL_SPARSITY)
+    converter.optimizations = optimizations
+
+    tflite_model = converter.convert()
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+    print(f"Modèle TFLite sauvegardé dans {output_path} ({len(tflite_model) / 1e6:.2f} Mo)")
+    return output_path
+
+
+def representative_dataset(generator, num_batches=20):
+    """
+    Générateur d'échantillons pour calibrer la quantification int8 post-entraînement.
+    """
+    def gen():
+        for i in range(min(num_batches, len(generator))):
+            images, _ = generator[i]
+            for image in images:
+                yield [image[np.newaxis].astype("float32")]
+    return gen
+
+
+def export_optimized(pruned, qat, output_dir, calibration_generator=None):
+    """
+    Écrit les artefacts optimisés à côté de model.h5 :
+    model_pruned.h5 (Keras, poids élagués) et model_int8.tflite (int8, éventuellement creux).
+    """
+    artifacts = []
+    if pruned is not None:
+        pruned_path = os.path.join(output_dir, "model_pruned.h5")
+        pruned.save(pruned_path, include_optimizer=False)
+        print(f"Modèle élagué sauvegardé dans {pruned_path}")
+        artifacts.append(pruned_path)
+
+    source = qat or pruned
+    if source is not None:
+        representative = None
+        if qat is None and calibration_generator is not None:
+            representative = representative_dataset(calibration_generator)
+        artifacts.append(export_tflite(
+            source, os.path.join(output_dir, "model_int8.tflite"),
+            representative_data=representative, int8=True, sparse=pruned is not None,
+        ))
+    return artifacts
+
+
+def _gzip_size(path):
+    with open(path, 'rb') as f_in, tempfile.NamedTemporaryFile(suffix=".gz") as f_out:
+        with gzip.GzipFile(fileobj=f_out, mode='wb') as gz:
+            shutil.copyfileobj(f_in, gz)
+        f_out.flush()
+        return os.path.getsize(f_out.name)
+
+
+def _load_artifact(path):
+    """
+    Charge un artefact (.h5 ou .tflite) et retourne (fonction de prédiction, modèle Keras ou None).
+    """
+    if path.endswith(".tflite"):
+        interpreter = tf.lite.Interpreter(model_path=path, num_threads=os.cpu_count())
+        input_index = interpreter.get_input_details()[0]['index']
+        output_index = interpreter.get_output_details()[0]['index']
+        state = {"batch_size": None}
+
+        def predict(batch):
+            if state["batch_size"] != len(batch):
+                interpreter.resize_tensor_input(input_index, batch.shape)
+                interpreter.allocate_tensors()
+                state["batch_size"] = len(batch)
+            interpreter.set_tensor(input_index, batch.astype("float32"))
+            interpreter.invoke()
+            return interpreter.get_tensor(output_index)
+        return predict, None
+
+    model = tf.keras.models.load_model(path, compile=False)
+    return keras_predict_fn(model), model
+
+
+def _accuracy(predict_fn, test_generator):
+    correct = total = 0
+    for i in range(len(test_generator)):
+        images, labels = test_generator[i]
+        predictions = np.asarray(predict_fn(images.astype("float32"))).reshape(-1)
+        correct += int(np.sum((predictions >= 0.5) == (labels >= 0.5)))
+        total += len(labels)
+    return correct / total if total else None
+
+
+def compare_artifacts(paths, input_shape=(128, 128, 3), test_generator=None, report_path=None):
+    """
+    Tableau comparatif des artefacts : taille, temps de chargement, latence batch 1,
+    débit en batch et précision de test.
+    """
+    rows = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        start = time.perf_counter()
+        predict_fn, model = _load_artifact(path)
+        load_time = time.perf_counter() - start
+
+        latency = measure_latency(predict_fn, input_shape)
+        throughput = measure_throughput(predict_fn, input_shape, batch_sizes=(32,))
+        rows.append({
+            "artifact": os.path.basename(path),
+            "size_mb": os.path.getsize(path) / 1e6,
+            "gzip_size_mb": _gzip_size(path) / 1e6,
+            "sparsity": sparsity(model) if model is not None else None,
+            "test_accuracy": _accuracy(predict_fn, test_generator) if test_generator is not None else None,
+            "load_time_s": load_time,
+            "latency_p50_ms": latency["p50_ms"],
+            "latency_p95_ms": latency["p95_ms"],
+            "throughput_32": throughput["32"],
+        })
+
+    table = markdown_table(rows, COMPARISON_COLUMNS)
+    print("\n" + table)
+    if report_path:
+        with open(report_path, 'w') as f:
+            f.write("# Comparaison des artefacts d'inférence\n\n" + table + "\n")
+        with open(os.path.splitext(report_path)[0] + ".json", 'w') as f:
+            json.dump(rows, f, indent=2)
+        print(f"Comparaison sauvegardée dans {report_path}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Élagage / QAT d'un modèle déjà entraîné et comparaison des artefacts")
+    parser.add_argument("--config", type=str, default="ml/config.yaml", help="Chemin vers config.yaml")
+    parser.add_argument("--compare-only", action="store_true", help="Comparer les artefacts existants sans fine-tuning")
+    args = parser.parse_args()
+
+    from train import load_config
+    from preprocessing import create_generators
+
+    config = load_config(args.config)
+    model_config = config['model']
+    output_dir = os.path.dirname(model_config['output_path'])
+    train_generator, validation_generator, test_generator = create_generators(
+        config['data']['train_dir'], config['data']['val_dir'], config['data']['test_dir'],
+        model_config['img_height'], model_config['img_width'], config['training']['batch_size'],
+        config.get('augmentation')
+    )
+
+    if not args.compare_only:
+        base_model = tf.keras.models.load_model(model_config['output_path'])
+        pruned, qat = fine_tune_optimized(base_model, train_generator, validation_generator, config.get('optimization', {}))
+        export_optimized(pruned, qat, output_dir, calibration_generator=validation_generator)
+
+    compare_artifacts(
+        [model_config['output_path'],
+         os.path.splitext(model_config['output_path'])[0] + ".tflite",
+         os.path.join(output_dir, "model_pruned.h5"),
+         os.path.join(output_dir, "model_int8.tflite")],
+        input_shape=(model_config['img_height'], model_config['img_width'], 3),
+        test_generator=test_generator,
+        report_path=os.path.join(output_dir, "optimization_report.md"),
+    )
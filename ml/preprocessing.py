@@ -1,27 +1,44 @@
 import tensorflow as tf
+import numpy as np
 import os
+import json
 import argparse
 import shutil
+from PIL import Image
 from sklearn.model_selection import train_test_split
 from tqdm import tqdm
+from dedup import dedup_data
 
-def create_generators(train_dir, val_dir, test_dir, img_height=128, img_width=128, batch_size=32):
+# Paramètres d'augmentation par défaut (section `augmentation` de config.yaml)
+DEFAULT_AUGMENTATION = {
+    'rotation_range': 20,
+    'width_shift_range': 0.2,
+    'height_shift_range': 0.2,
+    'shear_range': 0.2,
+    'zoom_range': 0.2,
+    'horizontal_flip': True,
+    'vertical_flip': True,
+}
+
+def create_train_datagen(augmentation=None):
     """
-    Crée des ImageDataGenerators pour l'entraînement, la validation et les tests en utilisant des chemins explicites.
+    Crée l'ImageDataGenerator d'entraînement (normalisation + augmentation).
     """
-    # Augmentation des données pour l'entraînement
-    train_datagen = tf.keras.preprocessing.image.ImageDataGenerator(
+    params = dict(DEFAULT_AUGMENTATION)
+    params.update(augmentation or {})
+    return tf.keras.preprocessing.image.ImageDataGenerator(
         rescale=1./255,
-        rotation_range=20,
-        width_shift_range=0.2,
-        height_shift_range=0.2,
-        shear_range=0.2,
-        zoom_range=0.2,
-        horizontal_flip=True,
-        vertical_flip=True,
-        fill_mode='nearest'
+        fill_mode='nearest',
+        **params
     )
 
+def create_generators(train_dir, val_dir, test_dir, img_height=128, img_width=128, batch_size=32, augmentation=None):
+    """
+    Crée des ImageDataGenerators pour l'entraînement, la validation et les tests en utilisant des chemins explicites.
+    """
+    # Augmentation des données pour l'entraînement
+    train_datagen = create_train_datagen(augmentation)
+
     # Uniquement redimensionnement pour la validation et les tests
     val_test_datagen = tf.keras.preprocessing.image.ImageDataGenerator(rescale=1./255)
 
@@ -60,6 +77,182 @@ def create_generators(train_dir, val_dir, test_dir, img_height=128, img_width=12
 
     return train_generator, validation_generator, test_generator
 
+class CachedArraySequence(tf.keras.utils.Sequence):
+    """
+    Générateur équivalent à flow_from_directory, mais qui lit des images déjà décodées
+    depuis un cache numpy mappé en mémoire (voir build_array_cache).
+    L'augmentation est appliquée à la volée, image par image, comme ImageDataGenerator.
+    """
+
+    def __init__(self, images, labels, class_indices, datagen, batch_size=32, shuffle=True, seed=123):
+        super().__init__()
+        self.images = images
+        self.labels = labels
+        self.class_indices = class_indices
+        self.classes = labels.astype('int32')
+        self.datagen = datagen
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.n = len(images)
+        self._rng = np.random.default_rng(seed)
+        self.index_array = None
+        self.on_epoch_end()
+
+    def __len__(self):
+        return (self.n + self.batch_size - 1) // self.batch_size
+
+    def __getitem__(self, index):
+        batch_indices = self.index_array[index * self.batch_size:(index + 1) * self.batch_size]
+        # Lecture triée pour des accès séquentiels dans le fichier mappé
+        order = np.argsort(batch_indices)
+        batch = np.empty((len(batch_indices),) + self.images.shape[1:], dtype='float32')
+        batch[order] = self.images[np.sort(batch_indices)]
+        for i in range(len(batch)):
+            batch[i] = self.datagen.standardize(self.datagen.random_transform(batch[i]))
+        return batch, self.labels[batch_indices].astype('float32')
+
+    def on_epoch_end(self):
+        self.index_array = self._rng.permutation(self.n) if self.shuffle else np.arange(self.n)
+
+def build_array_cache(split_dir, cache_dir, img_height=128, img_width=128):
+    """
+    Décode une seule fois toutes les images d'un split (redimensionnées, uint8) dans
+    un fichier .npy, réutilisable par plusieurs entraînements (ex. sweep d'hyperparamètres).
+    Le cache est reconstruit si le nombre d'images ou la taille change.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    images_path = os.path.join(cache_dir, "images.npy")
+    labels_path = os.path.join(cache_dir, "labels.npy")
+    meta_path = os.path.join(cache_dir, "meta.json")
+
+    classes = sorted(d for d in os.listdir(split_dir) if os.path.isdir(os.path.join(split_dir, d)))
+    files = []
+    for label, cls in enumerate(classes):
+        cls_dir = os.path.join(split_dir, cls)
+        files.extend(
+            (os.path.join(cls_dir, f), label)
+            for f in sorted(os.listdir(cls_dir)) if f.lower().endswith(('.png', '.jpg', '.jpeg'))
+        )
+    meta = {
+        "split_dir": os.path.abspath(split_dir),
+        "count": len(files),
+        "size": [img_height, img_width],
+        "class_indices": {cls: i for i, cls in enumerate(classes)},
+    }
+
+    if os.path.exists(meta_path) and os.path.exists(images_path):
+        with open(meta_path, 'r') as f:
+            if json.load(f) == meta:
+                return images_path, labels_path, meta
+
+    print(f"Construction du cache {cache_dir} ({len(files)} images)...")
+    images = np.lib.format.open_memmap(
+        images_path, mode='w+', dtype='uint8', shape=(len(files), img_height, img_width, 3)
+    )
+    labels = np.empty(len(files), dtype='float32')
+    for i, (path, label) in enumerate(tqdm(files, desc=os.path.basename(cache_dir))):
+        with Image.open(path) as img:
+            images[i] = np.asarray(img.convert("RGB").resize((img_width, img_height), Image.NEAREST))
+        labels[i] = label
+    images.flush()
+    del images
+    np.save(labels_path, labels)
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    return images_path, labels_path, meta
+
+def create_cached_generators(train_dir, val_dir, test_dir, cache_dir, img_height=128, img_width=128,
+                             batch_size=32, augmentation=None):
+    """
+    Variante de create_generators s'appuyant sur un cache partagé d'images décodées.
+    """
+    train_datagen = create_train_datagen(augmentation)
+    val_test_datagen = tf.keras.preprocessing.image.ImageDataGenerator(rescale=1./255)
+
+    generators = []
+    for split, split_dir, datagen, shuffle in [
+        ('train', train_dir, train_datagen, True),
+        ('val', val_dir, val_test_datagen, False),
+        ('test', test_dir, val_test_datagen, False),
+    ]:
+        images_path, labels_path, meta = build_array_cache(
+            split_dir, os.path.join(cache_dir, split), img_height, img_width
+        )
+        generators.append(CachedArraySequence(
+            np.load(images_path, mmap_mode='r'),
+            np.load(labels_path),
+            meta['class_indices'],
+            datagen,
+            batch_size=batch_size,
+            shuffle=shuffle,
+        ))
+        print(f"Données {split} chargées depuis le cache : {meta['count']} images")
+
+    return tuple(generators)
+
+def _list_split_files(split_dir):
+    classes = sorted(d for d in os.listdir(split_dir) if os.path.isdir(os.path.join(split_dir, d)))
+    paths, labels = [], []
+    for label, cls in enumerate(classes):
+        cls_dir = os.path.join(split_dir, cls)
+        for f in sorted(os.listdir(cls_dir)):
+            if f.lower().endswith(('.png', '.jpg', '.jpeg')):
+                paths.append(os.path.join(cls_dir, f))
+                labels.append(float(label))
+    return paths, labels, {cls: i for i, cls in enumerate(classes)}
+
+def create_datasets(train_dir, val_dir, test_dir, img_height=128, img_width=128, global_batch_size=32,
+                    augmentation=None, num_workers=1, worker_index=0):
+    """
+    Pipeline tf.data pour l'entraînement distribué (MultiWorkerMirroredStrategy).
+    Chaque worker ne lit que sa part des fichiers (sharding avant décodage), et les
+    batchs ont la taille globale : la stratégie les redécoupe par réplique.
+    Retourne les datasets, le nombre de pas par époque et le mapping des classes.
+    """
+    params = dict(DEFAULT_AUGMENTATION)
+    params.update(augmentation or {})
+    # Équivalent tf.data de l'augmentation d'ImageDataGenerator (le cisaillement n'a pas d'équivalent Keras)
+    layers = []
+    if params['horizontal_flip'] and params['vertical_flip']:
+        layers.append(tf.keras.layers.RandomFlip("horizontal_and_vertical"))
+    elif params['horizontal_flip'] or params['vertical_flip']:
+        layers.append(tf.keras.layers.RandomFlip("horizontal" if params['horizontal_flip'] else "vertical"))
+    layers += [
+        tf.keras.layers.RandomRotation(params['rotation_range'] / 360.0, fill_mode='nearest'),
+        tf.keras.layers.RandomTranslation(params['height_shift_range'], params['width_shift_range'], fill_mode='nearest'),
+        tf.keras.layers.RandomZoom(params['zoom_range'], fill_mode='nearest'),
+    ]
+    augment = tf.keras.Sequential(layers)
+
+    def load(path, label):
+        image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        image = tf.image.resize(image, (img_height, img_width), method='nearest')
+        return tf.cast(image, tf.float32) / 255.0, label
+
+    options = tf.data.Options()
+    # Sharding manuel par fichier : on désactive l'auto-sharding de la stratégie
+    options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+
+    datasets, steps = [], []
+    class_indices = None
+    for split_dir, training in [(train_dir, True), (val_dir, False), (test_dir, False)]:
+        paths, labels, indices = _list_split_files(split_dir)
+        class_indices = class_indices or indices
+        print(f"Chargement de {len(paths)} images depuis {split_dir} (worker {worker_index + 1}/{num_workers})...")
+        ds = tf.data.Dataset.from_tensor_slices((paths, labels)).shard(num_workers, worker_index)
+        # Décodage une seule fois, puis mélange à chaque époque depuis le cache
+        ds = ds.map(load, num_parallel_calls=tf.data.AUTOTUNE).cache()
+        if training:
+            ds = ds.shuffle(len(paths), seed=123, reshuffle_each_iteration=True)
+        ds = ds.repeat().batch(global_batch_size)
+        if training:
+            ds = ds.map(lambda x, y: (augment(x, training=True), y), num_parallel_calls=tf.data.AUTOTUNE)
+        datasets.append(ds.prefetch(tf.data.AUTOTUNE).with_options(options))
+        # Nombre de pas identique sur tous les workers (sinon la synchronisation bloque en fin d'époque)
+        steps.append(max(1, len(paths) // global_batch_size))
+
+    return datasets, steps, class_indices
+
 def prepare_data(input_dir, output_dir, img_size=128, split_ratio=(0.7, 0.15, 0.15)):
     """
     Divise les images brutes en répertoires train, val et test.
@@ -132,11 +325,21 @@ if __name__ == "__main__":
     check_parser = subparsers.add_parser("check")
     check_parser.add_argument("--data_dir", type=str, default="ml/data", help="Répertoire racine des données (contenant train/val/test)")
     
+    # Commande de déduplication (Dedup)
+    dedup_parser = subparsers.add_parser("dedup")
+    dedup_parser.add_argument("--data_dir", type=str, default="ml/data", help="Répertoire racine des données (contenant train/val/test)")
+    dedup_parser.add_argument("--threshold", type=int, default=4, help="Distance de Hamming maximale entre deux pHash pour les considérer comme doublons")
+    dedup_parser.add_argument("--workers", type=int, default=None, help="Nombre de processus pour le calcul des hash (défaut : nombre de cœurs)")
+    dedup_parser.add_argument("--report", type=str, default=None, help="Chemin du rapport JSON")
+    dedup_parser.add_argument("--remove", action="store_true", help="Supprimer les doublons inter-splits de val/test (la copie de train est conservée)")
+    
     args = parser.parse_args()
     
     if args.command == "prepare":
         prepare_data(args.input, args.output, args.size)
     elif args.command == "check":
         check_data(args.data_dir)
+    elif args.command == "dedup":
+        dedup_data(args.data_dir, args.threshold, args.workers, args.report, args.remove)
     else:
         parser.print_help()
@@ -0,0 +1,298 @@
+import os
+import sys
+import csv
+import json
+import math
+import time
+import copy
+import random
+import argparse
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import yaml
+
+
+def set_by_path(config, dotted_key, value):
+    """
+    Affecte une valeur dans la configuration imbriquée, ex. "training.learning_rate".
+    """
+    keys = dotted_key.split(".")
+    node = config
+    for key in keys[:-1]:
+        node = node.setdefault(key, {})
+    node[keys[-1]] = value
+
+
+def expand_grid(space):
+    """
+    Produit cartésien de l'espace de recherche (chaque valeur doit être une liste).
+    """
+    keys = sorted(space)
+    values = [space[k] if isinstance(space[k], list) else [space[k]] for k in keys]
+    return [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+
+
+def sample_random(space, num_trials, seed=42):
+    """
+    Tire num_trials configurations au hasard. Une dimension est soit une liste de valeurs,
+    soit un intervalle {min, max, log} (log=true pour un tirage log-uniforme, ex. learning rate).
+    """
+    rng = random.Random(seed)
+    trials = []
+    for _ in range(num_trials):
+        params = {}
+        for key in sorted(space):
+            dim = space[key]
+            if isinstance(dim, list):
+                params[key] = rng.choice(dim)
+            elif isinstance(dim, dict):
+                low, high = dim['min'], dim['max']
+                if dim.get('log', False):
+                    params[key] = math.exp(rng.uniform(math.log(low), math.log(high)))
+                elif isinstance(low, int) and isinstance(high, int):
+                    params[key] = rng.randint(low, high)
+                else:
+                    params[key] = rng.uniform(low, high)
+            else:
+                params[key] = dim
+        trials.append(params)
+    return trials
+
+
+def _init_worker(threads_per_trial):
+    """
+    Limite les threads de chaque essai avant l'import de TensorFlow dans le processus enfant,
+    pour que les essais concurrents ne se disputent pas tous les cœurs.
+    """
+    threads = str(threads_per_trial)
+    os.environ["OMP_NUM_THREADS"] = threads
+    os.environ["TF_NUM_INTRAOP_THREADS"] = threads
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
+
+
+def build_trial_config(base_config, params, trial_dir, epochs, sweep_config):
+    config = copy.deepcopy(base_config)
+    for key, value in params.items():
+        set_by_path(config, key, value)
+    config['training']['epochs'] = epochs
+    config['model']['output_path'] = os.path.join(trial_dir, "model.h5")
+    config['model']['reference_copy'] = False
+    config['model']['export_tflite'] = False
+    config['checkpoint'] = {
+        'dir': os.path.join(trial_dir, "checkpoints"),
+        'save_every_steps': 0,
+        'keep_last': 1,
+    }
+    if sweep_config.get('cache_dir'):
+        config['data']['cache_dir'] = sweep_config['cache_dir']
+    return config
+
+
+def run_trial(trial):
+    """
+    Exécute un essai dans un processus enfant. Les sorties sont redirigées vers
+    le fichier train.log du répertoire de l'essai.
+    """
+    trial_dir = trial['trial_dir']
+    os.makedirs(trial_dir, exist_ok=True)
+    # Les processus du pool sont réutilisés d'un essai à l'autre : le fichier est fermé
+    # et les sorties standard rétablies à la fin de chaque essai
+    stdout, stderr = sys.stdout, sys.stderr
+    with open(os.path.join(trial_dir, "train.log"), 'a') as log_file:
+        sys.stdout = sys.stderr = log_file
+        start = time.perf_counter()
+        try:
+            import tensorflow as tf
+            from train import train
+            from callbacks import MedianStoppingCallback
+
+            tf.keras.backend.clear_session()
+            extra_callbacks = []
+            median_stopping = None
+            if trial.get('median_stopping'):
+                median_stopping = MedianStoppingCallback(
+                    trial['progress_dir'], trial['trial_id'], **trial['median_stopping']
+                )
+                extra_callbacks.append(median_stopping)
+
+            results = train(trial['config'], resume=trial['resume'], extra_callbacks=extra_callbacks)
+            history = results['history']
+            val_accuracy = history.get('val_accuracy', [])
+            return {
+                "trial_id": trial['trial_id'],
+                "params": trial['params'],
+                "status": "pruned" if median_stopping and median_stopping.pruned else "completed",
+                "best_val_accuracy": max(val_accuracy) if val_accuracy else None,
+                "test_accuracy": results['test_accuracy'],
+                "epochs": trial['config']['training']['epochs'],
+                "wall_time_s": time.perf_counter() - start,
+            }
+        except Exception as e:
+            print(f"Échec de l'essai {trial['trial_id']}: {e}")
+            return {
+                "trial_id": trial['trial_id'],
+                "params": trial['params'],
+                "status": f"failed: {e}",
+                "best_val_accuracy": None,
+                "test_accuracy": None,
+                "epochs": trial['config']['training']['epochs'],
+                "wall_time_s": time.perf_counter() - start,
+            }
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+
+def run_trials(trials, max_concurrent, threads_per_trial):
+    """
+    Lance les essais dans un pool de processus (spawn : TensorFlow n'est pas compatible avec fork).
+    """
+    results = []
+    context = mp.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_concurrent, mp_context=context,
+                             initializer=_init_worker, initargs=(threads_per_trial,)) as executor:
+        futures = {executor.submit(run_trial, trial): trial for trial in trials}
+        for future in as_completed(futures):
+            result = future.result()
+            score = result['best_val_accuracy']
+            print(f"  ✔ {result['trial_id']} [{result['status']}] val_accuracy={score} "
+                  f"({result['wall_time_s']:.0f}s)")
+            results.append(result)
+    return results
+
+
+def make_trial(trial_id, params, base_config, sweep_config, epochs, resume=False):
+    trial_dir = os.path.join(sweep_config['output_dir'], trial_id)
+    trial = {
+        "trial_id": trial_id,
+        "trial_dir": trial_dir,
+        "params": params,
+        "resume": resume,
+        "progress_dir": os.path.join(sweep_config['output_dir'], "progress"),
+        "config": build_trial_config(base_config, params, trial_dir, epochs, sweep_config),
+    }
+    if sweep_config.get('median_stopping'):
+        trial["median_stopping"] = sweep_config['median_stopping']
+    return trial
+
+
+def successive_halving(candidates, base_config, sweep_config):
+    """
+    Successive halving : tous les essais reçoivent un petit budget d'époques, seul le
+    meilleur 1/eta passe au palier suivant avec un budget multiplié par eta.
+    Les essais sélectionnés reprennent depuis leur checkpoint au lieu de repartir de zéro.
+    """
+    eta = sweep_config.get('reduction_factor', 3)
+    max_epochs = base_config['training']['epochs']
+    epochs = sweep_config.get('min_epochs', 1)
+    max_concurrent = sweep_config.get('max_concurrent', 2)
+    threads = sweep_config.get('threads_per_trial', 1)
+
+    survivors = [(f"trial_{i:03d}", params) for i, params in enumerate(candidates)]
+    leaderboard = {}
+    wall_times = {}
+    rung = 0
+    while survivors:
+        print(f"\n🪜 Palier {rung} : {len(survivors)} essais, {epochs} époques")
+        trials = [
+            make_trial(trial_id, params, base_config, sweep_config, epochs, resume=rung > 0)
+            for trial_id, params in survivors
+        ]
+        results = run_trials(trials, max_concurrent, threads)
+        for result in results:
+            wall_times[result['trial_id']] = wall_times.get(result['trial_id'], 0.0) + result['wall_time_s']
+            result['wall_time_s'] = wall_times[result['trial_id']]
+            result['rung'] = rung
+            leaderboard[result['trial_id']] = result
+
+        if epochs >= max_epochs:
+            break
+        ranked = sorted(
+            (r for r in results if r['best_val_accuracy'] is not None and r['status'] == "completed"),
+            key=lambda r: r['best_val_accuracy'], reverse=True
+        )
+        keep = max(1, len(ranked) // eta)
+        for result in ranked[keep:]:
+            leaderboard[result['trial_id']]['status'] = f"stopped (palier {rung})"
+        params_by_id = dict(survivors)
+        survivors = [(r['trial_id'], params_by_id[r['trial_id']]) for r in ranked[:keep]]
+        epochs = min(max_epochs, epochs * eta)
+        rung += 1
+
+    return list(leaderboard.values())
+
+
+def write_leaderboard(results, output_dir):
+    """
+    Écrit le classement (précision de validation vs temps d'entraînement) en JSON et CSV.
+    """
+    ranked = sorted(results, key=lambda r: (r['best_val_accuracy'] is not None, r['best_val_accuracy'] or 0), reverse=True)
+    with open(os.path.join(output_dir, "leaderboard.json"), 'w') as f:
+        json.dump(ranked, f, indent=2)
+
+    param_keys = sorted({k for r in ranked for k in r['params']})
+    with open(os.path.join(output_dir, "leaderboard.csv"), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["rank", "trial_id", "status", "best_val_accuracy", "test_accuracy",
+                         "epochs", "wall_time_s"] + param_keys)
+        for rank, r in enumerate(ranked, start=1):
+            writer.writerow([rank, r['trial_id'], r['status'], r['best_val_accuracy'], r['test_accuracy'],
+                             r['epochs'], round(r['wall_time_s'], 1)] + [r['params'].get(k) for k in param_keys])
+
+    print("\n🏆 Classement :")
+    for rank, r in enumerate(ranked[:10], start=1):
+        print(f"  {rank}. {r['trial_id']} val_accuracy={r['best_val_accuracy']} "
+              f"temps={r['wall_time_s']:.0f}s {r['params']}")
+    return ranked
+
+
+def sweep(config_path):
+    with open(config_path, 'r') as f:
+        base_config = yaml.safe_load(f)
+    sweep_config = base_config.get('sweep', {})
+    sweep_config.setdefault('output_dir', "ml/sweeps")
+    os.makedirs(sweep_config['output_dir'], exist_ok=True)
+
+    method = sweep_config.get('method', "grid")
+    space = sweep_config.get('space', {})
+    if method == "grid":
+        candidates = expand_grid(space)
+    else:
+        candidates = sample_random(space, sweep_config.get('num_trials', 8), sweep_config.get('seed', 42))
+    print(f"🔎 Sweep '{method}' : {len(candidates)} configurations")
+
+    # Décoder les images une seule fois pour tous les essais
+    if sweep_config.get('cache_dir'):
+        from preprocessing import build_array_cache
+        model_config = base_config['model']
+        for split in ['train', 'val', 'test']:
+            build_array_cache(base_config['data'][f'{split}_dir'], os.path.join(sweep_config['cache_dir'], split),
+                              model_config['img_height'], model_config['img_width'])
+
+    if method == "successive_halving":
+        results = successive_halving(candidates, base_config, sweep_config)
+    else:
+        trials = [
+            make_trial(f"trial_{i:03d}", params, base_config, sweep_config, base_config['training']['epochs'])
+            for i, params in enumerate(candidates)
+        ]
+        results = run_trials(trials, sweep_config.get('max_concurrent', 2), sweep_config.get('threads_per_trial', 1))
+
+    return write_leaderboard(results, sweep_config['output_dir'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep d'hyperparamètres parallèle au-dessus de train.py")
+    parser.add_argument("--config", type=str, default="ml/config.yaml", help="Chemin vers config.yaml (section `sweep`)")
+    args = parser.parse_args()
+
+    config_file = args.config
+    if not os.path.exists(config_file):
+        if os.path.exists("config.yaml"):
+            config_file = "config.yaml"
+        elif os.path.exists("ml/config.yaml"):
+            config_file = "ml/config.yaml"
+
+    sweep(config_file)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Les scripts ml/ s'importent comme modules de premier niveau (python dedup.py ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,61 @@
+import random
+
+import numpy as np
+from PIL import Image
+
+from dedup import BKTree, hamming_distance, phash
+
+
+def brute_force(values, value, radius):
+    return sorted((hamming_distance(value, other), item) for item, other in values.items()
+                  if hamming_distance(value, other) <= radius)
+
+
+def test_hamming_distance():
+    assert hamming_distance(0b1011, 0b1011) == 0
+    assert hamming_distance(0b1011, 0b0010) == 2
+    assert hamming_distance(0, 2 ** 64 - 1) == 64
+
+
+def test_empty_tree():
+    assert BKTree().search(123, 10) == []
+
+
+def test_identical_hashes_share_a_node():
+    tree = BKTree()
+    tree.add(42, "a.png")
+    tree.add(42, "b.png")
+    assert sorted(tree.search(42, 0)) == [(0, "a.png"), (0, "b.png")]
+    assert tree.root[2] == {}
+
+
+def test_search_matches_brute_force():
+    rng = random.Random(0)
+    base = [rng.getrandbits(64) for _ in range(20)]
+    values = {}
+    for i in range(500):
+        # Quasi-doublons : quelques bits inversés autour de hash de base
+        value = base[i % len(base)]
+        for bit in rng.sample(range(64), rng.randint(0, 8)):
+            value ^= 1 << bit
+        values[f"img_{i}.png"] = value
+
+    tree = BKTree()
+    for item, value in values.items():
+        tree.add(value, item)
+
+    for radius in (0, 2, 4, 8):
+        for query in base[:5] + [rng.getrandbits(64)]:
+            assert sorted(tree.search(query, radius)) == brute_force(values, query, radius)
+
+
+def test_phash_stable_under_resize(tmp_path):
+    blocks = np.random.default_rng(0).integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    image = Image.fromarray(blocks).resize((256, 256), Image.BILINEAR)
+    image.save(tmp_path / "original.png")
+    image.resize((128, 128)).save(tmp_path / "small.jpg", quality=85)
+    Image.fromarray(np.rot90(np.asarray(image)).copy()).save(tmp_path / "rotated.png")
+
+    original = phash(tmp_path / "original.png")
+    assert hamming_distance(original, phash(tmp_path / "small.jpg")) <= 4
+    assert hamming_distance(original, phash(tmp_path / "rotated.png")) > 4
@@ -2,68 +2,218 @@ import os
 import argparse
 import yaml
 import json
-from model_factory import create_model
-from preprocessing import create_generators
+import shutil
+import contextlib
+from model_factory import create_model, create_distiller
+from preprocessing import create_generators, create_cached_generators, create_datasets
+from callbacks import OffsetSequence, ResumableCheckpoint, ThroughputMonitor, TimedSequence
+from distributed import get_strategy, worker_path
+from optimize import fine_tune_optimized, export_optimized, compare_artifacts, export_tflite
 from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
 
-def train(config_path):
-    # Charger la configuration
+def load_config(config_path):
     with open(config_path, 'r') as f:
-        config = yaml.safe_load(f)
+        return yaml.safe_load(f)
+
+def train(config, resume=False, extra_callbacks=None, distributed=False):
+    """
+    Entraîne, évalue et sauvegarde le modèle.
+    `config` est un chemin vers config.yaml ou la configuration déjà chargée (dict).
+    Avec `distributed` (ou `distribute.enabled` dans la configuration), l'entraînement
+    est réparti sur plusieurs workers CPU via MultiWorkerMirroredStrategy.
+    Retourne l'historique d'entraînement et les métriques de test.
+    """
+    # Charger la configuration
+    if isinstance(config, str):
+        config = load_config(config)
+
+    # La stratégie distribuée doit être créée avant toute autre opération TensorFlow
+    distributed = distributed or config.get('distribute', {}).get('enabled', False)
+    if distributed:
+        strategy, num_workers, worker_index, is_chief = get_strategy(config)
+    else:
+        strategy, num_workers, worker_index, is_chief = None, 1, 0, True
 
     # Paramètres de la configuration
     IMG_HEIGHT = config['model']['img_height']
     IMG_WIDTH = config['model']['img_width']
     BATCH_SIZE = config['training']['batch_size']
     EPOCHS = config['training']['epochs']
+    LEARNING_RATE = config['training'].get('learning_rate', 0.001)
+    AUGMENTATION = config.get('augmentation')
     
     # Utiliser des chemins explicites de la configuration
     TRAIN_DIR = config['data']['train_dir']
     VAL_DIR = config['data']['val_dir']
     TEST_DIR = config['data']['test_dir']
+    CACHE_DIR = config['data'].get('cache_dir')
     
     OUTPUT_PATH = config['model']['output_path']
+    BASE_MODEL = config['model'].get('base_model', 'DenseNet121')
+    DISTILLATION = config.get('distillation', {})
     PATIENCE = config['training']['early_stopping_patience']
 
-    # 1. Créer les générateurs
-    train_generator, validation_generator, test_generator = create_generators(
-        TRAIN_DIR, VAL_DIR, TEST_DIR, IMG_HEIGHT, IMG_WIDTH, BATCH_SIZE
-    )
+    # 1. Créer les générateurs (depuis le cache d'images décodées s'il est configuré)
+    steps_per_epoch = validation_steps = test_steps = None
+    if distributed:
+        # batch_size est la taille par worker : le batch global croît avec le nombre de workers
+        global_batch_size = BATCH_SIZE * num_workers
+        if config.get('distribute', {}).get('scale_learning_rate', True):
+            LEARNING_RATE *= num_workers
+        (train_generator, validation_generator, test_generator), \
+            (steps_per_epoch, validation_steps, test_steps), class_indices = create_datasets(
+                TRAIN_DIR, VAL_DIR, TEST_DIR, IMG_HEIGHT, IMG_WIDTH, global_batch_size,
+                AUGMENTATION, num_workers, worker_index
+            )
+    elif CACHE_DIR:
+        train_generator, validation_generator, test_generator = create_cached_generators(
+            TRAIN_DIR, VAL_DIR, TEST_DIR, CACHE_DIR, IMG_HEIGHT, IMG_WIDTH, BATCH_SIZE, AUGMENTATION
+        )
+    else:
+        train_generator, validation_generator, test_generator = create_generators(
+            TRAIN_DIR, VAL_DIR, TEST_DIR, IMG_HEIGHT, IMG_WIDTH, BATCH_SIZE, AUGMENTATION
+        )
 
-    # 2. Créer le modèle
-    model = create_model(input_shape=(IMG_HEIGHT, IMG_WIDTH, 3))
+    if not distributed:
+        class_indices = train_generator.class_indices
+
+    # 2. Créer le modèle (ses variables doivent être créées dans le scope de la stratégie)
+    with strategy.scope() if strategy else contextlib.nullcontext():
+        if DISTILLATION.get('enabled'):
+            # L'enseignant (modèle entraîné) guide un élève plus léger
+            model = create_distiller(
+                DISTILLATION['teacher_path'],
+                input_shape=(IMG_HEIGHT, IMG_WIDTH, 3),
+                learning_rate=LEARNING_RATE,
+                base_model=DISTILLATION.get('student', BASE_MODEL),
+                alpha=DISTILLATION.get('alpha', 0.5),
+                temperature=DISTILLATION.get('temperature', 4.0),
+            )
+        else:
+            model = create_model(input_shape=(IMG_HEIGHT, IMG_WIDTH, 3), learning_rate=LEARNING_RATE,
+                                 base_model=BASE_MODEL)
     
     # 3. Callbacks (Rappels)
     early_stopping = EarlyStopping(monitor='val_loss', patience=PATIENCE, restore_best_weights=True)
     lr_scheduler = ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=2, verbose=1, min_lr=1e-6)
 
-    # 4. Entraînement
-    print(f"Début de l'entraînement pour {EPOCHS} époques...")
-    history = model.fit(
-        train_generator,
-        epochs=EPOCHS,
-        validation_data=validation_generator,
-        verbose=1,
-        callbacks=[early_stopping, lr_scheduler]
+    # Checkpoints périodiques (poids, optimiseur, époque, callbacks, position du générateur)
+    checkpoint_config = config.get('checkpoint', {})
+    checkpoint_dir = checkpoint_config.get('dir', 'ml/checkpoints')
+    checkpoint = ResumableCheckpoint(
+        checkpoint_dir,
+        write_dir=worker_path(checkpoint_dir, worker_index, is_chief),
+        train_generator=train_generator,
+        save_every_steps=checkpoint_config.get('save_every_steps', 0),
+        keep_last=checkpoint_config.get('keep_last', 3),
+        tracked_callbacks=[early_stopping, lr_scheduler],
     )
+    checkpoint.set_model(model)
+
+    # Instrumentation du débit (temps par pas, attente des données, images/s, RSS) et profileur optionnel
+    profiling_config = config.get('profiling', {})
+    if not distributed:
+        train_generator = TimedSequence(train_generator)
+    throughput = ThroughputMonitor(
+        global_batch_size if distributed else BATCH_SIZE,
+        sequence=None if distributed else train_generator,
+        profile_dir=profiling_config.get('log_dir', 'ml/logs/profile') if profiling_config.get('enabled') else None,
+        profile_start=profiling_config.get('start_step', 10),
+        profile_stop=profiling_config.get('stop_step', 20),
+    )
+
+    # Le checkpoint doit rester le dernier callback (il restaure l'état des précédents)
+    callbacks = [early_stopping, lr_scheduler, throughput] + list(extra_callbacks or []) + [checkpoint]
+
+    initial_epoch = 0
+    histories = []
+    if resume:
+        state = checkpoint.restore()
+        if state is not None:
+            initial_epoch = state['epoch']
+            # Reprise en milieu d'époque : terminer d'abord l'époque interrompue
+            if state['step'] > 0:
+                if distributed:
+                    # Dataset infini : on ne rejoue que le nombre de pas restant dans l'époque
+                    remaining, remaining_steps = train_generator, steps_per_epoch - state['step']
+                else:
+                    remaining, remaining_steps = OffsetSequence(train_generator, state['step']), None
+                partial = model.fit(
+                    remaining,
+                    steps_per_epoch=remaining_steps,
+                    validation_steps=validation_steps,
+                    epochs=initial_epoch + 1,
+                    initial_epoch=initial_epoch,
+                    validation_data=validation_generator,
+                    verbose=1,
+                    shuffle=False,
+                    callbacks=callbacks
+                )
+                histories.append(partial.history)
+                initial_epoch += 1
+        else:
+            print("Aucun checkpoint trouvé, entraînement depuis le début.")
+
+    # 4. Entraînement
+    # shuffle=False : le générateur mélange lui-même ses données, l'ordre des batchs reste reproductible à la reprise
+    if initial_epoch < EPOCHS and not model.stop_training:
+        print(f"Début de l'entraînement pour {EPOCHS} époques (à partir de l'époque {initial_epoch + 1})...")
+        history = model.fit(
+            train_generator,
+            steps_per_epoch=steps_per_epoch,
+            validation_steps=validation_steps,
+            epochs=EPOCHS,
+            initial_epoch=initial_epoch,
+            validation_data=validation_generator,
+            verbose=1,
+            shuffle=False,
+            callbacks=callbacks
+        )
+        histories.append(history.history)
+
+    # Fusionner les historiques (une reprise en milieu d'époque produit deux appels à fit)
+    merged_history = {}
+    for h in histories:
+        for key, values in h.items():
+            merged_history.setdefault(key, []).extend(float(v) for v in values)
+
+    merged_history["steps"] = throughput.steps
 
     # 5. Évaluer
     print("Évaluation sur l'ensemble de test...")
-    loss, accuracy = model.evaluate(test_generator)
+    scores = model.evaluate(test_generator, steps=test_steps, return_dict=True)
+    loss, accuracy = scores['loss'], scores['accuracy']
     print(f"Perte de test (Loss): {loss:.4f}")
     print(f"Précision de test (Accuracy): {accuracy:.4f}")
+    results = {
+        "history": merged_history,
+        "test_loss": float(loss),
+        "test_accuracy": float(accuracy),
+    }
 
-    # 6. Sauvegarder le modèle
-    os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
-    model.save(OUTPUT_PATH)
+    # 6. Sauvegarder le modèle (en distillation, seul l'élève est exporté)
+    if DISTILLATION.get('enabled'):
+        model = model.student
+    # En multi-workers, tous les workers participent à la sauvegarde, seul le chef écrit au chemin final
+    save_path = worker_path(OUTPUT_PATH, worker_index, is_chief)
+    os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+    model.save(save_path)
+    if not is_chief:
+        shutil.rmtree(os.path.dirname(save_path), ignore_errors=True)
+        return results
     print(f"Modèle sauvegardé dans {OUTPUT_PATH}")
     
+    # Artefact à chargement rapide : flatbuffer TFLite (float32) mappé en mémoire par le service d'inférence,
+    # partagé entre workers via le cache de pages au lieu d'être désérialisé dans le tas de chaque processus
+    if config['model'].get('export_tflite', True):
+        export_tflite(model, os.path.splitext(OUTPUT_PATH)[0] + ".tflite", int8=False)
+
     # Sauvegarder également une copie dans ml/ pour référence
-    model.save("model.h5")
-    print("Modèle de référence sauvegardé dans ml/model.h5")
+    if config['model'].get('reference_copy', True):
+        model.save("model.h5")
+        print("Modèle de référence sauvegardé dans ml/model.h5")
 
     # 7. Sauvegarder le mapping des classes pour l'inférence
-    class_indices = train_generator.class_indices
     # Inverser le dictionnaire pour avoir {index: nom_classe}
     labels = {v: k for k, v in class_indices.items()}
     labels_path = os.path.join(os.path.dirname(OUTPUT_PATH), "classes.json")
@@ -71,9 +221,35 @@ def train(config_path):
         json.dump(labels, f)
     print(f"Mapping des classes sauvegardé dans {labels_path} : {labels}")
 
+    # 8. Sauvegarder l'historique (métriques et mesures de débit par époque, détail par pas)
+    history_path = os.path.join(os.path.dirname(OUTPUT_PATH), "training_history.json")
+    with open(history_path, 'w') as f:
+        json.dump(merged_history, f, indent=2)
+    print(f"Historique d'entraînement sauvegardé dans {history_path}")
+
+    # 9. Phase optionnelle d'élagage et/ou de QAT, puis comparaison avec model.h5
+    optimization_config = config.get('optimization', {})
+    if optimization_config.get('enabled'):
+        if distributed:
+            print("⚠️  La phase d'optimisation (élagage/QAT) n'est pas disponible en mode multi-workers.")
+        else:
+            output_dir = os.path.dirname(OUTPUT_PATH)
+            pruned, qat = fine_tune_optimized(model, train_generator, validation_generator, optimization_config)
+            artifacts = export_optimized(pruned, qat, output_dir, calibration_generator=validation_generator)
+            results["optimization"] = compare_artifacts(
+                [OUTPUT_PATH] + artifacts,
+                input_shape=(IMG_HEIGHT, IMG_WIDTH, 3),
+                test_generator=test_generator,
+                report_path=os.path.join(output_dir, "optimization_report.md"),
+            )
+
+    return results
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", type=str, default="ml/config.yaml", help="Chemin vers config.yaml")
+    parser.add_argument("--resume", action="store_true", help="Reprendre depuis le dernier checkpoint")
+    parser.add_argument("--distributed", action="store_true", help="Entraînement multi-workers (TF_CONFIG)")
     args = parser.parse_args()
 
     # Déterminer le chemin correct pour la configuration
@@ -84,4 +260,4 @@ if __name__ == "__main__":
         elif os.path.exists("ml/config.yaml"):
             config_file = "ml/config.yaml"
 
-    train(config_file)
+    train(config_file, resume=args.resume, distributed=args.distributed)